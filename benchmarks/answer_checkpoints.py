@@ -0,0 +1,103 @@
+# benchmarks/answer_checkpoints.py
+#
+# Write amplification of crash-safe answers: N students answer Q questions
+# each with random think time. Compares one update per answer with the
+# coalesced checkpoints of utils.result_writer ($push of several answers
+# per attempt, many attempts per bulk_write).
+#
+# Time is compressed: think time and checkpoint interval are scaled by the
+# same factor, so the ratios match a real session (default: ~4 s per
+# answer, 10 s checkpoints, 5 answers per checkpoint).
+#
+# Run from the project root:
+#   python benchmarks/answer_checkpoints.py [students] [questions]
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+# Settings need these to import; no bot or database is contacted
+for name, value in {
+    'TOKEN': 'benchmark', 'BOT_USERNAME': 'benchmark', 'ADMIN_USERNAME': 'benchmark',
+    'ADMIN_USER_ID': '1', 'MONGO_URI': 'mongodb://localhost', 'MONGO_DB_NAME': 'benchmark',
+}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import result_writer  # noqa: E402
+
+TIME_SCALE = 0.02 # 1 simulated second = 20 ms
+THINK_SECONDS = 4.0
+
+
+class CountingCollection:
+    def __init__(self):
+        self.requests = 0
+        self.operations = 0
+
+    async def update_one(self, filter, update):
+        self.requests += 1
+        self.operations += 1
+
+    async def bulk_write(self, operations, ordered=True):
+        self.requests += 1
+        self.operations += len(operations)
+
+
+async def students(record, students: int, questions: int):
+    async def student(user_id):
+        for position in range(questions):
+            await asyncio.sleep(random.uniform(0.5, 1.5) * THINK_SECONDS * TIME_SCALE)
+            await record(user_id, position)
+
+    await asyncio.gather(*(student(user_id) for user_id in range(students)))
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    questions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    answers = count * questions
+    random.seed(1)
+    print(f'{count} students x {questions} answers = {answers} answers')
+    print(f"{'path':<22}{'ops/answer':>12}{'requests/answer':>17}")
+
+    # Before: every answer is its own update
+    collection = CountingCollection()
+
+    async def update_per_answer(user_id, position):
+        await collection.update_one({'_id': user_id}, {'$push': {'selected_answers': position}})
+
+    await students(update_per_answer, count, questions)
+    print(f"{'update per answer':<22}{collection.operations / answers:>12.2f}{collection.requests / answers:>17.3f}")
+
+    # After: staged answers, checkpointed by the writer
+    collection = CountingCollection()
+
+    async def simulated_get_collection(name):
+        return collection
+
+    result_writer.get_collection = simulated_get_collection
+    result_writer.RESULT_WRITER_CHECKPOINT_SECONDS *= TIME_SCALE
+    attempt_ids = {user_id: result_writer.open_attempt({'user_id': user_id}) for user_id in range(count)}
+    await result_writer.flush_results()
+    opened = (collection.operations, collection.requests)
+    result_writer.start_result_writer()
+
+    async def checkpointed(user_id, position):
+        result_writer.record_answer(attempt_ids[user_id], position, {'selected_option_index': 0})
+
+    start = time.perf_counter()
+    await students(checkpointed, count, questions)
+    await result_writer.stop_result_writer()
+    operations = collection.operations - opened[0]
+    requests = collection.requests - opened[1]
+    print(f"{'coalesced checkpoints':<22}{operations / answers:>12.2f}{requests / answers:>17.3f}")
+    stats = result_writer.get_result_writer_stats()
+    print(f"writer stats: writes_per_answer={stats['writes_per_answer']:.2f}, "
+          f"simulated session {(time.perf_counter() - start) / TIME_SCALE:.0f}s")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+# benchmarks/deadline_scheduler.py
+#
+# Cost of keeping N attempt deadlines pending: one sleeping task per
+# deadline (asyncio timer handle each) vs. utils.deadlines (one task, one
+# heap). Reports schedule and cancel time per deadline and the memory held
+# while they are pending, for growing N; per-deadline cost should stay flat.
+#
+# Run from the project root:  python benchmarks/deadline_scheduler.py [max_pending]
+
+import asyncio
+import datetime
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+# Settings need these to import; no bot or database is contacted
+for name, value in {
+    'TOKEN': 'benchmark', 'BOT_USERNAME': 'benchmark', 'ADMIN_USERNAME': 'benchmark',
+    'ADMIN_USER_ID': '1', 'MONGO_URI': 'mongodb://localhost', 'MONGO_DB_NAME': 'benchmark',
+}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import deadlines  # noqa: E402
+
+
+async def task_per_deadline(count: int):
+    async def wait(delay):
+        await asyncio.sleep(delay)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(wait(3600 + i)) for i in range(count)]
+    await asyncio.sleep(0) # Let every task reach its sleep
+    scheduled = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    cancelled = time.perf_counter() - start
+    return scheduled, cancelled, memory
+
+
+async def heap_scheduler(count: int):
+    deadlines.start_deadlines(SimpleNamespace(update_queue=asyncio.Queue()))
+    now = datetime.datetime.now(datetime.timezone.utc)
+    due = [now + datetime.timedelta(seconds=3600 + i) for i in range(count)]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for user_id in range(count):
+        deadlines.schedule_deadline(user_id, user_id, (user_id, 1), due[user_id])
+    await asyncio.sleep(0)
+    scheduled = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for user_id in range(count):
+        deadlines.cancel_deadline(user_id)
+    cancelled = time.perf_counter() - start
+    await deadlines.stop_deadlines()
+    deadlines._heap.clear() # Stale entries would be skipped lazily; reset between sizes
+    return scheduled, cancelled, memory
+
+
+async def main():
+    max_pending = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    sizes = [n for n in (1000, 10000, 100000) if n <= max_pending] or [max_pending]
+    print(f"{'path':<18}{'pending':>9}{'schedule us':>13}{'cancel us':>11}{'bytes each':>12}")
+    for count in sizes:
+        for name, run in (('task per deadline', task_per_deadline), ('heap scheduler', heap_scheduler)):
+            scheduled, cancelled, memory = await run(count)
+            print(f"{name:<18}{count:>9}{scheduled / count * 1e6:>13.2f}"
+                  f"{cancelled / count * 1e6:>11.2f}{memory / count:>12.0f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,249 @@
+# benchmarks/fake_bot_api.py
+#
+# Local stand-in for the Telegram Bot API, for load tests without network.
+# Point the bot at it with TELEGRAM_API_BASE_URL=http://127.0.0.1:<port>.
+#
+# * Every request is answered at once and counted per method.
+# * Messages sent or edited by the bot are put on a per-chat outbox, so a
+#   test driver can wait for the bot's reply to a chat.
+# * Updates pushed by the driver are served to getUpdates (long polling),
+#   or, once the bot has called setWebhook, POSTed to the webhook URL with
+#   the secret token header.
+#
+# Standalone (prints call counts every 10 s):
+#   python benchmarks/fake_bot_api.py [port]
+
+import asyncio
+import collections
+import itertools
+import json
+import sys
+import time
+from email.parser import BytesParser
+from typing import Optional
+from urllib.parse import parse_qsl
+
+import httpx
+
+BOT_USER = {'id': 100000001, 'is_bot': True, 'first_name': 'Load Test Bot', 'username': 'load_test_bot'}
+
+# Bot API methods that return the sent or edited Message
+_MESSAGE_METHODS = {
+    'sendMessage', 'sendDocument', 'sendPhoto', 'sendVideo', 'sendAudio',
+    'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption',
+}
+
+
+def _decode_params(headers: dict, body: bytes) -> dict:
+    """Form, multipart or JSON request body -> {name: value}, JSON values decoded."""
+    content_type = headers.get('content-type', '')
+    if content_type.startswith('application/json'):
+        return json.loads(body or b'{}')
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser().parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+        raw = {}
+        for part in message.get_payload():
+            name = part.get_param('name', header='content-disposition')
+            if part.get_filename():
+                raw[name] = {'file_name': part.get_filename(), 'size': len(part.get_payload(decode=True))}
+            else:
+                raw[name] = part.get_payload(decode=True).decode()
+    else:
+        raw = dict(parse_qsl(body.decode(), keep_blank_values=True))
+
+    params = {}
+    for name, value in raw.items():
+        if isinstance(value, str) and value[:1] in ('{', '['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        params[name] = value
+    return params
+
+
+class FakeBotApi:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.calls = collections.Counter()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._updates: list = []
+        self._new_updates = asyncio.Event()
+        self._outboxes: dict = {}
+        self._webhook: Optional[dict] = None
+        self._deliveries: Optional[asyncio.Queue] = None
+        self._delivery_tasks: list = []
+        self._connections: set = set()
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        for task in self._delivery_tasks:
+            task.cancel()
+        await asyncio.gather(*self._delivery_tasks, return_exceptions=True)
+        # Release pending long polls, then wait for their connections to end
+        self._new_updates.set()
+        if self._connections:
+            await asyncio.wait(set(self._connections), timeout=5)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # --- Driver side ---
+
+    def outbox(self, chat_id: int) -> asyncio.Queue:
+        """Messages the bot sent to or edited in `chat_id`, as (method, message)."""
+        queue = self._outboxes.get(chat_id)
+        if queue is None:
+            queue = self._outboxes[chat_id] = asyncio.Queue()
+        return queue
+
+    def push_update(self, update: dict) -> None:
+        """Queues an update (update_id is assigned here) for the bot."""
+        update['update_id'] = next(self._update_ids)
+        if self._webhook is not None:
+            self._deliveries.put_nowait(update)
+        else:
+            self._updates.append(update)
+            self._new_updates.set()
+
+    # --- Bot API side ---
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        if offset:
+            self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates and timeout > 0:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def _message(self, method: str, params: dict) -> dict:
+        chat_id = int(params['chat_id'])
+        message = {
+            'message_id': int(params['message_id']) if 'message_id' in params else next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+            'from': BOT_USER,
+        }
+        if 'text' in params:
+            message['text'] = params['text']
+        if 'reply_markup' in params:
+            message['reply_markup'] = params['reply_markup']
+        if method == 'sendDocument':
+            message['document'] = {'file_id': f'doc{message["message_id"]}', 'file_unique_id': f'u{message["message_id"]}'}
+        self.outbox(chat_id).put_nowait((method, message))
+        return message
+
+    async def _call(self, method: str, params: dict):
+        self.calls[method] += 1
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getUpdates':
+            return await self._get_updates(params)
+        if method in _MESSAGE_METHODS and 'chat_id' in params:
+            return self._message(method, params)
+        if method == 'setWebhook':
+            self._start_deliveries(params)
+            return True
+        if method == 'deleteWebhook':
+            self._webhook = None
+            return True
+        if method == 'getWebhookInfo':
+            return {
+                'url': (self._webhook or {}).get('url', ''),
+                'has_custom_certificate': False,
+                'pending_update_count': len(self._updates),
+            }
+        return True # answerCallbackQuery, setMyCommands, ...
+
+    # --- Webhook delivery ---
+
+    def _start_deliveries(self, params: dict) -> None:
+        self._webhook = {'url': params['url'], 'secret': params.get('secret_token', '')}
+        if self._deliveries is None:
+            self._deliveries = asyncio.Queue()
+            connections = int(params.get('max_connections') or 40)
+            self._delivery_tasks = [asyncio.create_task(self._deliver()) for _ in range(connections)]
+
+    async def _deliver(self) -> None:
+        async with httpx.AsyncClient(timeout=30) as client:
+            while True:
+                update = await self._deliveries.get()
+                try:
+                    response = await client.post(
+                        self._webhook['url'], json=update,
+                        headers={'X-Telegram-Bot-Api-Secret-Token': self._webhook['secret']},
+                    )
+                    if response.status_code != 200:
+                        print(f'webhook delivery rejected: {response.status_code}', file=sys.stderr)
+                except Exception as e:
+                    print(f'webhook delivery failed: {e}', file=sys.stderr)
+
+    # --- HTTP ---
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', '0'))
+                body = await reader.readexactly(length) if length else b''
+
+                # /bot<token>/<method>
+                method = path.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+                try:
+                    status = '200 OK'
+                    payload = {'ok': True, 'result': await self._call(method, _decode_params(headers, body))}
+                except Exception as e:
+                    status = '400 Bad Request'
+                    payload = {'ok': False, 'error_code': 400, 'description': f'Bad Request: {e}'}
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                    f'Content-Length: {len(data)}\r\n\r\n'.encode() + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+
+async def _serve(port: int) -> None:
+    api = FakeBotApi(port=port)
+    await api.start()
+    print(f'Fake Bot API on {api.base_url} (TELEGRAM_API_BASE_URL={api.base_url})')
+    while True:
+        await asyncio.sleep(10)
+        print(dict(api.calls))
+
+
+if __name__ == '__main__':
+    asyncio.run(_serve(int(sys.argv[1]) if len(sys.argv) > 1 else 8081))
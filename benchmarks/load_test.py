@@ -0,0 +1,232 @@
+# benchmarks/load_test.py
+#
+# End-to-end load test: N virtual students take a test through the real bot
+# (main.build_application, i.e. every handler in main.HANDLERS, persistence,
+# update processor, rate limiter, writers) against a local MongoDB and the
+# local Bot API stand-in of benchmarks/fake_bot_api.py. No network needed.
+#
+# Each student sends /test, answers every question by pressing a random
+# option button, and waits for the bot's reply after every step. Reported:
+# latency percentiles per step (/test -> first question, answer -> next
+# question, last answer -> result) and overall throughput.
+#
+# The bot runs with the settings of the environment, except:
+#   MONGO_DB_NAME          LOADTEST_DB_NAME (default 'bot_loadtest'); it is
+#                          emptied before the run, never point it at real data
+#   TELEGRAM_API_BASE_URL  the local stand-in
+#   BOT_MODE               --mode
+#   SEND_*                 lifted, unless --telegram-limits (then the
+#                          configured flood limits apply, as in production)
+#   POLL_INTERVAL_SECONDS  0 unless set in the environment
+#
+# Run from the project root, with MongoDB on MONGO_URI (default localhost):
+#   python benchmarks/load_test.py [--students 200] [--questions 10]
+#       [--think-ms 500] [--ramp-s 5] [--mode polling|webhook] [--telegram-limits]
+
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_ID = 'loadtest'
+FIRST_USER_ID = 500000000
+
+
+def _configure(args, base_url: str) -> None:
+    """Environment for settings.py; must run before the bot modules are imported."""
+    defaults = {
+        'TOKEN': '100000001:load-test', 'BOT_USERNAME': 'load_test_bot',
+        'ADMIN_USERNAME': 'load_test_admin', 'ADMIN_USER_ID': '1',
+        'MONGO_URI': 'mongodb://localhost:27017',
+        'POLL_INTERVAL_SECONDS': '0',
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+    os.environ['MONGO_DB_NAME'] = os.environ.get('LOADTEST_DB_NAME', 'bot_loadtest')
+    os.environ['TELEGRAM_API_BASE_URL'] = base_url
+    os.environ['BOT_MODE'] = args.mode
+    os.environ['INITIAL_SEED_ENABLED'] = 'False'
+    if args.mode == 'webhook':
+        os.environ['WEBHOOK_LISTEN'] = '127.0.0.1'
+        os.environ.setdefault('WEBHOOK_PORT', '8443')
+        os.environ['WEBHOOK_URL'] = f"http://127.0.0.1:{os.environ['WEBHOOK_PORT']}"
+        os.environ['WEBHOOK_SECRET_TOKEN'] = 'load-test-secret'
+    if not args.telegram_limits:
+        os.environ.update({
+            'SEND_GLOBAL_RATE': '1000000', 'SEND_PER_CHAT_RATE': '1000000',
+            'SEND_PER_CHAT_BURST': '1000000', 'SEND_GROUP_RATE_PER_MINUTE': '1000000',
+        })
+
+
+async def _prepare_database(questions: int) -> None:
+    """Empties the load test database and creates an active test."""
+    import db
+    from utils import activation_index
+    from utils.question_store import store_test_bank
+
+    database = db.get_db()
+    for name in await database.list_collection_names():
+        await database[name].delete_many({})
+
+    await store_test_bank(TEST_ID, [
+        {
+            'question_text': f'Вопрос {i + 1}: сколько будет {i} + {i}?',
+            'options': [str(2 * i), str(2 * i + 1), str(2 * i + 2), str(2 * i + 3)],
+            'correct_option_index': 0,
+        }
+        for i in range(max(questions, 1))
+    ], {'title': 'Load test', 'uploaded_by_user_id': 1})
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    activation = {
+        'test_id': TEST_ID,
+        'enabled_by_user_id': 1,
+        'start_time': now - datetime.timedelta(minutes=1),
+        'end_time': now + datetime.timedelta(hours=6),
+        'num_questions_to_ask': questions,
+        'max_tries': 1,
+        'activation_timestamp': now,
+        'attempts_ledger': True,
+    }
+    result = await (await db.get_collection('active_tests')).insert_one(activation)
+    activation['_id'] = result.inserted_id
+    activation_index.add_activation(activation)
+
+
+def _user(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f'Student {user_id}', 'username': f'student{user_id}'}
+
+
+def _command(user_id: int, text: str) -> dict:
+    command = text.split()[0]
+    return {'message': {
+        'message_id': 1, 'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'}, 'from': _user(user_id), 'text': text,
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}],
+    }}
+
+
+def _callback(user_id: int, message: dict, data: str) -> dict:
+    return {'callback_query': {
+        'id': f'{user_id}-{time.monotonic_ns()}', 'from': _user(user_id),
+        'chat_instance': str(user_id), 'data': data,
+        'message': {
+            'message_id': message['message_id'], 'date': message['date'],
+            'chat': message['chat'], 'from': message['from'], 'text': message.get('text', ''),
+        },
+    }}
+
+
+async def _student(api, user_id: int, questions: int, think: float, timings: dict, errors: list) -> None:
+    outbox = api.outbox(user_id)
+
+    async def step(name: str, update: dict) -> dict:
+        start = time.perf_counter()
+        api.push_update(update)
+        _, message = await asyncio.wait_for(outbox.get(), 60)
+        timings[name].append(time.perf_counter() - start)
+        return message
+
+    try:
+        message = await step('start', _command(user_id, f'/test {TEST_ID}'))
+        for position in range(questions):
+            keyboard = message.get('reply_markup', {}).get('inline_keyboard')
+            if not keyboard:
+                errors.append(f'{user_id}: no question keyboard: {message.get("text", "")[:80]!r}')
+                return
+            options = [button['callback_data'] for row in keyboard for button in row
+                       if button['callback_data'].startswith('ans_')]
+            await asyncio.sleep(random.uniform(0.5, 1.5) * think)
+            name = 'finish' if position == questions - 1 else 'answer'
+            message = await step(name, _callback(user_id, message, random.choice(options)))
+        if 'завершен' not in message.get('text', ''):
+            errors.append(f'{user_id}: unexpected final message: {message.get("text", "")[:80]!r}')
+    except asyncio.TimeoutError:
+        errors.append(f'{user_id}: no reply within 60 s')
+
+
+def _percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='End-to-end /test load test against a local Bot API stand-in.')
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--think-ms', type=float, default=500, help='mean pause before each answer')
+    parser.add_argument('--ramp-s', type=float, default=5, help='students start spread over this time')
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default='polling')
+    parser.add_argument('--telegram-limits', action='store_true', help='keep the SEND_* flood limits')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    from fake_bot_api import FakeBotApi
+    api = FakeBotApi()
+    await api.start()
+    _configure(args, api.base_url)
+
+    # Imported only now: settings are read from the environment at import
+    import main as bot
+    from db import connect_db, close_db, get_collection
+    from utils.user_registry import start_user_registry, stop_user_registry
+    from utils.result_writer import start_result_writer, stop_result_writer, get_result_writer_stats
+    from utils.activation_stats import start_activation_stats, stop_activation_stats
+
+    await connect_db()
+    await _prepare_database(args.questions)
+    start_user_registry()
+    start_result_writer()
+    start_activation_stats()
+    app = bot.build_application()
+    await bot.start_application(app)
+
+    timings = {'start': [], 'answer': [], 'finish': []}
+    errors = []
+    print(f'{args.students} students x {args.questions} questions, think {args.think_ms:g} ms, '
+          f'ramp {args.ramp_s:g} s, {args.mode}, '
+          f"{'Telegram flood limits' if args.telegram_limits else 'no send limits'}")
+
+    async def delayed(i):
+        await asyncio.sleep(random.uniform(0, args.ramp_s))
+        await _student(api, FIRST_USER_ID + i, args.questions, args.think_ms / 1000, timings, errors)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(delayed(i) for i in range(args.students)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await bot.stop_application(app)
+        await stop_result_writer()
+        await stop_activation_stats()
+        await stop_user_registry()
+
+    finished = await (await get_collection('results')).count_documents({'test_id': TEST_ID, 'status': 'finished'})
+    writer = get_result_writer_stats()
+    await close_db()
+    await api.stop()
+
+    updates = sum(len(values) for values in timings.values())
+    print(f"\n{'step':<8}{'count':>7}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, values in timings.items():
+        if values:
+            print(f'{name:<8}{len(values):>7}{_percentile(values, .5) * 1000:>9.1f}'
+                  f'{_percentile(values, .9) * 1000:>9.1f}{_percentile(values, .99) * 1000:>9.1f}'
+                  f'{max(values) * 1000:>9.1f}')
+    print(f'\nwall time {elapsed:.1f} s: {args.students / elapsed:.1f} attempts/s, '
+          f'{updates / elapsed:.0f} updates/s')
+    print(f"results stored: {finished}/{args.students}, writes per answer: {writer['writes_per_answer']:.2f}")
+    print('Bot API calls:', ', '.join(f'{method} {count}' for method, count in api.calls.most_common()))
+    if errors:
+        print(f'\n{len(errors)} error(s), first: {errors[:3]}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
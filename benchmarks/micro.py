@@ -0,0 +1,243 @@
+# benchmarks/micro.py
+#
+# Micro-benchmarks of the pure functions on hot paths (every message, or
+# scaling with class size), checked against committed baselines in
+# benchmarks/micro_baseline.json:
+#   normalize_test_id        1000 raw IDs
+#   get_response             100 messages against a 2000-row responses.csv
+#   csv_rows                 test bank CSV, 1000 rows read and validated
+#   build_frame              question texts and keyboards of a 20-question session
+#   txt_report               /txt report of 5000 results, formatted and spooled
+#
+# Times are compared in calibration units (time of a fixed pure-Python
+# workload, measured in rounds interleaved with each case), so baselines recorded on another
+# machine still apply. A case fails when it is slower than its baseline by
+# more than the threshold (default 1.5x, per-case overrides in the file);
+# the exit status is then 1. Logging is raised to WARNING while measuring,
+# so log file writes do not dominate.
+#
+# Run from the project root:
+#   python benchmarks/micro.py [case ...]        check against the baselines
+#   python benchmarks/micro.py --save [case ...] record new baselines
+
+import argparse
+import asyncio
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+# Settings need these to import; no bot or database is contacted
+for name, value in {
+    'TOKEN': 'benchmark', 'BOT_USERNAME': 'benchmark', 'ADMIN_USERNAME': 'benchmark',
+    'ADMIN_USER_ID': '1', 'MONGO_URI': 'mongodb://localhost', 'MONGO_DB_NAME': 'benchmark',
+}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logging_config import logger  # noqa: E402
+from handlers import message_handler  # noqa: E402
+from handlers.test_handler import _build_frame  # noqa: E402
+from handlers.txt_handler import _report_header  # noqa: E402
+from utils.common_helpers import normalize_test_id, parse_question_row  # noqa: E402
+from utils.result_reports import spool_report  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'micro_baseline.json')
+DEFAULT_THRESHOLD = 1.5
+REPEATS = 15
+
+WORDS = ['привет', 'тест', 'оценка', 'экзамен', 'помощь', 'результат', 'время', 'вопрос',
+         'hello', 'score', 'deadline', 'retake', 'material', 'lecture', 'grade', 'help']
+
+
+def calibration():
+    """Fixed workload of string, list and dict operations; the time unit."""
+    table = {}
+    for i in range(2000):
+        key = f'key_{i % 97}'.upper().lower()
+        table[key] = table.get(key, 0) + len(key.split('_'))
+    return sum(table.values())
+
+
+# --- Cases: each returns a zero-argument callable with its input prepared ---
+
+def case_normalize_test_id():
+    rng = random.Random(1)
+    raw_ids = [
+        f"{rng.choice(['test', 'Test', 'TEST', ''])}{rng.choice(['_', ''])}"
+        f"{rng.choice(['Math', 'physics', 'ИСТОРИЯ'])}_{rng.randint(1, 999)} "
+        for _ in range(1000)
+    ]
+    return lambda: [normalize_test_id(raw_id) for raw_id in raw_ids]
+
+
+def case_get_response():
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'responses.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file, delimiter=';')
+            writer.writerow(['tags', 'response1', 'response2'])
+            for i in range(2000):
+                tags = ', '.join(f'{rng.choice(WORDS)}{i}_{k}' for k in range(5))
+                writer.writerow([tags, f'Ответ {i}', f'Другой ответ {i}'])
+            # A common keyword near the end: matching texts scan most rows
+            writer.writerow(['привет, здравствуй', 'Привет!', 'Здравствуйте!'])
+        message_handler.loaded_responses = message_handler.load_responses(path)
+    texts = [
+        ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 15))) + (' привет' if i % 2 else '')
+        for i in range(100)
+    ]
+    return lambda: [message_handler.get_response(text) for text in texts]
+
+
+def case_csv_rows():
+    rng = random.Random(3)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    for i in range(1000):
+        options = [f'Вариант {k} к вопросу {i}' for k in range(4)]
+        row = [f'Вопрос {i}: ' + ' '.join(rng.choice(WORDS) for _ in range(12)), rng.choice(options), *options]
+        if i % 50 == 0:
+            row = row[:5] # Some broken rows, as in real uploads
+        writer.writerow(row)
+    csv_text = buffer.getvalue()
+
+    def run():
+        questions = []
+        for row in csv.reader(io.StringIO(csv_text), delimiter=';'):
+            if not row or not row[0].strip():
+                continue
+            question, problem = parse_question_row(row)
+            if problem is None:
+                questions.append(question)
+        return questions
+    return run
+
+
+def case_build_frame():
+    questions = [
+        {
+            'question_text': f'Вопрос {i}: ' + 'сколько будет два плюс два, если ' * 5,
+            'options': [f'Вариант {k} к вопросу {i}' for k in range(4)],
+            'correct_option_index': i % 4,
+        }
+        for i in range(20)
+    ]
+    rng = random.Random(5)
+    orders = [rng.sample(range(4), 4) for _ in questions]
+    return lambda: [
+        _build_frame('math101', 1, position, len(questions), question, orders[position])
+        for position, question in enumerate(questions)
+    ]
+
+
+def case_txt_report():
+    rng = random.Random(6)
+    start = datetime.datetime(2024, 5, 20, 9, 0)
+    results = [
+        {
+            'username': f'student{i}',
+            'score': rng.uniform(0, 100),
+            'attempt_number': rng.randint(1, 3),
+            'end_timestamp': start + datetime.timedelta(seconds=rng.randint(0, 86400)),
+        }
+        for i in range(5000)
+    ]
+    loop = asyncio.new_event_loop()
+
+    async def rows():
+        for result in results:
+            yield result
+
+    async def write():
+        report, _ = await spool_report(_report_header('math101'), rows())
+        report.close()
+    return lambda: loop.run_until_complete(write())
+
+
+CASES = {
+    'normalize_test_id': case_normalize_test_id,
+    'get_response': case_get_response,
+    'csv_rows': case_csv_rows,
+    'build_frame': case_build_frame,
+    'txt_report': case_txt_report,
+}
+
+
+def measure(func) -> tuple:
+    """
+    Best time of one call of `func` and of the calibration workload, in
+    seconds, over REPEATS interleaved rounds: both see the same machine load.
+    """
+    case_timer = timeit.Timer(func)
+    unit_timer = timeit.Timer(calibration)
+    case_number, _ = case_timer.autorange()
+    unit_number, _ = unit_timer.autorange()
+    seconds = unit = float('inf')
+    for _ in range(REPEATS):
+        unit = min(unit, unit_timer.timeit(unit_number) / unit_number)
+        seconds = min(seconds, case_timer.timeit(case_number) / case_number)
+    return seconds, unit
+
+
+def load_baselines() -> dict:
+    if not os.path.exists(BASELINE_FILE):
+        return {'threshold': DEFAULT_THRESHOLD, 'cases': {}}
+    with open(BASELINE_FILE, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks with regression thresholds.')
+    parser.add_argument('cases', nargs='*', help=f"default: all ({', '.join(CASES)})")
+    parser.add_argument('--save', action='store_true', help='record the results as new baselines')
+    parser.add_argument('--threshold', type=float, help='allowed slowdown factor for every case')
+    args = parser.parse_args()
+    names = args.cases or list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+
+    logger.setLevel(logging.WARNING)
+    baselines = load_baselines()
+    print(f"{'case':<20}{'time':>12}{'units':>10}{'baseline':>10}{'ratio':>8}  status")
+
+    regressions = []
+    for name in names:
+        seconds, unit = measure(CASES[name]())
+        units = seconds / unit
+        baseline = baselines['cases'].get(name)
+        if args.save:
+            baselines['cases'][name] = dict(baseline or {}, units=round(units, 3))
+            print(f'{name:<20}{seconds * 1e3:>10.3f}ms{units:>10.2f}{"":>10}{"":>8}  saved')
+            continue
+        if baseline is None:
+            print(f'{name:<20}{seconds * 1e3:>10.3f}ms{units:>10.2f}{"-":>10}{"-":>8}  no baseline')
+            continue
+        threshold = args.threshold or baseline.get('threshold', baselines.get('threshold', DEFAULT_THRESHOLD))
+        ratio = units / baseline['units']
+        status = 'ok' if ratio <= threshold else f'REGRESSION (> {threshold:g}x)'
+        if ratio > threshold:
+            regressions.append(name)
+        print(f"{name:<20}{seconds * 1e3:>10.3f}ms{units:>10.2f}{baseline['units']:>10.2f}{ratio:>8.2f}  {status}")
+
+    if args.save:
+        baselines.setdefault('threshold', DEFAULT_THRESHOLD)
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+            file.write('\n')
+        print(f'Baselines written to {BASELINE_FILE}')
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
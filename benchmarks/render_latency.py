@@ -0,0 +1,118 @@
+# benchmarks/render_latency.py
+#
+# Work done in the answer callback before the edit request is sent
+# (network time excluded): building the next question on every callback
+# (text, option shuffle, InlineKeyboardButton/Markup objects), as the
+# handler did before render plans, against looking up a frame prepared
+# once with the shipped handlers.test_handler._build_frame.
+#
+# Run from the project root:  python benchmarks/render_latency.py [callbacks]
+
+import os
+import random
+import statistics
+import sys
+import time
+
+# Settings need these to import; no bot or database is contacted
+for name, value in {
+    'TOKEN': 'benchmark', 'BOT_USERNAME': 'benchmark', 'ADMIN_USERNAME': 'benchmark',
+    'ADMIN_USER_ID': '1', 'MONGO_URI': 'mongodb://localhost', 'MONGO_DB_NAME': 'benchmark',
+}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup  # noqa: E402
+
+from handlers.test_handler import ANSWER_PREFIX, CANCEL_TEST, _build_frame  # noqa: E402
+
+QUESTIONS_PER_SESSION = 20
+TEST_ID = 'math101'
+
+
+def make_session():
+    return [
+        {
+            'question_text': f'Question {i}: ' + 'lorem ipsum dolor sit amet ' * 6,
+            'options': tuple(f'Option {k} for question {i}' for k in range(4)),
+            'correct_option_index': i % 4,
+        }
+        for i in range(QUESTIONS_PER_SESSION)
+    ]
+
+
+def build_old(question, position, order):
+    """
+    Frozen copy of the per-answer build of _send_question before render
+    plans (the baseline); not kept in sync with _build_frame.
+    """
+    keyboard = []
+    row = []
+    for original_index in order:
+        row.append(InlineKeyboardButton(
+            question['options'][original_index],
+            callback_data=f'{ANSWER_PREFIX}{original_index}'
+        ))
+        if len(row) == 2:
+            keyboard.append(row)
+            row = []
+    if row:
+        keyboard.append(row)
+    keyboard.append([InlineKeyboardButton('❌ Отмена', callback_data=CANCEL_TEST)])
+    text = (
+        f"📝 *Тест: {TEST_ID}* (1-я попытка)\n\n"
+        f"*Вопрос {position + 1} из {QUESTIONS_PER_SESSION}:*\n\n"
+        f"{question['question_text']}"
+    )
+    return text, InlineKeyboardMarkup(keyboard), question['correct_option_index']
+
+
+def per_callback_build(session, position):
+    order = list(range(len(session[position]['options'])))
+    random.shuffle(order)
+    return build_old(session[position], position, order)
+
+
+def timed(func, callbacks):
+    samples = []
+    for i in range(callbacks):
+        start = time.perf_counter_ns()
+        func(i % QUESTIONS_PER_SESSION)
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+    return (
+        statistics.mean(samples) / 1000,
+        samples[len(samples) // 2] / 1000,
+        samples[int(len(samples) * 0.99)] / 1000,
+    )
+
+
+def main():
+    callbacks = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    session = make_session()
+
+    start = time.perf_counter_ns()
+    orders = []
+    for question in session:
+        order = list(range(len(question['options'])))
+        random.shuffle(order)
+        orders.append(order)
+    plan = tuple(
+        _build_frame(TEST_ID, 1, position, QUESTIONS_PER_SESSION, question, orders[position])
+        for position, question in enumerate(session)
+    )
+    plan_build_us = (time.perf_counter_ns() - start) / 1000
+
+    print(f'{callbacks} callbacks, {QUESTIONS_PER_SESSION} questions per session')
+    print(f"{'path':<24}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}")
+    for name, func in (
+        ('per-answer build (old)', lambda position: per_callback_build(session, position)),
+        ('prepared frame', lambda position: plan[position]),
+    ):
+        mean, p50, p99 = timed(func, callbacks)
+        print(f'{name:<24}{mean:>10.2f}{p50:>10.2f}{p99:>10.2f}')
+    print(f'one-off plan build in test_command: {plan_build_us:.0f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/result_burst.py
+#
+# Synthetic end-of-exam burst: N attempts finish within a short window.
+# Compares one awaited insert_one per finish with utils.result_writer
+# (immediate acknowledgement, the attempt documents are finalized with
+# bulk_write batches).
+#
+# MongoDB is simulated: every request pays a network round trip, and the
+# server applies writes one request at a time with a fixed per-request
+# cost (parse, journal commit) plus a small per-document cost. Tune with
+# the constants below to match your deployment.
+#
+# Run from the project root:  python benchmarks/result_burst.py [attempts] [window_s]
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+# Settings need these to import; no bot or database is contacted
+for name, value in {
+    'TOKEN': 'benchmark', 'BOT_USERNAME': 'benchmark', 'ADMIN_USERNAME': 'benchmark',
+    'ADMIN_USER_ID': '1', 'MONGO_URI': 'mongodb://localhost', 'MONGO_DB_NAME': 'benchmark',
+}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import result_writer  # noqa: E402
+
+ROUND_TRIP_S = 0.001
+PER_REQUEST_S = 0.0005
+PER_DOCUMENT_S = 0.00002
+
+
+class SimulatedCollection:
+    def __init__(self):
+        self._server = asyncio.Lock()
+        self.requests = 0
+        self.documents = 0
+
+    async def _request(self, documents: int):
+        await asyncio.sleep(ROUND_TRIP_S / 2)
+        async with self._server:
+            await asyncio.sleep(PER_REQUEST_S + documents * PER_DOCUMENT_S)
+        await asyncio.sleep(ROUND_TRIP_S / 2)
+        self.requests += 1
+        self.documents += documents
+
+    async def insert_one(self, doc):
+        await self._request(1)
+
+    async def bulk_write(self, operations, ordered=True):
+        await self._request(len(operations))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def burst(finish, attempts: int, window: float):
+    """Starts `attempts` finishes spread over `window`; returns ack latencies."""
+    latencies = []
+
+    async def one(delay):
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        await finish({'score': 100.0, 'correct_count': 20, 'total_questions': 20})
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(random.uniform(0, window)) for _ in range(attempts)))
+    return latencies
+
+
+async def main():
+    attempts = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    window = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    random.seed(1)
+    print(f'{attempts} attempts finishing within {window:g}s')
+    print(f"{'path':<22}{'ack p50 ms':>12}{'ack p99 ms':>12}{'stored/s':>10}{'requests':>10}")
+
+    # Before: the handler awaits its own insert_one
+    collection = SimulatedCollection()
+
+    async def insert_one(doc):
+        await collection.insert_one(doc)
+
+    start = time.perf_counter()
+    latencies = await burst(insert_one, attempts, window)
+    elapsed = time.perf_counter() - start
+    print(f"{'insert_one per finish':<22}{percentile(latencies, .5) * 1000:>12.1f}"
+          f"{percentile(latencies, .99) * 1000:>12.1f}{attempts / elapsed:>10.0f}{collection.requests:>10}")
+
+    # After: finalize_attempt, batched by the writer. The attempts were
+    # opened (and written) when they started, before the burst.
+    collection = SimulatedCollection()
+
+    async def simulated_get_collection(name):
+        return collection
+
+    result_writer.get_collection = simulated_get_collection
+    attempt_ids = [result_writer.open_attempt({'user_id': i}) for i in range(attempts)]
+    await result_writer.flush_results()
+    collection = SimulatedCollection()
+    result_writer.start_result_writer()
+
+    async def submit(doc):
+        result_writer.finalize_attempt(attempt_ids.pop(), 0, doc)
+
+    start = time.perf_counter()
+    latencies = await burst(submit, attempts, window)
+    while collection.documents < attempts:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    await result_writer.stop_result_writer()
+    print(f"{'result writer':<22}{percentile(latencies, .5) * 1000:>12.3f}"
+          f"{percentile(latencies, .99) * 1000:>12.3f}{attempts / elapsed:>10.0f}{collection.requests:>10}")
+    print('stored/s counts until the last document is in the (simulated) database.')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
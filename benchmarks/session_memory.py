@@ -0,0 +1,107 @@
+# benchmarks/session_memory.py
+#
+# Bytes per /test session held in user_data: the old layout (copied
+# question dicts, answers as dicts) against the compact one (bank version,
+# question indices, option orders as strings, answers as ints).
+# Also reports the BSON size, which is what the MongoDB persistence writes.
+#
+# Run from the project root:  python benchmarks/session_memory.py [sessions]
+
+import datetime
+import random
+import sys
+import tracemalloc
+from types import MappingProxyType
+
+import bson
+
+QUESTIONS_IN_BANK = 300
+QUESTIONS_PER_SESSION = 20
+ANSWERED = 10 # Sessions are measured halfway through
+
+
+def make_bank():
+    """Read-only bank shaped like utils.test_bank_cache.TestBank.questions."""
+    return tuple(
+        MappingProxyType({
+            'question_text': f'Question {i}: ' + 'lorem ipsum dolor sit amet ' * 6,
+            'options': tuple(f'Option {k} for question {i}, reasonably long' for k in range(4)),
+            'correct_option_index': i % 4,
+        })
+        for i in range(QUESTIONS_IN_BANK)
+    )
+
+
+def session_base():
+    return {
+        'active_test_id': bson.ObjectId(),
+        'test_id': 'math101',
+        'current_q_index': ANSWERED,
+        'score': ANSWERED // 2,
+        'attempt_number': 1,
+        'test_start_time': datetime.datetime.now(datetime.timezone.utc),
+    }
+
+
+def old_session(bank):
+    session = session_base()
+    questions = []
+    for index in random.sample(range(len(bank)), QUESTIONS_PER_SESSION):
+        q_data = dict(bank[index])
+        q_data['original_index'] = index
+        questions.append(q_data)
+    session['questions_for_session'] = questions
+    session['answers'] = [
+        {
+            'question_index_in_bank': q['original_index'],
+            'selected_option_index': 1,
+            'is_correct': q['correct_option_index'] == 1,
+        }
+        for q in questions[:ANSWERED]
+    ]
+    return session
+
+
+def new_session(bank):
+    session = session_base()
+    indices = random.sample(range(len(bank)), QUESTIONS_PER_SESSION)
+    orders = []
+    for index in indices:
+        order = list(range(len(bank[index]['options'])))
+        random.shuffle(order)
+        orders.append(''.join(chr(48 + i) for i in order))
+    session['bank_version'] = 3
+    session['question_indices'] = indices
+    session['option_orders'] = orders
+    session['answers'] = [1] * ANSWERED
+    return session
+
+
+def measure(build, bank, sessions):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    held = [build(bank) for _ in range(sessions)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    bson_size = sum(len(bson.encode(session)) for session in held) / sessions
+    return allocated / sessions, bson_size
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    bank = make_bank()
+    random.seed(1)
+
+    print(f'{sessions} sessions, {QUESTIONS_PER_SESSION} questions each, {ANSWERED} answered')
+    print(f"{'layout':<10}{'bytes/session':>16}{'BSON bytes':>14}")
+    results = {}
+    for name, build in (('old', old_session), ('compact', new_session)):
+        memory, bson_size = measure(build, bank, sessions)
+        results[name] = memory
+        print(f'{name:<10}{memory:>16,.0f}{bson_size:>14,.0f}')
+    print(f"compact/old: {results['compact'] / results['old']:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# benchmarks/update_throughput.py
+#
+# Aggregate update throughput with N simulated users, each sending a burst
+# of updates whose handler awaits simulated I/O (DB query + Bot API call).
+# Compares PTB's default sequential processing with
+# utils.update_processor.UserSerializingUpdateProcessor, and checks that
+# every user's updates were still handled in order.
+#
+# Run from the project root:
+#   python benchmarks/update_throughput.py [users] [updates_per_user] [io_ms]
+
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+from telegram.ext import SimpleUpdateProcessor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.update_processor import UserSerializingUpdateProcessor  # noqa: E402
+
+
+async def run(processor, users: int, per_user: int, io_seconds: float):
+    handled = {user_id: [] for user_id in range(users)}
+
+    async def handler(update):
+        await asyncio.sleep(io_seconds)
+        handled[update.effective_user.id].append(update.seq)
+
+    updates = [
+        SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=None, seq=seq)
+        for seq in range(per_user)
+        for user_id in range(users)
+    ]
+
+    start = time.perf_counter()
+    # Like Application: one task per update, started in arrival order
+    tasks = [
+        asyncio.create_task(processor.process_update(update, handler(update)))
+        for update in updates
+    ]
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    in_order = all(seqs == list(range(per_user)) for seqs in handled.values())
+    return len(updates) / elapsed, elapsed, in_order
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    io_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    print(f'{users} users x {per_user} updates, {io_ms:g} ms simulated I/O per update')
+    print(f"{'processor':<28}{'updates/s':>12}{'seconds':>10}{'in order':>10}")
+    candidates = [('sequential (PTB default)', SimpleUpdateProcessor(1))]
+    candidates += [
+        (f'per-user, max_running={n}', UserSerializingUpdateProcessor(n))
+        for n in (8, 32, 128)
+    ]
+    for name, processor in candidates:
+        rate, elapsed, in_order = await run(processor, users, per_user, io_ms / 1000)
+        print(f'{name:<28}{rate:>12,.0f}{elapsed:>10.2f}{str(in_order):>10}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
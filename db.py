@@ -1,12 +1,49 @@
 import os
 import motor.motor_asyncio
+from pymongo import ReadPreference, WriteConcern
 from logging_config import logger
-from settings import MONGO_URI, MONGO_DB_NAME
+from settings import (
+    MONGO_URI, MONGO_DB_NAME,
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS, MONGO_COMPRESSORS, MONGO_COLLECTION_PROFILES,
+)
+from utils.db_indexes import ensure_indexes
+from utils.pool_monitor import PoolStatsListener
 
 # Module-level variables for client and db instances
 TIMEOUT_DB = 5000
 _client = None
 _db = None
+_pool_listener = PoolStatsListener()
+# Collections with a read/write profile applied, built once per connection
+_profiled_collections = {}
+
+_READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+
+def _client_options() -> dict:
+    """Builds pool and compression options for the Motor client."""
+    options = {
+        # Set serverSelectionTimeoutMS to handle connection issues faster
+        'serverSelectionTimeoutMS': TIMEOUT_DB,
+        'maxPoolSize': MONGO_MAX_POOL_SIZE,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'event_listeners': [_pool_listener],
+    }
+    # The driver rejects 0 for these; leaving them out keeps its defaults
+    if MONGO_MAX_IDLE_TIME_MS > 0:
+        options['maxIdleTimeMS'] = MONGO_MAX_IDLE_TIME_MS
+    if MONGO_WAIT_QUEUE_TIMEOUT_MS > 0:
+        options['waitQueueTimeoutMS'] = MONGO_WAIT_QUEUE_TIMEOUT_MS
+    if MONGO_COMPRESSORS:
+        options['compressors'] = ','.join(MONGO_COMPRESSORS)
+    return options
 
 
 async def connect_db():
@@ -25,11 +62,8 @@ async def connect_db():
 
     try:
         logger.info(f'Attempting to connect to MongoDB at {MONGO_URI}...')
-        _client = motor.motor_asyncio.AsyncIOMotorClient(
-            MONGO_URI,
-            # Set serverSelectionTimeoutMS to handle connection issues faster
-            serverSelectionTimeoutMS=TIMEOUT_DB
-        )
+        options = _client_options()
+        _client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI, **options)
         # The ismaster command is cheap and does not require auth.
         await _client.admin.command('ping')
         _db = _client[MONGO_DB_NAME]
@@ -37,6 +71,13 @@ async def connect_db():
             f'Successfully connected to MongoDB.'
             f' Database: "{MONGO_DB_NAME}"'
         )
+        logger.info(
+            f'MongoDB pool: maxPoolSize={MONGO_MAX_POOL_SIZE},'
+            f' minPoolSize={MONGO_MIN_POOL_SIZE},'
+            f' maxIdleTimeMS={options.get("maxIdleTimeMS", "default")},'
+            f' waitQueueTimeoutMS={options.get("waitQueueTimeoutMS", "default")},'
+            f' compressors={options.get("compressors", "none")}'
+        )
     except Exception as e:
         logger.exception(f'Failed to connect to MongoDB: {e}')
         _client = None
@@ -44,6 +85,12 @@ async def connect_db():
         # Propagate the error to signal connection failure
         raise ConnectionError('Could not connect to MongoDB') from e
 
+    # Index problems are logged but must not keep the bot from starting
+    try:
+        await ensure_indexes(_db)
+    except Exception as e:
+        logger.exception(f'Index bootstrap failed: {e}')
+
 
 def get_db():
     if _db is None:
@@ -58,12 +105,57 @@ def get_db():
 async def close_db():
     global _client, _db
     if _client:
+        logger.info(f'MongoDB pool stats at shutdown: {get_pool_stats()}')
         _client.close()
         logger.info('MongoDB connection closed.')
         _client = None
         _db = None
+        _profiled_collections.clear()
+
+
+def get_pool_stats() -> dict:
+    """Returns live connection pool counters collected by the listener."""
+    return _pool_listener.snapshot()
+
+
+def format_pool_stats() -> str:
+    """get_pool_stats() as a /db_stats section."""
+    stats = get_pool_stats()
+    return (
+        "🗄️ Пул соединений MongoDB:\n"
+        f"Открыто соединений: {stats['open_connections']}\n"
+        f"Занято: {stats['checked_out']}\n"
+        f"Ожидают соединения: {stats['waiting']}\n"
+        f"Всего выдач: {stats['total_checkouts']}\n"
+        f"Ошибок выдачи: {stats['checkout_failures']}\n"
+        f"Сбросов пула: {stats['pool_clears']}\n"
+        f"Ожидание (сред./макс.): {stats['avg_checkout_wait_ms']:.1f} / "
+        f"{stats['max_checkout_wait_ms']:.1f} мс"
+    )
 
 
 async def get_collection(collection_name: str):
+    """
+    The collection with its MONGO_COLLECTION_PROFILES options applied.
+    'results' always reads from the primary (settings rejects any other
+    read preference for it): the result writer re-reads 'answered' to line
+    up retries, session restore reads running attempts, /delete_test
+    counts results and the report cache watermark is the newest result,
+    all right after writes that a lagging secondary may not have yet.
+    """
     db_instance = get_db()  # Ensures DB is connected
-    return db_instance[collection_name]
+    profile = MONGO_COLLECTION_PROFILES.get(collection_name)
+    if not profile:
+        return db_instance[collection_name]
+
+    collection = _profiled_collections.get(collection_name)
+    if collection is None:
+        read_pref, write_w = profile
+        options = {}
+        if read_pref:
+            options['read_preference'] = _READ_PREFERENCES[read_pref]
+        if write_w is not None:
+            options['write_concern'] = WriteConcern(w=write_w)
+        collection = db_instance[collection_name].with_options(**options)
+        _profiled_collections[collection_name] = collection
+    return collection
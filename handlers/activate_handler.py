@@ -11,6 +11,7 @@ from db import get_collection
 from logging_config import logger
 from utils.db_helpers import get_user_role
 from utils.common_helpers import normalize_test_id
+from utils import activation_index
 
 # Define command structure options
 # /act_test <id> <questions> <tries> <duration_minutes>
@@ -78,18 +79,10 @@ async def activate_test_command(
 async def _check_status(update: Update, test_id: str):
     """Checks and reports the status of active tests with the given ID."""
     logger.info(f"Checking status for test_id '{test_id}'.")
-    active_tests_coll = await get_collection('active_tests')
-    now = datetime.datetime.now(datetime.timezone.utc)
-
-    # Find activations that are currently running
-    cursor = active_tests_coll.find({
-        'test_id': test_id,
-        'start_time': {'$lte': now},
-        'end_time': {'$gte': now}
-    }).sort('start_time', -1) # Show newest first
 
+    # Activations that are currently running, newest first
     active_list = []
-    async for act in cursor:
+    for act in await activation_index.get_current_activations(test_id):
         start_str = act['start_time'].strftime('%Y-%m-%d %H:%M UTC')
         end_str = act['end_time'].strftime('%Y-%m-%d %H:%M UTC')
         enabled_by = act.get('enabled_by_user_id', 'N/A')
@@ -128,6 +121,7 @@ async def _deactivate_test(update: Update, test_id: str, user_id: int):
         update_result = await active_tests_coll.update_many(
             update_filter, update_operation
         )
+        await activation_index.reload_test(test_id)
 
         if update_result.matched_count == 0:
             await update.message.reply_text(f"Не найдено активных в данный момент сессий теста '{test_id}' для деактивации.")
@@ -221,13 +215,17 @@ async def _activate_test(
             'end_time': end_time,
             'num_questions_to_ask': num_questions,
             'max_tries': max_tries,
-            'activation_timestamp': now
+            'activation_timestamp': now,
+            # Attempts are counted in the 'attempts' ledger from the start
+            'attempts_ledger': True
         }
 
         active_tests_coll = await get_collection('active_tests')
         insert_result = await active_tests_coll.insert_one(activation_doc)
 
         if insert_result.inserted_id:
+            activation_doc['_id'] = insert_result.inserted_id
+            activation_index.add_activation(activation_doc)
             logger.info(f"Successfully activated test '{test_id}' by user {user_id} "
                         f"(Activation ID: {insert_result.inserted_id})")
             start_str = start_time.strftime('%Y-%m-%d %H:%M UTC')
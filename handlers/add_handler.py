@@ -5,7 +5,7 @@ from telegram.ext import ContextTypes, CommandHandler
 
 from db import get_collection
 from logging_config import logger
-from utils.db_helpers import get_user_role
+from utils.db_helpers import get_user_role, invalidate_user_role
 
 
 async def add_teacher_command(
@@ -93,6 +93,7 @@ async def add_teacher_command(
             {'user_id': target_user_id},
             {'$set': {'role': 'teacher'}}
         )
+        invalidate_user_role(target_user_id)
 
         if update_result.modified_count == 1:
             logger.info(
@@ -208,6 +209,7 @@ async def add_teacher_by_id_command(
             {'user_id': target_user_id},
             {'$set': {'role': 'teacher'}}
         )
+        invalidate_user_role(target_user_id)
 
         if update_result.modified_count == 1:
             logger.info(
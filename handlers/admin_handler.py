@@ -5,10 +5,22 @@ import datetime
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 
-from db import get_collection
+from db import get_collection, format_pool_stats
 from logging_config import logger
-from utils.db_helpers import get_user_role
+from utils.db_helpers import (
+    get_user_role, invalidate_user_role, format_role_cache_stats
+)
 from utils.common_helpers import normalize_test_id
+from utils.test_bank_cache import invalidate_test_bank, format_test_bank_cache_stats
+from utils.question_store import delete_questions
+from utils.item_analysis import delete_item_analysis
+from utils.report_cache import format_report_cache_stats
+from utils.result_writer import format_result_writer_stats, IN_PROGRESS
+from utils.deadlines import format_deadline_stats
+
+# Telegram's limit for one message (UTF-16 code units); /db_stats is split
+# at section boundaries
+MAX_MESSAGE_LENGTH = 4096
 
 # Helper to check if user is admin
 async def _is_admin(user_id: int, username) -> bool:
@@ -64,6 +76,7 @@ async def add_admin_command(
             {'user_id': target_user_id},
             {'$set': {'role': 'admin'}}
         )
+        invalidate_user_role(target_user_id)
         if result.modified_count == 1:
             logger.info(f"Admin {invoker_id} promoted @{target_username} (ID: {target_user_id}) to admin.")
             await update.message.reply_text(f"✅ Пользователь @{target_username} успешно назначен администратором.")
@@ -124,6 +137,7 @@ async def remove_admin_command(
             {'user_id': target_user_id},
             {'$set': {'role': 'student'}} # Demote to student
         )
+        invalidate_user_role(target_user_id)
         if result.modified_count == 1:
             logger.info(f"Admin {invoker_id} demoted @{target_username} (ID: {target_user_id}) to student.")
             await update.message.reply_text(f"✅ Администратор @{target_username} успешно понижен до студента.")
@@ -207,6 +221,7 @@ async def remove_teacher_command(
             {'user_id': target_user_id},
             {'$set': {'role': 'student'}} # Demote to student
         )
+        invalidate_user_role(target_user_id)
         if result.modified_count == 1:
             logger.info(f"Admin {invoker_id} demoted teacher @{target_username} (ID: {target_user_id}) to student.")
             await update.message.reply_text(f"✅ Преподаватель @{target_username} успешно понижен до студента.")
@@ -262,7 +277,10 @@ async def delete_test_command(
         # This might be slow if the results collection is huge.
         # A potentially better way is to check active_tests first,
         # but let's keep it simple for now.
-        result_count = await results_collection.count_documents({'test_id': test_id})
+        # Running attempts are documents in 'results' too; they do not count
+        result_count = await results_collection.count_documents(
+            {'test_id': test_id, 'status': {'$ne': IN_PROGRESS}}
+        )
 
         if result_count > 0:
             logger.warning(f"Attempt to delete test '{test_id}' denied. Found {result_count} associated results.")
@@ -289,6 +307,11 @@ async def delete_test_command(
         # 4. Proceed with deletion (Test, Materials, Past Activations)
         # Delete Test Document
         del_test_result = await tests_collection.delete_one({'test_id': test_id})
+        invalidate_test_bank(test_id)
+        # Question documents of banks stored per question
+        await delete_questions(test_id)
+        # Cached analyses of the deleted test would otherwise stay as orphans
+        await delete_item_analysis(test_id)
 
         # Delete Associated Materials
         del_materials_result = await materials_collection.delete_many({'test_id': test_id})
@@ -319,9 +342,59 @@ async def delete_test_command(
         await update.message.reply_text("❌ Ошибка базы данных при удалении теста.")
 
 
+async def db_stats_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """Shows live MongoDB pool and cache statistics. Admin only."""
+    invoker_id = update.effective_user.id
+    invoker_username = update.effective_user.username
+
+    if not await _is_admin(invoker_id, invoker_username):
+        await update.message.reply_text("Эта команда доступна только администраторам.")
+        return
+
+    logger.info(f"Admin {invoker_id} requested DB pool statistics.")
+    sections = [
+        format_pool_stats(),
+        format_role_cache_stats(),
+        format_test_bank_cache_stats(),
+        format_report_cache_stats(),
+        format_result_writer_stats(),
+        format_deadline_stats(),
+    ]
+    # Optional components: the stock PTB ones have no stats
+    for component in (context.application.update_processor, getattr(context.bot, 'rate_limiter', None)):
+        if hasattr(component, 'format_stats'):
+            sections.append(component.format_stats())
+
+    for message in _split_messages(sections):
+        await update.message.reply_text(message)
+
+
+def _telegram_length(text: str) -> int:
+    """Length as Telegram counts it: UTF-16 code units (emoji take two)."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _split_messages(sections: list) -> list:
+    """Joins sections with blank lines into as few messages as fit MAX_MESSAGE_LENGTH."""
+    messages = []
+    for section in sections:
+        if messages and _telegram_length(messages[-1] + "\n\n" + section) <= MAX_MESSAGE_LENGTH:
+            messages[-1] += "\n\n" + section
+        elif _telegram_length(section) <= MAX_MESSAGE_LENGTH:
+            messages.append(section)
+        else:
+            # Half the limit in code points is within it in UTF-16 units
+            step = MAX_MESSAGE_LENGTH // 2
+            messages.extend(section[start:start + step] for start in range(0, len(section), step))
+    return messages
+
+
 # --- Handlers ---
 add_admin_command_handler = CommandHandler('add_admin', add_admin_command)
 remove_admin_command_handler = CommandHandler('remove_admin', remove_admin_command)
 list_admins_command_handler = CommandHandler('list_admins', list_admins_command)
 remove_teacher_command_handler = CommandHandler('remove_teacher', remove_teacher_command)
-delete_test_command_handler = CommandHandler('delete_test', delete_test_command)
\ No newline at end of file
+delete_test_command_handler = CommandHandler('delete_test', delete_test_command)
+db_stats_command_handler = CommandHandler('db_stats', db_stats_command)
\ No newline at end of file
@@ -6,10 +6,11 @@ import csv
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 
-from db import get_collection
 from logging_config import logger
 from utils.db_helpers import get_user_role
 from utils.common_helpers import normalize_test_id
+from utils.test_bank_cache import get_test_bank
+from utils.question_store import iter_questions
 
 
 async def download_command(
@@ -54,20 +55,14 @@ async def download_command(
                 f" for test_id '{test_id}'.")
 
     try:
-        tests_collection = await get_collection('tests')
-        test_data = await tests_collection.find_one(
-            {'test_id': test_id},
-            {'_id': 0, 'questions': 1}
-        )
+        bank = await get_test_bank(test_id)
 
-        if not test_data:
+        if not bank:
             logger.warning(f"Test '{test_id}' not found in DB for download.")
             await update.message.reply_text(f"Тест с ID '{test_id}' не найден.")
             return
 
-        questions = test_data.get('questions')
-
-        if not questions or not isinstance(questions, list):
+        if not bank.total_questions:
             logger.warning(f"Test '{test_id}' has no questions or invalid format.")
             await update.message.reply_text(
                 f"В тесте '{test_id}' нет вопросов для скачивания или они некорректны."
@@ -80,13 +75,13 @@ async def download_command(
         # csv_writer.writerow(['Вопрос', 'ТекстПравильногоОтвета', 'Опция1', 'Опция2', 'Опция3', 'Опция4'])
 
 
-        for q_data in questions:
+        async for _, q_data in iter_questions(bank):
             question_text = q_data.get('question_text', '')
             options = q_data.get('options', []) # Should be a list of 4 strings
             correct_index = q_data.get('correct_option_index', -1)
 
             # Validate data fetched from DB
-            if not question_text or not isinstance(options, list) or len(options) != 4 or \
+            if not question_text or not isinstance(options, (list, tuple)) or len(options) != 4 or \
                not (0 <= correct_index < len(options)):
                 logger.warning(f"Skipping invalid question data during download for test '{test_id}': {q_data}")
                 continue
@@ -95,7 +90,7 @@ async def download_command(
 
             # Construct the row: Question;CorrectAnswerText;Opt1;Opt2;Opt3;Opt4
             # The 'options' list already contains Opt1, Opt2, Opt3, Opt4
-            csv_row = [question_text, correct_answer_text] + options
+            csv_row = [question_text, correct_answer_text, *options]
             csv_writer.writerow(csv_row)
 
         csv_content = csv_buffer.getvalue()
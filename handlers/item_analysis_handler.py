@@ -0,0 +1,152 @@
+# handlers/item_analysis_handler.py
+
+from telegram import InputFile, Update
+from telegram.ext import ContextTypes, CommandHandler
+
+from logging_config import logger
+from utils.db_helpers import get_user_role
+from utils.common_helpers import normalize_test_id
+from utils.item_analysis import analyze_test
+from utils.result_reports import spool_report
+
+# Telegram's limit for one message (UTF-16 code units); longer analyses are sent as a file
+MAX_MESSAGE_LENGTH = 4096
+QUESTION_PREVIEW_LENGTH = 60
+# Flags: questions nearly everyone (or nearly no one) answers correctly,
+# and questions that hardly separate stronger from weaker attempts
+EASY_ABOVE = 0.9
+HARD_BELOW = 0.2
+WEAK_DISCRIMINATION_BELOW = 0.2
+
+
+async def item_analysis_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """
+    Handles /item_analysis <test_id> [refresh]: difficulty, discrimination
+    and option choices per question of the current test version.
+    """
+    if not update.effective_user:
+        logger.warning('/item_analysis triggered with no effective_user.')
+        return
+
+    user_id = update.effective_user.id
+    username = update.effective_user.username
+    logger.info(f"User {user_id} (@{username}) triggered /item_analysis command.")
+
+    user_role = await get_user_role(user_id, username)
+    if user_role not in ('admin', 'teacher'):
+        logger.warning(f"User {user_id} ({user_role}) attempted /item_analysis without privileges.")
+        await update.message.reply_text(
+            "Эта команда доступна только для администраторов и преподавателей."
+        )
+        return
+
+    if not context.args:
+        await update.message.reply_text(
+            "Пожалуйста, укажите ID теста.\nПример: `/item_analysis math101`"
+        )
+        return
+
+    test_id = normalize_test_id(context.args[0])
+    if not test_id:
+        await update.message.reply_text("Некорректный ID теста.")
+        return
+    refresh = len(context.args) > 1 and context.args[1].lower() == 'refresh'
+
+    # Teachers: attempts in the activations they enabled
+    owner = user_id if user_role != 'admin' else None
+    try:
+        analysis = await analyze_test(test_id, owner, refresh=refresh)
+    except Exception as e:
+        logger.exception(f"Error in item analysis of test '{test_id}' for user {user_id}: {e}")
+        await update.message.reply_text("Произошла ошибка при анализе вопросов.")
+        return
+
+    if analysis is None:
+        await update.message.reply_text(f"Тест с ID '{test_id}' не найден.")
+        return
+    if not analysis['items']:
+        await update.message.reply_text(
+            f"Нет ответов на текущую версию теста '{test_id}' "
+            f"(или у вас нет прав на их просмотр)."
+        )
+        return
+
+    header = _header(test_id, analysis)
+    lines = [_format_item(item, analysis['questions'].get(item['index'])) for item in analysis['items']]
+    text = header + "\n\n".join(lines)
+    # Telegram counts UTF-16 code units; the emoji flags take two each
+    if len(text.encode('utf-16-le')) // 2 <= MAX_MESSAGE_LENGTH:
+        try:
+            await update.message.reply_text(text)
+        except Exception as e:
+            logger.exception(f"Error sending item analysis of test '{test_id}' to user {user_id}: {e}")
+            await update.message.reply_text("Произошла ошибка при отправке анализа.")
+        return
+
+    async def items():
+        for line in lines:
+            yield line
+
+    report = None
+    try:
+        report, _ = await spool_report(header, items(), format_line=lambda line: line + "\n")
+        # Streamed from the spooled file, as in /txt
+        await update.message.reply_document(
+            document=InputFile(report, filename=f'item_analysis_{test_id}.txt', read_file_handle=False)
+        )
+    except Exception as e:
+        logger.exception(f"Error sending item analysis of test '{test_id}' to user {user_id}: {e}")
+        await update.message.reply_text("Произошла ошибка при отправке анализа.")
+    finally:
+        if report is not None:
+            report.close()
+
+
+def _header(test_id: str, analysis: dict) -> str:
+    computed = analysis['computed_at'].strftime('%Y-%m-%d %H:%M UTC')
+    source = "из кэша" if analysis['cached'] else "пересчитано"
+    return (
+        f"🔬 Анализ вопросов теста '{test_id}' (версия {analysis['version']})\n"
+        f"Попыток: {analysis['attempts']}, вопросов с ответами: {len(analysis['items'])}\n"
+        f"Рассчитано {computed} ({source})\n"
+        f"p — доля верных ответов, r — точечно-бисериальная корреляция с баллом.\n"
+        f"🟢 легкий (p > {EASY_ABOVE:g}), 🔴 трудный (p < {HARD_BELOW:g}), "
+        f"⚠️ слабо различает (r < {WEAK_DISCRIMINATION_BELOW:g}), ∅ вариант никто не выбрал\n\n"
+    )
+
+
+def _format_item(item: dict, question) -> str:
+    flags = []
+    if item['difficulty'] > EASY_ABOVE:
+        flags.append('🟢')
+    if item['difficulty'] < HARD_BELOW:
+        flags.append('🔴')
+    discrimination = item['discrimination']
+    if discrimination is not None and discrimination < WEAK_DISCRIMINATION_BELOW:
+        flags.append('⚠️')
+
+    text = (question or {}).get('question_text', '')
+    if len(text) > QUESTION_PREVIEW_LENGTH:
+        text = text[:QUESTION_PREVIEW_LENGTH - 1] + '…'
+    r_str = f"{discrimination:.2f}" if discrimination is not None else '—'
+    title = f"В{item['index'] + 1}. {text}".rstrip()
+
+    # Share of answers per option, in bank order; ✓ marks the correct one
+    correct_index = (question or {}).get('correct_option_index')
+    option_count = len((question or {}).get('options', ())) or len(item['options'])
+    options = []
+    for k in range(option_count):
+        count = item['options'].get(str(k), 0)
+        mark = '✓' if k == correct_index else ('∅' if not count else '')
+        options.append(f"{k + 1}) {count / item['answered']:.0%}{mark}")
+
+    return (
+        f"{title} {''.join(flags)}".rstrip() + "\n"
+        f"   ответов {item['answered']}, p {item['difficulty']:.2f}, r {r_str}\n"
+        f"   {'  '.join(options)}"
+    )
+
+
+item_analysis_command_handler = CommandHandler('item_analysis', item_analysis_command)
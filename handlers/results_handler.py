@@ -1,12 +1,24 @@
+import base64
 import datetime
+from typing import Optional
 
-from telegram import Update
-from telegram.ext import ContextTypes, CommandHandler
+from bson import ObjectId
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
 
-from db import get_collection
 from logging_config import logger
 from utils.db_helpers import get_user_role
 from utils.common_helpers import normalize_test_id
+from utils.result_reports import fetch_results_page, format_result_line, latest_result_id
+from utils.report_cache import get_cached_report, cache_report
+
+# Prev/Next buttons of a /results page:
+#   res:<p|n>:<page>:<end_timestamp ms, base 36>:<_id, base64>:<test_id>
+# p/n: the page before or after the row (end_timestamp, _id); test_id is
+# empty for a user's own results. Telegram allows 64 bytes of callback data.
+RESULTS_PAGE_PREFIX = 'res:'
+MAX_CALLBACK_DATA_BYTES = 64
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
 
 
 async def results_command(
@@ -46,127 +58,173 @@ async def results_command(
             f"{user_role.capitalize()} {user_id} requesting results "
             f"for test_id '{test_id}'."
         )
-
-        results_text = await _get_test_results_for_teacher(test_id, user_id, user_role)
-        if not results_text:
-             await update.message.reply_text(
-                 f"Не найдено результатов для теста '{test_id}' "
-                 f"(или у вас нет прав на их просмотр)."
-             )
-        else:
-            # Split long messages if necessary (Telegram limit is 4096 chars)
-            for chunk in _split_message(results_text):
-                 await update.message.reply_text(chunk)
+        empty_text = (
+            f"Не найдено результатов для теста '{test_id}' "
+            f"(или у вас нет прав на их просмотр)."
+        )
 
     # --- Branch 2: Any user requests their own results ---
     else:
         logger.info(f"User {user_id} requesting own results.")
-        results_text = await _get_own_results(user_id)
-        if not results_text:
-             await update.message.reply_text("У вас пока нет результатов.")
-        else:
-             for chunk in _split_message(results_text):
-                  await update.message.reply_text(chunk)
-
-
-async def _get_test_results_for_teacher(
-    test_id: str, teacher_user_id: int, teacher_role: str
-) -> str:
-    """Fetches and formats results for a specific test, checking permissions."""
-    allowed_activation_ids = []
-    try:
-        # 1. Find relevant activations
-        active_tests_coll = await get_collection('active_tests')
-        activation_filter = {'test_id': test_id}
-        # Admins see all activations for the test_id
-        # Teachers only see activations they enabled
-        if teacher_role == 'teacher':
-            activation_filter['enabled_by_user_id'] = teacher_user_id
-
-        cursor = active_tests_coll.find(activation_filter, {'_id': 1})
-        async for activation in cursor:
-            allowed_activation_ids.append(activation['_id'])
-
-        if not allowed_activation_ids:
-            logger.info(
-                f"No activations found for test '{test_id}' matching "
-                f"permissions for user {teacher_user_id} ({teacher_role})."
-            )
-            return ""
-
-        # 2. Find results for those activations
-        results_coll = await get_collection('results')
-        # Sort by username, then timestamp/attempt number for clarity
-        results_cursor = results_coll.find(
-            {'active_test_id': {'$in': allowed_activation_ids}}
-        ).sort([('username', 1), ('end_timestamp', 1)])
-
-        results_list = []
-        async for result in results_cursor:
-            username = result.get('username', 'N/A')
-            score = result.get('score', 0.0)
-            attempt = result.get('attempt_number', 1)
-            # Format timestamp nicely (adjust timezone/format as needed)
-            timestamp = result.get('end_timestamp')
-            time_str = timestamp.strftime('%Y-%m-%d %H:%M') if timestamp else 'N/A'
-
-            results_list.append(
-                f"@{username}: Попытка {attempt}, Оценка: {score:.1f}%, Завершен: {time_str}"
-            )
+        test_id = ''
+        empty_text = "У вас пока нет результатов."
 
-        if not results_list:
-            logger.info(f"No results found for allowed activations of test '{test_id}'.")
-            return ""
+    # Only the first page is read now; Prev/Next fetch the others
+    try:
+        page = await _load_page(test_id, user_id, user_role, None, True, 1)
+    except Exception as e:
+        logger.exception(f"DB error fetching results page for user {user_id} (test '{test_id}'): {e}")
+        await update.message.reply_text("Произошла ошибка при получении результатов.")
+        return
 
-        return f"📊 Результаты теста '{test_id}':\n\n" + "\n".join(results_list)
+    if page is None:
+        logger.info(f"No results found for user {user_id} ({user_role}), test '{test_id}'.")
+        await update.message.reply_text(empty_text)
+        return
+    text, reply_markup = page
+    await update.message.reply_text(text, reply_markup=reply_markup)
 
-    except Exception as e:
-        logger.exception(f"DB error fetching results for test '{test_id}' for teacher {teacher_user_id}: {e}")
-        return "Произошла ошибка при получении результатов теста."
 
+async def results_page_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """Handles the Prev/Next buttons of a /results page by editing it in place."""
+    query = update.callback_query
+    user = update.effective_user
+    await query.answer()
 
-async def _get_own_results(user_id: int) -> str:
-    """Fetches and formats results for the requesting user."""
     try:
-        results_coll = await get_collection('results')
-        results_cursor = results_coll.find({'user_id': user_id}).sort('end_timestamp', -1) # Newest first
-
-        results_list = []
-        async for result in results_cursor:
-            test_id = result.get('test_id', 'N/A')
-            score = result.get('score', 0.0)
-            attempt = result.get('attempt_number', 1)
-            timestamp = result.get('end_timestamp')
-            time_str = timestamp.strftime('%Y-%m-%d %H:%M') if timestamp else 'N/A'
-
-            results_list.append(
-                f"Тест '{test_id}': Попытка {attempt}, Оценка: {score:.1f}%, Завершен: {time_str}"
-            )
-
-        if not results_list:
-            logger.info(f"No results found for user {user_id}.")
-            return ""
+        _, direction, page_number, timestamp, result_id, test_id = query.data.split(':', 5)
+        key = (
+            _EPOCH + datetime.timedelta(milliseconds=int(timestamp, 36)),
+            ObjectId(base64.urlsafe_b64decode(result_id + '==')),
+        )
+        page_number = int(page_number)
+    except Exception:
+        logger.warning(f"Malformed results page callback from user {user.id}: {query.data!r}")
+        return
 
-        return "📈 Ваши результаты:\n\n" + "\n".join(results_list)
+    user_role = await get_user_role(user.id, user.username)
+    if test_id and user_role not in ('admin', 'teacher'):
+        logger.warning(f"User {user.id} ({user_role}) paged results of test '{test_id}' without privileges.")
+        await query.edit_message_text("Эта команда доступна только для администраторов и преподавателей.")
+        return
 
+    older = direction == 'n'
+    try:
+        page = await _load_page(
+            test_id, user.id, user_role, key, older, page_number + 1 if older else page_number - 1
+        )
     except Exception as e:
-        logger.exception(f"DB error fetching own results for user {user_id}: {e}")
-        return "Произошла ошибка при получении ваших результатов."
-
-
-def _split_message(text: str, chunk_size: int = 4000) -> list[str]:
-    """Splits a long message into chunks respecting line breaks."""
-    chunks = []
-    current_chunk = ""
-    for line in text.splitlines(keepends=True):
-        if len(current_chunk) + len(line) > chunk_size:
-            chunks.append(current_chunk)
-            current_chunk = line
-        else:
-            current_chunk += line
-    if current_chunk:
-        chunks.append(current_chunk)
-    return chunks
-
-
-results_command_handler = CommandHandler('results', results_command)
\ No newline at end of file
+        logger.exception(f"DB error fetching results page for user {user.id} (test '{test_id}'): {e}")
+        await query.edit_message_text("Произошла ошибка при получении результатов.")
+        return
+
+    if page is None:
+        # The rows beyond the button were removed since the page was sent
+        text = "Больше результатов нет."
+        if query.message is not None and query.message.text:
+            text = f"{query.message.text}\n\n{text}"
+        await query.edit_message_text(text)
+        return
+    text, reply_markup = page
+    await query.edit_message_text(text, reply_markup=reply_markup)
+
+
+async def _load_page(test_id: str, user_id: int, user_role: str,
+                     key: Optional[tuple], older: bool, page_number: int) -> Optional[tuple]:
+    """
+    Reads one page of a /results view (a user's own results when test_id
+    is empty) and renders it. Returns (text, reply_markup), or None if
+    the page is empty. Rendered pages are reused until a result in the
+    view finishes (utils.report_cache).
+    """
+    if test_id:
+        scope, owner = {'test_id': test_id}, (user_id if user_role != 'admin' else None)
+        view = ('results', test_id, owner, key, older, page_number)
+    else:
+        scope, owner = {'user_id': user_id}, None
+        view = ('results', '', user_id, key, older, page_number)
+    watermark = await latest_result_id(scope)
+    if watermark is None:
+        return None
+    page = get_cached_report(view, watermark)
+    if page is None:
+        page = await _render_page(test_id, scope, owner, key, older, page_number)
+        if page is not None:
+            cache_report(view, watermark, page)
+    return page
+
+
+async def _render_page(test_id: str, scope: dict, owner: Optional[int],
+                       key: Optional[tuple], older: bool, page_number: int) -> Optional[tuple]:
+    rows, more = await fetch_results_page(scope, owner, key, older)
+    if not rows:
+        return None
+
+    # Read forward, `more` means older rows follow; read backward, newer ones.
+    # The other direction is where the reader came from: page_number - 1
+    # when reading forward, and when reading backward the page that was
+    # shown, whose rows are older than these. Both exist because the bot
+    # never deletes finished results; if one is removed by hand, the
+    # callback reports the empty page.
+    has_prev = more if not older else page_number > 1
+    has_next = more if older else True
+
+    if test_id:
+        title = f"📊 Результаты теста '{test_id}'"
+        lines = [format_result_line(row) for row in rows]
+    else:
+        title = "📈 Ваши результаты"
+        lines = [_format_own_line(row) for row in rows]
+    text = f"{title} (стр. {page_number}):\n\n" + "\n".join(lines)
+
+    buttons = []
+    if has_prev:
+        buttons.append(('⬅️ Назад', _page_callback('p', page_number, rows[0], test_id)))
+    if has_next:
+        buttons.append(('Далее ➡️', _page_callback('n', page_number, rows[-1], test_id)))
+    if any(len(data.encode()) > MAX_CALLBACK_DATA_BYTES for _, data in buttons):
+        # Test ID too long to fit in the buttons: no paging for this view
+        text += f"\n\n… Полный список: /txt {test_id}" if has_next else ""
+        buttons = []
+    reply_markup = InlineKeyboardMarkup(
+        [[InlineKeyboardButton(label, callback_data=data) for label, data in buttons]]
+    ) if buttons else None
+    return text, reply_markup
+
+
+def _page_callback(direction: str, page_number: int, row: dict, test_id: str) -> str:
+    end_timestamp = row['end_timestamp']
+    if end_timestamp.tzinfo is None:
+        # Datetimes read back from MongoDB are naive UTC
+        end_timestamp = end_timestamp.replace(tzinfo=datetime.timezone.utc)
+    milliseconds = (end_timestamp - _EPOCH) // datetime.timedelta(milliseconds=1)
+    result_id = base64.urlsafe_b64encode(row['_id'].binary).decode().rstrip('=')
+    return (
+        f"{RESULTS_PAGE_PREFIX}{direction}:{page_number}:"
+        f"{_to_base36(milliseconds)}:{result_id}:{test_id}"
+    )
+
+
+def _to_base36(number: int) -> str:
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    encoded = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        encoded = digits[remainder] + encoded
+        if not number:
+            return encoded
+
+
+def _format_own_line(result: dict) -> str:
+    test_id = result.get('test_id', 'N/A')
+    score = result.get('score', 0.0)
+    attempt = result.get('attempt_number', 1)
+    timestamp = result.get('end_timestamp')
+    time_str = timestamp.strftime('%Y-%m-%d %H:%M') if timestamp else 'N/A'
+    return f"Тест '{test_id}': Попытка {attempt}, Оценка: {score:.1f}%, Завершен: {time_str}"
+
+
+results_command_handler = CommandHandler('results', results_command)
+results_page_handler = CallbackQueryHandler(results_page_callback, pattern=f'^{RESULTS_PAGE_PREFIX}')
@@ -3,9 +3,10 @@ import io
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 
-from db import get_collection
 from logging_config import logger
 from utils.common_helpers import normalize_test_id
+from utils.test_bank_cache import get_test_bank
+from utils.question_store import iter_questions
 
 
 async def show_command(
@@ -39,22 +40,17 @@ async def show_command(
     logger.info(f"User {user_id} requesting printable test questions for '{test_id}'.")
 
     try:
-        # 1. Fetch the test document from MongoDB
-        tests_collection = await get_collection('tests')
-        test_data = await tests_collection.find_one(
-            {'test_id': test_id},
-            {'_id': 0, 'title': 1, 'questions': 1}
-        )
+        # 1. Fetch the test bank (cached)
+        bank = await get_test_bank(test_id)
 
-        if not test_data:
+        if not bank:
             logger.warning(f"Test with ID '{test_id}' not found in DB.")
             await update.message.reply_text(f"Тест с ID '{test_id}' не найден.")
             return
 
-        questions = test_data.get('questions')
-        test_title = test_data.get('title', f"Тест {test_id}")
+        test_title = bank.title
 
-        if not questions or not isinstance(questions, list):
+        if not bank.total_questions:
             logger.warning(
                 f"Test '{test_id}' found but has no questions or invalid format."
             )
@@ -65,11 +61,11 @@ async def show_command(
 
         # 2. Generate the text content with corrected formatting
         test_lines = []
-        for i, q_data in enumerate(questions):
+        async for i, q_data in iter_questions(bank):
             question_text = q_data.get('question_text', f'Вопрос {i+1}')
             options = q_data.get('options', [])
 
-            if not isinstance(options, list):
+            if not isinstance(options, (list, tuple)):
                  logger.warning(f"Question {i+1} in test '{test_id}' has invalid options format.")
                  options_text = "[Неверный формат опций]"
             elif not options:
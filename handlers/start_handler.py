@@ -42,9 +42,13 @@ async def start_command(
 ℹ️ /help_act_test - Подробная помощь по `/act_test`.
 📊 /results <ID> - Результаты активированного теста <ID>.
 📄 /txt <ID> - Результаты теста <ID> в `.txt`.
+📉 /stats <ID> - Статистика баллов теста <ID> по активациям.
+🔄 /stats_rebuild [ID] - Пересчитать статистику из результатов.
+🔬 /item_analysis <ID> - Анализ вопросов теста <ID> (трудность, дистракторы).
 🧐 /show <ID> - Показать вопросы теста <ID> (без ответов).
 📚 /materials <ID> - Учебные материалы для теста <ID>.
 ---
+🗄️ /db_stats - Статистика пула соединений БД и кэшей.
 🆘 /help - Показать это сообщение.
 """
 
@@ -60,6 +64,8 @@ async def start_command(
 ℹ️ /help_act_test - Подробная помощь по `/act_test`.
 📊 /results <ID> - Результаты Ваших активированных тестов <ID>.
 📄 /txt <ID> - Результаты Вашего теста <ID> в `.txt`.
+📉 /stats <ID> - Статистика баллов Ваших активаций теста <ID>.
+🔬 /item_analysis <ID> - Анализ вопросов теста <ID> (трудность, дистракторы).
 🧐 /show <ID> - Показать вопросы теста <ID> (без ответов).
 📚 /materials <ID> - Учебные материалы для теста <ID>.
 ✍️ /test <ID> - Пройти активный тест <ID>.
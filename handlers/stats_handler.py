@@ -0,0 +1,143 @@
+# handlers/stats_handler.py
+
+from telegram import Update
+from telegram.ext import ContextTypes, CommandHandler
+
+from db import get_collection
+from logging_config import logger
+from utils.db_helpers import get_user_role
+from utils.common_helpers import normalize_test_id
+from utils.activation_stats import (
+    BUCKET_WIDTH, BUCKETS, combine, get_activation_stats, rebuild_activation_stats, summarize,
+)
+
+# Most recent activations shown by /stats; the total covers these
+STATS_MAX_ACTIVATIONS = 10
+HISTOGRAM_BAR_WIDTH = 10
+
+
+async def stats_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """
+    Handles /stats <test_id>: score statistics of a test per activation,
+    read from the activation_stats summaries (no scan of the results).
+    """
+    if not update.effective_user:
+        logger.warning('/stats triggered with no effective_user.')
+        return
+
+    user_id = update.effective_user.id
+    username = update.effective_user.username
+    logger.info(f"User {user_id} (@{username}) triggered /stats command.")
+
+    user_role = await get_user_role(user_id, username)
+    if user_role not in ('admin', 'teacher'):
+        logger.warning(f"User {user_id} ({user_role}) attempted /stats without privileges.")
+        await update.message.reply_text(
+            "Эта команда доступна только для администраторов и преподавателей."
+        )
+        return
+
+    if not context.args:
+        await update.message.reply_text(
+            "Пожалуйста, укажите ID теста.\nПример: `/stats math101`"
+        )
+        return
+
+    test_id = normalize_test_id(context.args[0])
+    if not test_id:
+        await update.message.reply_text("Некорректный ID теста.")
+        return
+
+    # Teachers see the activations they enabled (test_window index prefix)
+    query = {'test_id': test_id}
+    if user_role != 'admin':
+        query['enabled_by_user_id'] = user_id
+
+    try:
+        active_tests_coll = await get_collection('active_tests')
+        activations = await active_tests_coll.find(
+            query, {'start_time': 1, 'end_time': 1}
+        ).sort('activation_timestamp', -1).limit(STATS_MAX_ACTIVATIONS).to_list(length=None)
+        stats = await get_activation_stats([activation['_id'] for activation in activations])
+    except Exception as e:
+        logger.exception(f"DB error fetching stats for test '{test_id}' (user {user_id}): {e}")
+        await update.message.reply_text("Произошла ошибка при получении статистики.")
+        return
+
+    sections = []
+    for activation in activations:
+        doc = stats.get(activation['_id'])
+        if not doc or not doc.get('count'):
+            continue
+        start_str = activation['start_time'].strftime('%Y-%m-%d %H:%M')
+        end_str = activation['end_time'].strftime('%Y-%m-%d %H:%M')
+        sections.append(f"🗓 Активация {start_str} – {end_str} UTC\n" + _format_summary(summarize(doc)))
+
+    if not sections:
+        await update.message.reply_text(
+            f"Нет завершенных попыток теста '{test_id}' "
+            f"(или у вас нет прав на просмотр статистики)."
+        )
+        return
+
+    text = f"📊 Статистика теста '{test_id}'\n\n" + "\n\n".join(sections)
+    if len(sections) > 1:
+        text += "\n\nΣ Итого по показанным активациям\n" + _format_summary(summarize(combine(stats.values())))
+    await update.message.reply_text(text)
+
+
+async def stats_rebuild_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """Handles /stats_rebuild [test_id]: recomputes the summaries from the results (admins only)."""
+    if not update.effective_user:
+        logger.warning('/stats_rebuild triggered with no effective_user.')
+        return
+
+    user_id = update.effective_user.id
+    username = update.effective_user.username
+    logger.info(f"User {user_id} (@{username}) triggered /stats_rebuild command.")
+
+    user_role = await get_user_role(user_id, username)
+    if user_role != 'admin':
+        logger.warning(f"User {user_id} ({user_role}) attempted /stats_rebuild without privileges.")
+        await update.message.reply_text("Пересчет статистики доступен только администраторам.")
+        return
+
+    test_id = None
+    if context.args:
+        test_id = normalize_test_id(context.args[0])
+        if not test_id:
+            await update.message.reply_text("Некорректный ID теста.")
+            return
+
+    logger.info(f"Admin {user_id} rebuilding activation stats (test {test_id or 'all'}).")
+    try:
+        rebuilt = await rebuild_activation_stats(test_id)
+    except Exception as e:
+        logger.exception(f"Error rebuilding activation stats (test {test_id or 'all'}): {e}")
+        await update.message.reply_text("❌ Не удалось пересчитать статистику.")
+        return
+    scope = f"теста '{test_id}'" if test_id else "всех тестов"
+    await update.message.reply_text(f"✅ Статистика {scope} пересчитана ({rebuilt} активаций).")
+
+
+def _format_summary(summary: dict) -> str:
+    lines = [
+        f"Попыток: {summary['count']}",
+        f"Средний балл: {summary['mean']:.1f}% (σ {summary['stddev']:.1f})",
+        f"Медиана: ≈{summary['median']:.1f}%",
+        f"Мин./макс.: {summary['min']:.1f}% / {summary['max']:.1f}%",
+    ]
+    peak = max(summary['histogram'])
+    for bucket, count in zip(BUCKETS, summary['histogram']):
+        bar = '█' * round(count / peak * HISTOGRAM_BAR_WIDTH) if peak else ''
+        upper = int(bucket) + BUCKET_WIDTH - 1 if bucket != BUCKETS[-1] else 100
+        lines.append(f"{int(bucket):>2}–{upper:<3} {bar} {count}")
+    return "\n".join(lines)
+
+
+stats_command_handler = CommandHandler('stats', stats_command)
+stats_rebuild_command_handler = CommandHandler('stats_rebuild', stats_rebuild_command)
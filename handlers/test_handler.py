@@ -2,25 +2,151 @@
 
 import random
 import datetime
-from typing import List, Dict, Any, Tuple
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple, Optional, NamedTuple
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
-    ContextTypes, ConversationHandler, CommandHandler, CallbackQueryHandler
+    Application, ContextTypes, ConversationHandler, CommandHandler, CallbackQueryHandler,
+    TypeHandler,
 )
 from telegram.constants import ParseMode
 
-from db import get_collection
 from logging_config import logger
 from utils.common_helpers import normalize_test_id
+from utils.activation_index import get_current_activation
+from utils.test_bank_cache import get_test_bank
+from utils.question_store import sample_questions, get_questions
+from utils.user_registry import touch_user
+from utils.activation_stats import STATS_PENDING
+from db import get_collection
+from utils.attempts import reserve_attempt, release_attempt
+from utils.result_writer import (
+    open_attempt, record_answer, finalize_attempt, discard_attempt, IN_PROGRESS,
+)
+from utils.deadlines import AttemptDeadline, schedule_deadline, cancel_deadline
+from utils.send_scheduler import send_priority, INTERACTIVE
+from settings import RENDER_PLAN_CACHE_SIZE, ATTEMPT_TIME_LIMIT_MINUTES
 
 # Conversation states
-ASKING_QUESTION = range(1)
+ASKING_QUESTION, = range(1)
 
 # Callback data prefixes or constants
 ANSWER_PREFIX = 'ans_'
 CANCEL_TEST = 'cancel_test'
 
+# Session state in user_data stays small: question content is resolved from
+# the shared read-only bank (pinned by 'bank_version') whenever it is shown.
+#   question_indices: [bank index, ...] in presentation order
+#   option_orders:    one string per question; character k encodes the bank
+#                     option index shown at position k (chr(48 + index))
+#   answers:          [selected bank option index, ...] per answered question
+
+
+def _encode_order(order: List[int]) -> str:
+    return ''.join(chr(48 + i) for i in order)
+
+
+def _decode_order(order: str) -> List[int]:
+    return [ord(c) - 48 for c in order]
+
+
+class _Frame(NamedTuple):
+    """One prepared question: everything a callback needs to answer it."""
+    text: str
+    reply_markup: InlineKeyboardMarkup
+    correct_option_index: int
+
+
+# user_id -> (session key, tuple of _Frame), LRU, process-local.
+# Built once per session in test_command so answer callbacks only look up
+# the next frame. Not kept in user_data: it is derived data, rebuilt from
+# the compact session state after eviction or a restart.
+_render_plans: OrderedDict = OrderedDict()
+
+
+def _session_key(user_data: dict) -> tuple:
+    return (user_data['active_test_id'], user_data['attempt_number'], user_data['bank_version'])
+
+
+def _as_utc(value: datetime.datetime) -> datetime.datetime:
+    # Datetimes read back from MongoDB are naive UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def _build_frame(test_id: str, attempt_number: int, position: int, total: int,
+                 question, order: List[int]) -> _Frame:
+    q_text = question.get('question_text', 'Error: Missing question text')
+    options = question.get('options', ())
+
+    keyboard = []
+    row = []
+    # Options in this session's shuffled order; callback data keeps the bank index
+    for original_index in order:
+        button = InlineKeyboardButton(
+            options[original_index],
+            # Use prefix and ORIGINAL index in callback data
+            callback_data=f"{ANSWER_PREFIX}{original_index}"
+        )
+        row.append(button)
+        # Create rows of 2 buttons max
+        if len(row) == 2:
+            keyboard.append(row)
+            row = []
+    if row: # Add remaining button if odd number
+        keyboard.append(row)
+
+    # Add cancel button
+    keyboard.append([InlineKeyboardButton('❌ Отмена', callback_data=CANCEL_TEST)])
+
+    text = (
+        f"📝 *Тест: {test_id}* ({attempt_number}-я попытка)\n\n"
+        f"*Вопрос {position + 1} из {total}:*\n\n"
+        f"{q_text}"
+    )
+    return _Frame(text, InlineKeyboardMarkup(keyboard), question.get('correct_option_index', -1))
+
+
+async def _render_plan(user_id: int, user_data: dict) -> Optional[tuple]:
+    """
+    Returns the prepared frames of the user's session, building them if
+    needed. Returns None if the test was re-uploaded or deleted since the
+    session began and the plan is no longer in memory.
+    """
+    key = _session_key(user_data)
+    entry = _render_plans.get(user_id)
+    if entry is not None and entry[0] == key:
+        _render_plans.move_to_end(user_id)
+        return entry[1]
+
+    bank = await get_test_bank(user_data['test_id'])
+    if not bank or bank.version != user_data['bank_version']:
+        return None
+    indices = user_data['question_indices']
+    questions = await get_questions(bank, indices)
+    if len(questions) < len(set(indices)):
+        return None
+
+    frames = tuple(
+        _build_frame(
+            user_data['test_id'], user_data['attempt_number'], position, len(indices),
+            questions[index], _decode_order(user_data['option_orders'][position])
+        )
+        for position, index in enumerate(indices)
+    )
+    if RENDER_PLAN_CACHE_SIZE > 0:
+        _render_plans[user_id] = (key, frames)
+        _render_plans.move_to_end(user_id)
+        while len(_render_plans) > RENDER_PLAN_CACHE_SIZE:
+            _render_plans.popitem(last=False)
+    return frames
+
+
+def _drop_render_plan(user_id: int) -> None:
+    _render_plans.pop(user_id, None)
+
 
 async def test_command(
     update: Update, context: ContextTypes.DEFAULT_TYPE
@@ -31,6 +157,11 @@ async def test_command(
 
     user_id = update.effective_user.id
     username = update.effective_user.username
+    touch_user(user_id, username)
+
+    # A running attempt (e.g. restored after a restart) is resumed, not replaced
+    if 'question_indices' in context.user_data:
+        return await _resume_test(update, context)
 
     # 1. Argument check
     if not context.args:
@@ -47,14 +178,9 @@ async def test_command(
 
     logger.info(f"User {user_id} (@{username}) attempting to start test '{test_id}'.")
 
-    # 2. Find active test activation
+    # 2. Find active test activation (newest running one, from the in-memory index)
     now = datetime.datetime.now(datetime.timezone.utc)
-    active_tests_coll = await get_collection('active_tests')
-    activation = await active_tests_coll.find_one({
-        'test_id': test_id,
-        'start_time': {'$lte': now},
-        'end_time': {'$gte': now}
-    }) # Consider sorting if multiple could be active, maybe by start_time desc
+    activation = await get_current_activation(test_id)
 
     if not activation:
         logger.warning(f"No active session found for test '{test_id}' for user {user_id}.")
@@ -65,71 +191,80 @@ async def test_command(
     max_tries = activation.get('max_tries', 1)
     num_questions_to_ask = activation.get('num_questions_to_ask', 10) # Default
 
-    # 3. Check attempts
-    results_coll = await get_collection('results')
-    previous_attempts = await results_coll.count_documents({
-        'user_id': user_id,
-        'active_test_id': active_test_id
-    })
+    # 3. Reserve an attempt (atomic, so parallel /test calls can't exceed max_tries)
+    attempt_number = await reserve_attempt(user_id, activation)
 
-    if previous_attempts >= max_tries:
+    if attempt_number is None:
         logger.info(f"User {user_id} exceeded max tries ({max_tries}) for test '{test_id}' (activation {active_test_id}).")
         await update.message.reply_text(
             f"Вы уже использовали все доступные попытки ({max_tries}) для этого теста."
         )
         return ConversationHandler.END
 
-    attempt_number = previous_attempts + 1
     logger.info(f"User {user_id} starting attempt {attempt_number}/{max_tries} for test '{test_id}' (activation {active_test_id}).")
 
-    # 4. Load base test questions
-    tests_coll = await get_collection('tests')
-    base_test = await tests_coll.find_one(
-        {'test_id': test_id},
-        {'questions': 1} # Only need the questions array
-    )
+    # 4. Load base test questions (shared, read-only cached bank)
+    bank = await get_test_bank(test_id)
 
-    if not base_test or not base_test.get('questions'):
+    if not bank or not bank.total_questions:
         logger.error(f"Base test '{test_id}' not found or has no questions in DB.")
         await update.message.reply_text("Ошибка: не найдены вопросы для этого теста.")
+        await release_attempt(user_id, active_test_id)
         return ConversationHandler.END
 
-    all_questions = base_test['questions']
-    total_in_bank = len(all_questions)
-
-    if total_in_bank == 0:
+    # 5. Select questions for this session (sampled by the DB for large banks)
+    selected = await sample_questions(bank, num_questions_to_ask)
+    if not selected:
         logger.error(f"Test bank for '{test_id}' is empty.")
         await update.message.reply_text("Ошибка: в банке нет вопросов для этого теста.")
+        await release_attempt(user_id, active_test_id)
         return ConversationHandler.END
 
-    # 5. Select questions for this session
-    num_to_select = min(num_questions_to_ask, total_in_bank)
-    selected_questions_indices = random.sample(range(total_in_bank), num_to_select)
-    questions_for_session = []
-    for index in selected_questions_indices:
-         # Store original index for results reporting if needed
-         q_data = all_questions[index]
-         q_data['original_index'] = index
-         questions_for_session.append(q_data)
-
-    # Shuffle the selected questions for this session
-    random.shuffle(questions_for_session)
+    # Shuffle the selected questions and, per question, the order of options
+    random.shuffle(selected)
+    question_indices = []
+    option_orders = []
+    for index, question in selected:
+        order = list(range(len(question.get('options', ()))))
+        random.shuffle(order)
+        question_indices.append(index)
+        option_orders.append(_encode_order(order))
 
     # 6. Initialize user_data for the conversation
     context.user_data.clear() # Ensure clean state
     context.user_data['active_test_id'] = active_test_id
     context.user_data['test_id'] = test_id
-    context.user_data['questions_for_session'] = questions_for_session
+    context.user_data['bank_version'] = bank.version
+    context.user_data['question_indices'] = question_indices
+    context.user_data['option_orders'] = option_orders
     context.user_data['current_q_index'] = 0
     context.user_data['score'] = 0
-    context.user_data['answers'] = [] # To store {q_original_idx, selected_idx, correct}
+    context.user_data['answers'] = [] # Selected bank option index per question
     context.user_data['attempt_number'] = attempt_number
     context.user_data['test_start_time'] = now # Record start time
+    context.user_data['username'] = username
+    context.user_data['chat_id'] = update.effective_chat.id
+
+    # Answers are accepted until the activation closes (or the per-attempt
+    # limit runs out); then the attempt is finished automatically
+    deadline = _as_utc(activation['end_time'])
+    if ATTEMPT_TIME_LIMIT_MINUTES > 0:
+        deadline = min(deadline, now + datetime.timedelta(minutes=ATTEMPT_TIME_LIMIT_MINUTES))
+    context.user_data['deadline'] = deadline
 
     logger.debug(f"User {user_id} test session initialized: {context.user_data}")
 
-    # 7. Send the first question
-    await _send_question(update, context)
+    # 7. Prepare every question of the session, then send the first one
+    plan = await _render_plan(user_id, context.user_data)
+    if plan is None:
+        logger.error(f"Could not prepare questions of test '{test_id}' for user {user_id}.")
+        await update.message.reply_text("Ошибка при отображении вопроса.")
+        await release_attempt(user_id, active_test_id)
+        context.user_data.clear()
+        return ConversationHandler.END
+    _open_attempt_doc(user_id, context.user_data, plan)
+    schedule_deadline(user_id, update.effective_chat.id, _session_key(context.user_data), deadline)
+    await _send_question(update, context, plan[0])
     return ASKING_QUESTION
 
 
@@ -138,7 +273,17 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     query = update.callback_query
     await query.answer() # Acknowledge callback
 
-    if not context.user_data or 'questions_for_session' not in context.user_data:
+    if context.user_data and 'expired_test' in context.user_data:
+        # The deadline already finished this attempt
+        await query.edit_message_text(
+            f"⏰ Время на тест '{context.user_data['expired_test']}' истекло, "
+            f"результат сохранен. Посмотреть: /results.",
+            reply_markup=None
+        )
+        context.user_data.clear()
+        return ConversationHandler.END
+
+    if not context.user_data or 'question_indices' not in context.user_data:
         logger.warning(f"Received callback query but user_data is missing/incomplete for user {query.from_user.id}. Ending conversation.")
         await query.edit_message_text("Произошла ошибка состояния теста. Пожалуйста, начните заново с /test.")
         return ConversationHandler.END
@@ -146,6 +291,14 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     user_choice_data = query.data
     user_id = query.from_user.id
 
+    # Past the deadline (its update may still be queued behind this one):
+    # finish instead of accepting the answer or a cancellation
+    deadline = context.user_data.get('deadline')
+    if deadline and datetime.datetime.now(datetime.timezone.utc) > _as_utc(deadline):
+        await _expire_session(user_id, context.user_data, context.bot)
+        context.user_data.clear()
+        return ConversationHandler.END
+
     # Check for cancellation first
     if user_choice_data == CANCEL_TEST:
         return await _cancel_test(update, context, query)
@@ -161,18 +314,19 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
     # Get current question details
     current_q_index = context.user_data.get('current_q_index', 0)
-    questions = context.user_data['questions_for_session']
-    current_question = questions[current_q_index]
-    correct_option_index = current_question.get('correct_option_index', -1)
-    original_index = current_question.get('original_index', -1)
+    plan = await _render_plan(user_id, context.user_data)
+    if plan is None:
+        return await _abort_changed_test(update, context, query)
+    correct_option_index = plan[current_q_index].correct_option_index
 
     # Record answer
     is_correct = (chosen_option_index == correct_option_index)
-    context.user_data['answers'].append({
-        'question_index_in_bank': original_index,
-        'selected_option_index': chosen_option_index,
-        'is_correct': is_correct
-    })
+    context.user_data['answers'].append(chosen_option_index)
+    # Checkpointed to the attempt document with the next coalesced write
+    record_answer(
+        context.user_data['attempt_id'], current_q_index,
+        _answer_entry(context.user_data, current_q_index, plan)
+    )
 
     if is_correct:
         context.user_data['score'] += 1
@@ -184,73 +338,37 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     context.user_data['current_q_index'] += 1
 
     # Check if test finished
-    if context.user_data['current_q_index'] >= len(questions):
+    if context.user_data['current_q_index'] >= len(context.user_data['question_indices']):
         return await _finish_test(update, context, query)
     else:
-        # Send next question
-        await _send_question(update, context, query) # Pass query to edit message
+        # Send next (already prepared) question
+        await _send_question(update, context, plan[context.user_data['current_q_index']], query)
         return ASKING_QUESTION
 
 
-async def _send_question(update: Update, context: ContextTypes.DEFAULT_TYPE, query: Any = None):
+async def _send_question(update: Update, context: ContextTypes.DEFAULT_TYPE, frame: _Frame, query: Any = None):
     """Sends the current question or edits the message for the next question."""
-    current_q_index = context.user_data['current_q_index']
-    questions = context.user_data['questions_for_session']
-    question_data = questions[current_q_index]
-    test_id = context.user_data['test_id']
-
-    q_text = question_data.get('question_text', 'Error: Missing question text')
-    options = question_data.get('options', [])
-
-    # Shuffle options for presentation, but keep track of original indices for callback data
-    indexed_options = list(enumerate(options)) # [(0, 'OptA'), (1, 'OptB'), ...]
-    random.shuffle(indexed_options)
-
-    keyboard = []
-    row = []
-    for original_index, option_text in indexed_options:
-        button = InlineKeyboardButton(
-            option_text,
-            # Use prefix and ORIGINAL index in callback data
-            callback_data=f"{ANSWER_PREFIX}{original_index}"
-        )
-        row.append(button)
-        # Create rows of 2 buttons max
-        if len(row) == 2:
-            keyboard.append(row)
-            row = []
-    if row: # Add remaining button if odd number
-        keyboard.append(row)
-
-    # Add cancel button
-    keyboard.append([InlineKeyboardButton('❌ Отмена', callback_data=CANCEL_TEST)])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    total_questions = len(questions)
-    question_number = current_q_index + 1
-    formatted_question = (
-        f"📝 *Тест: {test_id}* ({context.user_data['attempt_number']}-я попытка)\n\n"
-        f"*Вопрос {question_number} из {total_questions}:*\n\n"
-        f"{q_text}"
-    )
+    question_number = context.user_data['current_q_index'] + 1
 
     try:
-        if query: # Edit previous message if handling a callback
-            message = await query.edit_message_text(
-                text=formatted_question,
-                reply_markup=reply_markup,
-                parse_mode=ParseMode.MARKDOWN
-            )
-            context.user_data['last_message_id'] = message.message_id
-        elif update.message: # Send new message if it's the start
-            message = await update.message.reply_text(
-                text=formatted_question,
-                reply_markup=reply_markup,
-                parse_mode=ParseMode.MARKDOWN
-            )
-            context.user_data['last_message_id'] = message.message_id
-        else:
-             logger.error("Cannot send question: No query or message context available.")
+        # Questions jump ahead of bulk sends (materials, reports)
+        with send_priority(INTERACTIVE):
+            if query: # Edit previous message if handling a callback
+                message = await query.edit_message_text(
+                    text=frame.text,
+                    reply_markup=frame.reply_markup,
+                    parse_mode=ParseMode.MARKDOWN
+                )
+                context.user_data['last_message_id'] = message.message_id
+            elif update.message: # Send new message if it's the start
+                message = await update.message.reply_text(
+                    text=frame.text,
+                    reply_markup=frame.reply_markup,
+                    parse_mode=ParseMode.MARKDOWN
+                )
+                context.user_data['last_message_id'] = message.message_id
+            else:
+                 logger.error("Cannot send question: No query or message context available.")
 
     except Exception as e:
          logger.exception(f"Error sending/editing question {question_number} for user {context._user_id}: {e}")
@@ -262,51 +380,99 @@ async def _send_question(update: Update, context: ContextTypes.DEFAULT_TYPE, que
          # Consider ending the conversation here if sending fails
 
 
-async def _finish_test(update: Update, context: ContextTypes.DEFAULT_TYPE, query: Any) -> int:
-    """Calculates results, saves them to DB, and informs the user."""
-    user_id = query.from_user.id
-    username = query.from_user.username
-    score = context.user_data['score']
-    total_questions = len(context.user_data['questions_for_session'])
-    test_id = context.user_data['test_id']
-    active_test_id = context.user_data['active_test_id']
-    attempt_number = context.user_data['attempt_number']
-    answers = context.user_data['answers']
-    start_time = context.user_data['test_start_time']
-    end_time = datetime.datetime.now(datetime.timezone.utc)
+def _answer_entry(user_data: dict, position: int, plan: Optional[tuple]) -> dict:
+    """Stored form of the answer to question `position`."""
+    selected = user_data['answers'][position]
+    return {
+        'question_index_in_bank': user_data['question_indices'][position],
+        'selected_option_index': selected,
+        'is_correct': bool(plan) and selected == plan[position].correct_option_index
+    }
+
+
+def _open_attempt_doc(user_id: int, user_data: dict, plan: Optional[tuple]) -> None:
+    """
+    Queues the in-progress attempt document of a session (with any answers
+    it already has) and remembers its _id in the session.
+    """
+    user_data['attempt_id'] = open_attempt({
+        'user_id': user_id,
+        'username': user_data.get('username'),
+        'test_id': user_data['test_id'],
+        'active_test_id': user_data['active_test_id'],
+        'attempt_number': user_data['attempt_number'],
+        # Bank version the answers' question and option indices refer to
+        'bank_version': user_data['bank_version'],
+        'total_questions': len(user_data['question_indices']),
+        'start_timestamp': user_data['test_start_time'],
+        'selected_answers': [
+            _answer_entry(user_data, position, plan) for position in range(len(user_data['answers']))
+        ],
+        # Everything needed to resume the attempt after a restart
+        'session': {
+            'bank_version': user_data['bank_version'],
+            'question_indices': user_data['question_indices'],
+            'option_orders': user_data['option_orders'],
+            'deadline': user_data.get('deadline'),
+            'chat_id': user_data.get('chat_id', user_id),
+        },
+    })
+
+
+async def _save_result(user_id: int, username: Optional[str], user_data: dict,
+                       auto_finished: bool = False) -> Tuple[int, int, str]:
+    """
+    Ends the session's deadline and render plan and finalizes its attempt
+    document. Questions left unanswered by an auto-finished attempt count as
+    wrong. Returns (correct count, total questions, percentage string).
+    """
+    score = user_data['score']
+    total_questions = len(user_data['question_indices'])
+    test_id = user_data['test_id']
+    active_test_id = user_data['active_test_id']
+    attempt_number = user_data['attempt_number']
 
     percentage = (score / total_questions) * 100 if total_questions > 0 else 0
     percentage_str = f"{percentage:.1f}"
 
     logger.info(
-        f"User {user_id} finished test '{test_id}' (activation {active_test_id}, "
-        f"attempt {attempt_number}): Score {score}/{total_questions} ({percentage_str}%)"
+        f"User {user_id} {'ran out of time on' if auto_finished else 'finished'} test '{test_id}' "
+        f"(activation {active_test_id}, attempt {attempt_number}): "
+        f"Score {score}/{total_questions} ({percentage_str}%)"
     )
 
-    # Save result to database
-    result_doc = {
-        'user_id': user_id,
+    cancel_deadline(user_id)
+    if 'attempt_id' not in user_data:
+        # Session started before attempt documents existed
+        _open_attempt_doc(user_id, user_data, await _render_plan(user_id, user_data))
+    _drop_render_plan(user_id)
+
+    # The answers are already in the attempt document (or staged for it);
+    # only the final fields are added
+    final_fields = {
         'username': username,
-        'test_id': test_id,
-        'active_test_id': active_test_id,
-        'attempt_number': attempt_number,
         'score': percentage, # Store percentage score
         'correct_count': score,
         'total_questions': total_questions,
-        'selected_answers': answers,
-        'start_timestamp': start_time,
-        'end_timestamp': end_time
+        'end_timestamp': datetime.datetime.now(datetime.timezone.utc)
     }
-    try:
-        results_coll = await get_collection('results')
-        await results_coll.insert_one(result_doc)
-        logger.info(f"Result for user {user_id}, test '{test_id}' saved to DB.")
-    except Exception as e:
-        logger.exception(f"Failed to save result to DB for user {user_id}, test '{test_id}': {e}")
-        # Inform user about the error saving?
-        await query.edit_message_text("Тест завершен, но произошла ошибка при сохранении вашего результата.")
-        context.user_data.clear()
-        return ConversationHandler.END
+    if auto_finished:
+        final_fields['auto_finished'] = True
+    # Picked up by utils.activation_stats once this write is stored
+    final_fields[STATS_PENDING] = True
+    # Batched write-behind: the student does not wait for the write, and a
+    # failed write is retried by the writer rather than lost
+    finalize_attempt(user_data['attempt_id'], len(user_data['answers']), final_fields)
+    logger.info(f"Result for user {user_id}, test '{test_id}' queued for saving.")
+    return score, total_questions, percentage_str
+
+
+async def _finish_test(update: Update, context: ContextTypes.DEFAULT_TYPE, query: Any) -> int:
+    """Calculates results, saves them to DB, and informs the user."""
+    test_id = context.user_data['test_id']
+    score, total_questions, percentage_str = await _save_result(
+        query.from_user.id, query.from_user.username, context.user_data
+    )
 
     # Inform user
     final_message = (
@@ -321,17 +487,211 @@ async def _finish_test(update: Update, context: ContextTypes.DEFAULT_TYPE, query
     return ConversationHandler.END
 
 
-async def _cancel_test(update: Update, context: ContextTypes.DEFAULT_TYPE, query: Any) -> int:
-    """Handles test cancellation."""
-    user_id = query.from_user.id
+async def _abort_changed_test(update: Update, context: ContextTypes.DEFAULT_TYPE, query: Any = None) -> int:
+    """Ends a session whose test was re-uploaded or deleted mid-attempt."""
+    user_id = update.effective_user.id
+    test_id = context.user_data.get('test_id', 'N/A')
+    logger.warning(
+        f"Test '{test_id}' changed during the attempt of user {user_id} "
+        f"(session version {context.user_data.get('bank_version')}). Ending session."
+    )
+    await release_attempt(user_id, context.user_data['active_test_id'])
+    if 'attempt_id' in context.user_data:
+        discard_attempt(context.user_data['attempt_id'])
+    cancel_deadline(user_id)
+    _drop_render_plan(user_id)
+    text = "Тест был изменён во время прохождения. Попытка не засчитана, начните заново с /test."
+    if query:
+        await query.edit_message_text(text, reply_markup=None)
+    else:
+        await update.message.reply_text(text)
+    context.user_data.clear()
+    return ConversationHandler.END
+
+
+async def _cancel_test(update: Update, context: ContextTypes.DEFAULT_TYPE, query: Any = None) -> int:
+    """Handles test cancellation (button or /cancel) and releases the attempt."""
+    user_id = update.effective_user.id
     test_id = context.user_data.get('test_id', 'N/A')
     logger.warning(f"User {user_id} cancelled test '{test_id}'.")
 
-    await query.edit_message_text(text="Тест отменен. 🚫", reply_markup=None)
+    active_test_id = context.user_data.get('active_test_id')
+    if active_test_id is not None:
+        await release_attempt(user_id, active_test_id)
+    if 'attempt_id' in context.user_data:
+        discard_attempt(context.user_data['attempt_id'])
+    cancel_deadline(user_id)
+    _drop_render_plan(user_id)
+
+    if query:
+        await query.edit_message_text(text="Тест отменен. 🚫", reply_markup=None)
+    else:
+        await update.message.reply_text("Тест отменен. 🚫")
     context.user_data.clear()
     return ConversationHandler.END
 
 
+async def _expire_session(user_id: int, user_data: dict, bot) -> None:
+    """Auto-finishes a session whose deadline passed and tells the student."""
+    test_id = user_data['test_id']
+    score, total_questions, percentage_str = await _save_result(
+        user_id, user_data.get('username'), user_data, auto_finished=True
+    )
+    text = (
+        f"⏰ Время на тест '{test_id}' истекло.\n\n"
+        f"Засчитаны данные ответы: {score} из {total_questions} ({percentage_str}%)\n\n"
+        f"Вы можете посмотреть все свои результаты командой /results."
+    )
+    chat_id = user_data.get('chat_id', user_id) # Private chat id equals the user id
+    message_id = user_data.get('last_message_id')
+    try:
+        if message_id is None:
+            raise ValueError('no question message')
+        # Replace the open question, so its buttons can't be pressed anymore
+        await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, reply_markup=None)
+    except Exception as e:
+        logger.warning(f"Could not edit last question of user {user_id} on timeout ({e}), sending a message.")
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+        except Exception as e:
+            logger.error(f"Could not notify user {user_id} about the timed out test '{test_id}': {e}")
+
+
+async def _expire_attempt(update: AttemptDeadline, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Deadline of an attempt reached (queued by utils.deadlines)."""
+    user_data = context.application.user_data.get(update.user_id)
+    if not user_data or 'question_indices' not in user_data or _session_key(user_data) != update.session_key:
+        return # Finished, cancelled or replaced meanwhile
+
+    test_id = user_data['test_id']
+    await _expire_session(update.user_id, user_data, context.bot)
+    # The conversation still waits for an answer; the marker lets the next
+    # button press (or /test) end it without another round trip to the DB
+    user_data.clear()
+    user_data['expired_test'] = test_id
+    context.application.mark_data_for_update_persistence(user_ids=update.user_id)
+
+
+async def _resume_test(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """/test during a running attempt: show its current question again."""
+    user_id = update.effective_user.id
+    test_id = context.user_data['test_id']
+    if context.args and normalize_test_id(context.args[0]) != test_id:
+        await update.message.reply_text(
+            f"Вы уже проходите тест '{test_id}'. "
+            f"Завершите его или отмените командой /cancel."
+        )
+        return ASKING_QUESTION
+
+    plan = await _render_plan(user_id, context.user_data)
+    if plan is None:
+        return await _abort_changed_test(update, context)
+    logger.info(f"User {user_id} resumed test '{test_id}' at question {context.user_data['current_q_index'] + 1}.")
+    await _send_question(update, context, plan[context.user_data['current_q_index']])
+    return ASKING_QUESTION
+
+
+def _session_from_doc(doc: dict) -> dict:
+    """Rebuilds the user_data session of an in-progress attempt document."""
+    session = doc['session']
+    answers = doc.get('selected_answers', [])
+    user_data = {
+        'active_test_id': doc['active_test_id'],
+        'test_id': doc['test_id'],
+        'bank_version': session['bank_version'],
+        'question_indices': session['question_indices'],
+        'option_orders': session['option_orders'],
+        'current_q_index': len(answers),
+        'score': sum(1 for answer in answers if answer.get('is_correct')),
+        'answers': [answer['selected_option_index'] for answer in answers],
+        'attempt_number': doc['attempt_number'],
+        'test_start_time': doc['start_timestamp'],
+        'username': doc.get('username'),
+        'chat_id': session.get('chat_id', doc['user_id']),
+        'attempt_id': doc['_id'],
+    }
+    if session.get('deadline') is not None:
+        user_data['deadline'] = session['deadline']
+    return user_data
+
+
+async def restore_test_sessions(application: Application) -> int:
+    """
+    Brings running attempts back after a restart. Persisted sessions and
+    in-progress attempt documents are reconciled (whichever has more answers
+    wins), attempts whose session was lost get it rebuilt (resumed with
+    /test), fully answered ones are finalized, and deadlines are scheduled.
+    Returns the number of running attempts.
+    """
+    results_coll = await get_collection('results')
+    docs = {}
+    async for doc in results_coll.find({'status': IN_PROGRESS}):
+        docs[doc['_id']] = doc
+
+    sessions = {
+        user_id: user_data for user_id, user_data in application.user_data.items()
+        if 'question_indices' in user_data
+    }
+    unknown = [
+        user_data['attempt_id'] for user_data in sessions.values()
+        if 'attempt_id' in user_data and user_data['attempt_id'] not in docs
+    ]
+    finalized = set()
+    if unknown:
+        async for doc in results_coll.find({'_id': {'$in': unknown}}, {'_id': 1}):
+            finalized.add(doc['_id'])
+
+    for user_id, user_data in sessions.items():
+        attempt_id = user_data.get('attempt_id')
+        doc = docs.pop(attempt_id, None)
+        if attempt_id in finalized:
+            # Finished right before the restart; only the session was not cleared yet
+            user_data.clear()
+            application.mark_data_for_update_persistence(user_ids=user_id)
+        elif doc is None:
+            # Started before its document was written (or before documents existed)
+            _open_attempt_doc(user_id, user_data, await _render_plan(user_id, user_data))
+        else:
+            written = doc.get('answered', 0)
+            answered = len(user_data['answers'])
+            if answered > written:
+                # Answers still waiting for their checkpoint when the bot stopped
+                plan = await _render_plan(user_id, user_data)
+                for position in range(written, answered):
+                    record_answer(attempt_id, position, _answer_entry(user_data, position, plan))
+            elif written > answered:
+                # The persisted session is older than the checkpoint
+                user_data.update(_session_from_doc(doc))
+
+    # Attempts whose session was lost with the process
+    for doc in docs.values():
+        user_data = application.user_data[doc['user_id']]
+        if 'question_indices' in user_data:
+            logger.warning(f"Attempt {doc['_id']} of user {doc['user_id']} was replaced by another session, finishing it.")
+            await _save_result(doc['user_id'], doc.get('username'), _session_from_doc(doc), auto_finished=True)
+        else:
+            user_data.clear()
+            user_data.update(_session_from_doc(doc))
+
+    running = 0
+    for user_id, user_data in application.user_data.items():
+        if 'question_indices' not in user_data:
+            continue
+        application.mark_data_for_update_persistence(user_ids=user_id)
+        if len(user_data['answers']) >= len(user_data['question_indices']):
+            # Every question answered, the finish was lost
+            await _save_result(user_id, user_data.get('username'), user_data)
+            user_data.clear()
+            continue
+        if 'deadline' in user_data:
+            schedule_deadline(
+                user_id, user_data.get('chat_id', user_id), _session_key(user_data),
+                _as_utc(user_data['deadline'])
+            )
+        running += 1
+    return running
+
+
 # Define the ConversationHandler
 test_conversation_handler = ConversationHandler(
     entry_points=[CommandHandler('test', test_command)],
@@ -342,10 +702,15 @@ test_conversation_handler = ConversationHandler(
     },
     fallbacks=[
         CommandHandler('cancel', _cancel_test), # Allow cancelling via command too
+        CommandHandler('test', test_command), # Resumes the running attempt
         # Add other fallbacks if needed (e.g., unexpected text messages)
     ],
-    # Optional: define how conversation data is stored (default is memory)
-    # persistent=False, # Or use a different storage backend if needed
+    # In-flight tests survive restarts (see utils.mongo_persistence)
+    name='test_conversation',
+    persistent=True,
     # Allow re-entry if user starts /test again while in conversation?
     # allow_reentry=True # Be careful with state if allowing re-entry
-)
\ No newline at end of file
+)
+
+# Auto-finishes attempts whose deadline passed (see utils.deadlines)
+test_deadline_handler = TypeHandler(AttemptDeadline, _expire_attempt)
@@ -1,13 +1,18 @@
-import io
-import datetime
-
-from telegram import Update
+from telegram import InputFile, Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes, CommandHandler
 
-from db import get_collection
 from logging_config import logger
 from utils.db_helpers import get_user_role
 from utils.common_helpers import normalize_test_id
+from utils.result_reports import iter_test_results, latest_result_id, spool_report
+from utils.report_cache import get_cached_report, cache_report, invalidate_report
+
+
+def _report_header(test_id: str) -> str:
+    """Title of the /txt report, underlined; result lines follow."""
+    title = f"Результаты теста '{test_id}'"
+    return title + "\n" + "=" * len(title) + "\n\n"
 
 
 async def txt_command(
@@ -50,68 +55,49 @@ async def txt_command(
 
     logger.info(f"{user_role.capitalize()} {user_id} requesting TXT results for '{test_id}'.")
 
-    # 3. Fetch results (using similar logic as _get_test_results_for_teacher)
-    allowed_activation_ids = []
-    results_list = []
+    # 3. Nothing finished since this report was last sent to someone with
+    # the same scope: Telegram already has the document, send its file_id
+    view = ('txt', test_id, user_id if user_role != 'admin' else None)
+    report = None
     try:
-        # Find relevant activations based on permissions
-        active_tests_coll = await get_collection('active_tests')
-        activation_filter = {'test_id': test_id}
-        if user_role == 'teacher':
-            activation_filter['enabled_by_user_id'] = user_id
-
-        cursor = active_tests_coll.find(activation_filter, {'_id': 1})
-        async for activation in cursor:
-            allowed_activation_ids.append(activation['_id'])
-
-        if not allowed_activation_ids:
-            logger.info(
-                f"No activations found for test '{test_id}' matching permissions "
-                f"for user {user_id} ({user_role})."
-            )
-            await update.message.reply_text(
+        watermark = await latest_result_id({'test_id': test_id})
+        file_id = get_cached_report(view, watermark)
+        if file_id is not None:
+            try:
+                await update.message.reply_document(document=file_id)
+                logger.info(f"Re-sent cached TXT results for test '{test_id}' to user {user_id}.")
+                return
+            except BadRequest as e:
+                logger.warning(f"Cached TXT file_id for test '{test_id}' rejected ({e}); regenerating.")
+                invalidate_report(view)
+
+        # 4. Stream results into the report file as the cursor yields them
+        # (one aggregation shared with /results <test_id>)
+        report, count = await spool_report(
+            _report_header(test_id), iter_test_results(test_id, user_id, user_role)
+        )
+
+        if not count:
+             logger.info(
+                 f"No results found for test '{test_id}' matching permissions "
+                 f"for user {user_id} ({user_role})."
+             )
+             await update.message.reply_text(
                  f"Не найдено результатов для теста '{test_id}' "
                  f"(или у вас нет прав на их просмотр)."
-            )
-            return
-
-        # Find results for those activations
-        results_coll = await get_collection('results')
-        results_cursor = results_coll.find(
-            {'active_test_id': {'$in': allowed_activation_ids}}
-        ).sort([('username', 1), ('end_timestamp', 1)]) # Sort for consistency
-
-        async for result in results_cursor:
-             res_username = result.get('username', 'N/A')
-             score = result.get('score', 0.0)
-             attempt = result.get('attempt_number', 1)
-             timestamp = result.get('end_timestamp')
-             time_str = timestamp.strftime('%Y-%m-%d %H:%M') if timestamp else 'N/A'
-             results_list.append(
-                 f"@{res_username}: Попытка {attempt}, Оценка: {score:.1f}%, Завершен: {time_str}"
              )
-
-        if not results_list:
-             logger.info(f"No results found for allowed activations of test '{test_id}'.")
-             await update.message.reply_text(f"Не найдено результатов для теста '{test_id}'.")
              return
 
-        # 4. Generate TXT content
-        file_content = f"Результаты теста '{test_id}'\n"
-        file_content += "=" * (len(file_content) -1) + "\n\n" # Underline
-        file_content += "\n".join(results_list)
-
-        # 5. Create in-memory file
-        txt_buffer = io.StringIO()
-        txt_buffer.write(file_content)
-        txt_buffer.seek(0)
-
-        # 6. Send document
+        # 5. Send document straight from the spooled file: with
+        # read_file_handle=False the upload streams it in chunks instead of
+        # reading it into memory first (and seeks back to 0 on a retry)
         file_name = f'results_{test_id}.txt'
-        await update.message.reply_document(
-            document=txt_buffer, filename=file_name
+        sent = await update.message.reply_document(
+            document=InputFile(report, filename=file_name, read_file_handle=False)
         )
-        logger.info(f"Sent TXT results for test '{test_id}' to user {user_id}.")
+        if sent is not None and sent.document is not None:
+            cache_report(view, watermark, sent.document.file_id)
+        logger.info(f"Sent TXT results for test '{test_id}' ({count} rows) to user {user_id}.")
 
     except Exception as e:
         logger.exception(
@@ -120,6 +106,9 @@ async def txt_command(
         await update.message.reply_text(
             "Произошла ошибка при получении результатов теста."
         )
+    finally:
+        if report is not None:
+            report.close()
 
 
 txt_command_handler = CommandHandler('txt', txt_command)
\ No newline at end of file
@@ -14,7 +14,8 @@ from telegram.ext import (
 from db import get_collection
 from logging_config import logger
 from utils.db_helpers import get_user_role
-from utils.common_helpers import normalize_test_id
+from utils.common_helpers import normalize_test_id, parse_question_row
+from utils.question_store import store_test_bank
 
 # Define states
 UPLOAD_TYPE, UPLOAD_FILE = range(2) # UPLOAD_TYPE determines mode
@@ -156,6 +157,23 @@ async def handle_file_upload(
         return ConversationHandler.END
 
 
+def _row_problem_message(line_num: int, row: list, problem: str) -> str:
+    """Message for the uploader about a skipped CSV row (see parse_question_row)."""
+    if problem == 'columns':
+        return (f"⚠️ Строка {line_num}: Ожидалось 6 колонок (Вопрос;ПравильныйОтвет;"
+                f"Опция1;Опция2;Опция3;Опция4), найдено {len(row)}. Строка пропущена.")
+    if problem == 'question':
+        return f"⚠️ Строка {line_num}: Текст вопроса (1-я колонка) не может быть пустым. Строка пропущена."
+    if problem == 'correct':
+        return f"⚠️ Строка {line_num}: Текст правильного ответа (2-я колонка) не может быть пустым. Строка пропущена."
+    if problem == 'options':
+        return (f"⚠️ Строка {line_num}: Все 4 варианта ответа (колонки 3-6) должны быть заполнены. "
+                "Строка пропущена.")
+    options_texts = [s.strip() for s in row[2:6]]
+    return (f"⚠️ Строка {line_num}: Текст правильного ответа из 2-й колонки ('{row[1].strip()}') "
+            f"не найден среди 4-х вариантов ответа ({', '.join(options_texts)}). Строка пропущена.")
+
+
 async def _handle_test_csv_upload(update: Update, context: ContextTypes.DEFAULT_TYPE, file_name: str, tg_file_id: str, user_id: int) -> int:
     """Processes an uploaded CSV file intended as a test bank."""
     match = re.match(r'^test.*\.csv$', file_name, re.IGNORECASE)
@@ -207,54 +225,13 @@ async def _handle_test_csv_upload(update: Update, context: ContextTypes.DEFAULT_
             if not row or not row[0].strip(): # Skip empty lines or lines with no question
                 continue
             
-            # Validate column count: Expecting Question;CorrectText;Opt1;Opt2;Opt3;Opt4 (6 columns)
-            if len(row) != 6:
-                msg = (f"⚠️ Строка {line_num}: Ожидалось 6 колонок (Вопрос;ПравильныйОтвет;"
-                       f"Опция1;Опция2;Опция3;Опция4), найдено {len(row)}. Строка пропущена.")
+            question, problem = parse_question_row(row)
+            if problem is not None:
+                msg = _row_problem_message(line_num, row, problem)
                 logger.warning(f"Test '{test_id}' CSV: {msg} Content: {row}")
                 await update.message.reply_text(msg)
                 continue
-
-            question_text = row[0].strip()
-            correct_answer_text = row[1].strip()
-            # These are the 4 options for the user
-            options_texts = [s.strip() for s in row[2:6]] 
-
-            # --- Validations ---
-            if not question_text:
-                msg = f"⚠️ Строка {line_num}: Текст вопроса (1-я колонка) не может быть пустым. Строка пропущена."
-                logger.warning(f"Test '{test_id}' CSV: {msg} Content: {row}")
-                await update.message.reply_text(msg)
-                continue
-            
-            if not correct_answer_text:
-                msg = f"⚠️ Строка {line_num}: Текст правильного ответа (2-я колонка) не может быть пустым. Строка пропущена."
-                logger.warning(f"Test '{test_id}' CSV: {msg} Content: {row}")
-                await update.message.reply_text(msg)
-                continue
-
-            if any(not opt for opt in options_texts):
-                msg = (f"⚠️ Строка {line_num}: Все 4 варианта ответа (колонки 3-6) должны быть заполнены. "
-                       "Строка пропущена.")
-                logger.warning(f"Test '{test_id}' CSV: {msg} Content: {row}")
-                await update.message.reply_text(msg)
-                continue
-            
-            # Find the index of the correct_answer_text within the 4 options_texts
-            try:
-                correct_option_idx = options_texts.index(correct_answer_text)
-            except ValueError:
-                msg = (f"⚠️ Строка {line_num}: Текст правильного ответа из 2-й колонки ('{correct_answer_text}') "
-                       f"не найден среди 4-х вариантов ответа ({', '.join(options_texts)}). Строка пропущена.")
-                logger.warning(f"Test '{test_id}' CSV: {msg} Content: {row}")
-                await update.message.reply_text(msg)
-                continue
-            
-            questions_data.append({
-                'question_text': question_text,
-                'options': options_texts,  # Store the 4 options
-                'correct_option_index': correct_option_idx 
-            })
+            questions_data.append(question)
 
         if not questions_data:
             logger.warning(f"No valid questions found in CSV for test '{test_id}'.")
@@ -270,24 +247,13 @@ async def _handle_test_csv_upload(update: Update, context: ContextTypes.DEFAULT_
         await update.message.reply_text(f"❌ Произошла ошибка при обработке CSV файла: {e}")
         return ConversationHandler.END # End conversation on unexpected error
 
-    # 3. Update Database (Upsert)
+    # 3. Update Database (Upsert). Storage mode (embedded array or one
+    # document per question) is chosen by the question store.
     try:
-        tests_collection = await get_collection('tests')
-        utc_now = datetime.datetime.now(datetime.timezone.utc)
-
-        set_data = {
-            'questions': questions_data,
-            'total_questions': len(questions_data),
-            'uploaded_by_user_id': user_id,
-            'upload_timestamp': utc_now,
-            'title': f"Тест {test_id}" 
-        }
-        set_on_insert_data = {'test_id': test_id}
-
-        update_result = await tests_collection.update_one(
-            {'test_id': test_id},
-            {'$set': set_data, '$setOnInsert': set_on_insert_data},
-            upsert=True
+        update_result = await store_test_bank(
+            test_id,
+            questions_data,
+            {'uploaded_by_user_id': user_id, 'title': f"Тест {test_id}"}
         )
 
         num_q = len(questions_data)
@@ -366,4 +332,6 @@ upload_command_handler = ConversationHandler(
         ],
     },
     fallbacks=[CommandHandler('cancel', cancel_upload)],
+    name='upload_conversation',
+    persistent=True,
 )
\ No newline at end of file
@@ -6,9 +6,21 @@ import logging # For initial configuration if needed, though logging_config hand
 from telegram.ext import Application, ConversationHandler # Added ConversationHandler for isinstance
 from logging_config import logger
 
-from settings import TOKEN
+from settings import (
+    TOKEN, BOT_MODE, POLL_INTERVAL_SECONDS, MAX_CONCURRENT_UPDATES,
+    SEND_GLOBAL_RATE, SEND_PER_CHAT_RATE, SEND_PER_CHAT_BURST,
+    SEND_GROUP_RATE_PER_MINUTE, SEND_MAX_RETRIES, TELEGRAM_API_BASE_URL,
+)
 from db import connect_db, close_db
 from utils.seed import seed_initial_data
+from utils.user_registry import start_user_registry, stop_user_registry
+from utils.result_writer import start_result_writer, stop_result_writer
+from utils.activation_stats import start_activation_stats, stop_activation_stats
+from utils.mongo_persistence import MongoPersistence
+from utils.webhook_server import start_webhook, stop_webhook
+from utils.update_processor import UserSerializingUpdateProcessor
+from utils.send_scheduler import PrioritySendScheduler
+from utils.deadlines import start_deadlines, stop_deadlines
 
 # Import all your handlers
 from handlers.activate_handler import activate_test_command_handler
@@ -19,6 +31,7 @@ from handlers.admin_handler import (
     list_admins_command_handler,
     remove_teacher_command_handler,
     delete_test_command_handler,
+    db_stats_command_handler,
 )
 from handlers.error_handler import error_handler
 from handlers.list_handler import list_teachers_command_handler
@@ -30,8 +43,12 @@ from handlers.materials_handler import materials_command_handler
 from handlers.show_handler import show_command_handler
 from handlers.start_handler import start_command_handler, help_command_handler
 from handlers.help_handler import help_act_test_command_handler
-from handlers.results_handler import results_command_handler
-from handlers.test_handler import test_conversation_handler
+from handlers.item_analysis_handler import item_analysis_command_handler
+from handlers.results_handler import results_command_handler, results_page_handler
+from handlers.test_handler import (
+    test_conversation_handler, test_deadline_handler, restore_test_sessions,
+)
+from handlers.stats_handler import stats_command_handler, stats_rebuild_command_handler
 from handlers.txt_handler import txt_command_handler
 
 HANDLERS = [
@@ -41,10 +58,98 @@ HANDLERS = [
     upload_command_handler, download_command_handler, list_tests_command_handler,
     show_command_handler, materials_command_handler, results_command_handler,
     txt_command_handler, test_conversation_handler, start_command_handler,
-    help_command_handler, help_act_test_command_handler, message_handler,
+    help_command_handler, help_act_test_command_handler, db_stats_command_handler,
+    message_handler, test_deadline_handler, results_page_handler, stats_command_handler,
+    stats_rebuild_command_handler, item_analysis_command_handler,
 ]
 
 
+def build_application() -> Application:
+    """Builds the Application with persistence, update processor, rate limiter and all HANDLERS."""
+    # Sessions are persisted to MongoDB; users are processed concurrently,
+    # each user's updates in order; all sends go through the priority-aware
+    # rate limiter
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .persistence(MongoPersistence())
+        .concurrent_updates(UserSerializingUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .rate_limiter(PrioritySendScheduler(
+            global_rate=SEND_GLOBAL_RATE,
+            per_chat_rate=SEND_PER_CHAT_RATE,
+            per_chat_burst=SEND_PER_CHAT_BURST,
+            group_rate_per_minute=SEND_GROUP_RATE_PER_MINUTE,
+            max_retries=SEND_MAX_RETRIES,
+        ))
+    )
+    if TELEGRAM_API_BASE_URL:
+        # Self-hosted Bot API server (or the local stand-in of benchmarks/load_test.py)
+        builder = (
+            builder
+            .base_url(f'{TELEGRAM_API_BASE_URL}/bot')
+            .base_file_url(f'{TELEGRAM_API_BASE_URL}/file/bot')
+        )
+    app = builder.build()
+
+    # Register handlers
+    logger.info('Adding handlers...')
+    for handler_obj in HANDLERS:
+        app.add_handler(handler_obj)
+        h_name = getattr(handler_obj, '__name__', type(handler_obj).__name__)
+        callback_func = getattr(handler_obj, 'callback', None)
+        
+        if callable(callback_func):
+            callback_name = callback_func.__name__
+        elif isinstance(handler_obj, ConversationHandler):
+            entry_points_info = []
+            if handler_obj.entry_points:
+                for entry_handler in handler_obj.entry_points:
+                    entry_callback = getattr(entry_handler, 'callback', None)
+                    if callable(entry_callback):
+                        entry_points_info.append(entry_callback.__name__)
+            callback_name = f"ConversationHandler (entries: {', '.join(entry_points_info) or 'N/A'})"
+        else:
+            callback_name = "N/A"
+        logger.info(f'-> Added handler: {h_name} (Callback: {callback_name})')
+
+    app.add_error_handler(error_handler)
+    logger.info('Error handler added.')
+    return app
+
+
+async def start_application(app: Application) -> None:
+    """Initializes the Application, restores running attempts and starts receiving updates."""
+    logger.warning(f'Bot initialization complete. Starting application ({BOT_MODE})...')
+    await app.initialize()
+    # Running attempts continue where they were (persistence + checkpoints)
+    start_deadlines(app)
+    restored = await restore_test_sessions(app)
+    logger.info(f'Restored {restored} running test attempt(s).')
+    if BOT_MODE == 'webhook':
+        await app.start()  # Consume the update queue before accepting updates
+        await start_webhook(app)
+    else:
+        # Pass poll_interval to start_polling, not run_polling
+        await app.updater.start_polling(poll_interval=POLL_INTERVAL_SECONDS)
+        await app.start()  # Start processing updates
+
+
+async def stop_application(app: Application) -> None:
+    """Stops receiving and processing updates and shuts the Application down."""
+    logger.info("Stopping Telegram bot components...")
+    await stop_deadlines()
+    await stop_webhook()
+    if app.updater and app.updater.running:
+        await app.updater.stop()
+        logger.info("Updater stopped.")
+    if app.running: # Check if application's main processing loop was started
+        await app.stop()
+        logger.info("Application processor stopped.")
+    # Shutdown should be safe to call even if not fully initialized/started
+    await app.shutdown()
+    logger.info("Application shutdown complete.")
+
+
 async def main():
     logger.warning('Initializing bot application...')
     app: Application | None = None  # For use in the finally block
@@ -52,40 +157,12 @@ async def main():
     try:
         await connect_db()
         await seed_initial_data()
+        start_user_registry()
+        start_result_writer()
+        start_activation_stats()
 
-        # Build the application
-        app = Application.builder().token(TOKEN).build()
-
-        # Register handlers
-        logger.info('Adding handlers...')
-        for handler_obj in HANDLERS:
-            app.add_handler(handler_obj)
-            h_name = getattr(handler_obj, '__name__', type(handler_obj).__name__)
-            callback_func = getattr(handler_obj, 'callback', None)
-            
-            if callable(callback_func):
-                callback_name = callback_func.__name__
-            elif isinstance(handler_obj, ConversationHandler):
-                entry_points_info = []
-                if handler_obj.entry_points:
-                    for entry_handler in handler_obj.entry_points:
-                        entry_callback = getattr(entry_handler, 'callback', None)
-                        if callable(entry_callback):
-                            entry_points_info.append(entry_callback.__name__)
-                callback_name = f"ConversationHandler (entries: {', '.join(entry_points_info) or 'N/A'})"
-            else:
-                callback_name = "N/A"
-            logger.info(f'-> Added handler: {h_name} (Callback: {callback_name})')
-
-        app.add_error_handler(error_handler)
-        logger.info('Error handler added.')
-
-        # Initialize and start the bot
-        logger.warning('Bot initialization complete. Starting application...')
-        await app.initialize()
-        # Pass poll_interval to start_polling, not run_polling
-        await app.updater.start_polling(poll_interval=2) 
-        await app.start()  # Start processing updates
+        app = build_application()
+        await start_application(app)
 
         print('Бот запущен и работает... Нажмите Ctrl+C для остановки.')
         logger.info("Bot is now running. Press Ctrl-C to stop.")
@@ -104,17 +181,11 @@ async def main():
     finally:
         logger.info("Initiating shutdown sequence...")
         if app:
-            logger.info("Stopping Telegram bot components...")
-            if app.updater and app.updater.running:
-                await app.updater.stop()
-                logger.info("Updater stopped.")
-            if app.running: # Check if application's main processing loop was started
-                await app.stop()
-                logger.info("Application processor stopped.")
-            # Shutdown should be safe to call even if not fully initialized/started
-            await app.shutdown()
-            logger.info("Application shutdown complete.")
+            await stop_application(app)
         
+        await stop_result_writer()
+        await stop_activation_stats()
+        await stop_user_registry()
         logger.info("Closing database connection...")
         await close_db()
         logger.info("Shutdown sequence finished.")
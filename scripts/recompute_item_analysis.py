@@ -0,0 +1,44 @@
+# scripts/recompute_item_analysis.py
+#
+# Offline recomputation of the cached all-activations item analysis
+# (utils.item_analysis), e.g. after a bulk import of results. Uses the
+# database configured in .env, like the bot.
+#
+# Run from the project root:
+#   python scripts/recompute_item_analysis.py <test_id> [...] [--numpy]
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connect_db, close_db  # noqa: E402
+from utils.item_analysis import analyze_test  # noqa: E402
+
+
+async def recompute(test_ids: list, use_numpy: bool) -> None:
+    await connect_db()
+    try:
+        for test_id in test_ids:
+            analysis = await analyze_test(test_id, refresh=True, use_numpy=use_numpy)
+            if analysis is None:
+                print(f"{test_id}: no such test")
+            else:
+                print(f"{test_id}: v{analysis['version']}, {len(analysis['items'])} question(s), "
+                      f"{analysis['attempts']} attempt(s)")
+    finally:
+        await close_db()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Recompute the cached item analysis of tests.')
+    parser.add_argument('test_ids', nargs='+')
+    parser.add_argument('--numpy', action='store_true', help='vectorized computation (requires NumPy)')
+    args = parser.parse_args()
+    asyncio.run(recompute(args.test_ids, args.numpy))
+
+
+if __name__ == '__main__':
+    main()
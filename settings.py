@@ -1,6 +1,7 @@
 # settings.py
 
 import os
+import re
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -9,6 +10,35 @@ load_dotenv()
 # --- Core Bot Settings ---
 TOKEN = os.getenv('TOKEN')
 BOT_USERNAME = os.getenv('BOT_USERNAME')
+# Self-hosted Bot API server, e.g. http://localhost:8081 (empty = api.telegram.org)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', '').rstrip('/')
+
+# --- Update Ingestion ---
+# 'polling' (getUpdates loop) or 'webhook' (embedded HTTP listener)
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+POLL_INTERVAL_SECONDS = os.getenv('POLL_INTERVAL_SECONDS', '2')
+# Updates of different users processed in parallel; one user's updates
+# always run in order
+MAX_CONCURRENT_UPDATES = os.getenv('MAX_CONCURRENT_UPDATES', '32')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = os.getenv('WEBHOOK_PORT', '8443')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_HEALTH_PATH = os.getenv('WEBHOOK_HEALTH_PATH', '/healthz')
+# Public HTTPS base URL Telegram posts to (e.g. https://bot.example.com).
+# Empty: the listener runs but setWebhook is not called (local testing).
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+# Sent by Telegram in X-Telegram-Bot-Api-Secret-Token; 1-256 of A-Z a-z 0-9 _ -
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')
+# Parallel HTTPS connections Telegram may open to the listener (1-100)
+WEBHOOK_MAX_CONNECTIONS = os.getenv('WEBHOOK_MAX_CONNECTIONS', '40')
+
+# --- Outbound Send Scheduler (Telegram flood limits) ---
+SEND_GLOBAL_RATE = os.getenv('SEND_GLOBAL_RATE', '30') # requests per second
+SEND_PER_CHAT_RATE = os.getenv('SEND_PER_CHAT_RATE', '1') # per private chat, per second
+SEND_PER_CHAT_BURST = os.getenv('SEND_PER_CHAT_BURST', '3')
+SEND_GROUP_RATE_PER_MINUTE = os.getenv('SEND_GROUP_RATE_PER_MINUTE', '20')
+# Retries of a request rejected with RetryAfter
+SEND_MAX_RETRIES = os.getenv('SEND_MAX_RETRIES', '3')
 
 # --- Administrator Identification ---
 # Username for reference/display purposes
@@ -20,6 +50,92 @@ ADMIN_USER_ID = os.getenv('ADMIN_USER_ID')
 MONGO_URI = os.getenv('MONGO_URI')
 MONGO_DB_NAME = os.getenv('MONGO_DB_NAME')
 
+# --- MongoDB Connection Pool ---
+# 0 keeps the driver default (no idle limit / wait forever for a connection)
+MONGO_MAX_POOL_SIZE = os.getenv('MONGO_MAX_POOL_SIZE', '100')
+MONGO_MIN_POOL_SIZE = os.getenv('MONGO_MIN_POOL_SIZE', '0')
+MONGO_MAX_IDLE_TIME_MS = os.getenv('MONGO_MAX_IDLE_TIME_MS', '0')
+MONGO_WAIT_QUEUE_TIMEOUT_MS = os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '0')
+# Comma-separated, in order of preference: zstd, snappy, zlib.
+# zstd and snappy need the zstandard / python-snappy packages installed.
+MONGO_COMPRESSORS = [
+    c.strip().lower()
+    for c in os.getenv('MONGO_COMPRESSORS', '').split(',') if c.strip()
+]
+# Per-collection read preference and write concern, e.g.
+# "users=primary/majority". Reads of 'results' must see the latest writes,
+# so it only accepts 'primary' (or a write concern alone: "results=/1").
+MONGO_COLLECTION_PROFILES = os.getenv('MONGO_COLLECTION_PROFILES', '')
+
+# --- Caching ---
+# Roles change rarely; role changes made through the bot invalidate at once
+ROLE_CACHE_TTL_SECONDS = os.getenv('ROLE_CACHE_TTL_SECONDS', '300')
+ROLE_CACHE_MAX_SIZE = os.getenv('ROLE_CACHE_MAX_SIZE', '10000')
+
+# --- Test Bank Cache (parsed question banks shared by /test, /show, /download) ---
+TEST_BANK_CACHE_SIZE = os.getenv('TEST_BANK_CACHE_SIZE', '32')
+# Cached banks are checked against the stored version at most this often
+TEST_BANK_CACHE_REVALIDATE_SECONDS = os.getenv('TEST_BANK_CACHE_REVALIDATE_SECONDS', '10')
+
+# --- Question Storage ---
+# 'embedded' keeps the questions array in the tests document, 'collection'
+# stores one document per question (sampled by the DB), 'auto' switches to
+# 'collection' for banks of at least QUESTION_COLLECTION_THRESHOLD questions.
+QUESTION_STORAGE_MODE = os.getenv('QUESTION_STORAGE_MODE', 'embedded').lower()
+QUESTION_COLLECTION_THRESHOLD = os.getenv('QUESTION_COLLECTION_THRESHOLD', '1000')
+# Individual questions of 'collection' banks kept in memory
+QUESTION_CACHE_SIZE = os.getenv('QUESTION_CACHE_SIZE', '5000')
+# Prepared question messages (text + keyboard) of running /test sessions
+RENDER_PLAN_CACHE_SIZE = os.getenv('RENDER_PLAN_CACHE_SIZE', '5000')
+# Attempts are auto-finished when the activation ends, or this many minutes
+# after they started if that comes first (0 = only the activation end)
+ATTEMPT_TIME_LIMIT_MINUTES = os.getenv('ATTEMPT_TIME_LIMIT_MINUTES', '0')
+
+# --- Activation Index (in-memory view of active_tests) ---
+# Poll for new activations at most this often; fully reload to pick up
+# deactivations made by other processes. The poll only sees new
+# activations: an end_time change or deletion made by another process
+# takes effect here after up to ACTIVATION_INDEX_FULL_RELOAD_SECONDS
+# (this process's own /act_test changes apply at once).
+ACTIVATION_INDEX_POLL_SECONDS = os.getenv('ACTIVATION_INDEX_POLL_SECONDS', '5')
+ACTIVATION_INDEX_FULL_RELOAD_SECONDS = os.getenv('ACTIVATION_INDEX_FULL_RELOAD_SECONDS', '300')
+
+# --- User Registry (write-behind user upserts) ---
+USER_REGISTRY_FLUSH_MS = os.getenv('USER_REGISTRY_FLUSH_MS', '300')
+# last_seen is refreshed at most this often per user
+USER_LAST_SEEN_RESOLUTION_SECONDS = os.getenv('USER_LAST_SEEN_RESOLUTION_SECONDS', '60')
+USER_REGISTRY_MAX_KNOWN = os.getenv('USER_REGISTRY_MAX_KNOWN', '50000')
+
+# --- Result Writer (batched writes of attempt documents) ---
+RESULT_WRITER_BATCH_SIZE = os.getenv('RESULT_WRITER_BATCH_SIZE', '100')
+RESULT_WRITER_FLUSH_MS = os.getenv('RESULT_WRITER_FLUSH_MS', '200')
+# Answers of a running attempt are checkpointed this often, or sooner once
+# this many are waiting
+RESULT_WRITER_CHECKPOINT_SECONDS = os.getenv('RESULT_WRITER_CHECKPOINT_SECONDS', '10')
+RESULT_WRITER_CHECKPOINT_ANSWERS = os.getenv('RESULT_WRITER_CHECKPOINT_ANSWERS', '5')
+
+# --- Activation Statistics (/stats) ---
+# Finished results (marked pending when stored) are added to the
+# per-activation summaries this often
+ACTIVATION_STATS_FLUSH_MS = os.getenv('ACTIVATION_STATS_FLUSH_MS', '1000')
+
+# --- Result Reports ---
+# Rows per /results page (Prev/Next buttons page through the rest)
+RESULTS_PAGE_SIZE = os.getenv('RESULTS_PAGE_SIZE', '20')
+# /txt reports are written row by row to a temporary file, kept in memory up to
+# this size and moved to TEMP_FOLDER beyond it
+REPORT_SPOOL_MAX_BYTES = os.getenv('REPORT_SPOOL_MAX_BYTES', '1048576')
+# Rendered /results pages and /txt file_ids, reused until a new result
+# finishes (or the TTL passes); 0 disables the cache
+REPORT_CACHE_MAX_SIZE = os.getenv('REPORT_CACHE_MAX_SIZE', '256')
+REPORT_CACHE_TTL_SECONDS = os.getenv('REPORT_CACHE_TTL_SECONDS', '60')
+
+# --- Conversation Persistence (user_data and conversation states in MongoDB) ---
+# Dirty sessions are collected and written this often, and at shutdown
+PERSISTENCE_FLUSH_SECONDS = os.getenv('PERSISTENCE_FLUSH_SECONDS', '5')
+# Maximum number of writes per bulk_write
+PERSISTENCE_BATCH_SIZE = os.getenv('PERSISTENCE_BATCH_SIZE', '500')
+
 # --- Logging Configuration ---
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper() # Default to INFO
 
@@ -50,6 +166,24 @@ if missing_vars:
         f'Missing required environment variables: {", ".join(missing_vars)}'
     )
 
+
+# Numeric settings are converted one by one, so an error names the setting
+def _int_setting(name: str, value) -> int:
+    """int(value), or a ValueError naming the setting."""
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        raise ValueError(f'{name} must be a valid integer, received: {value}')
+
+
+def _float_setting(name: str, value) -> float:
+    """float(value), or a ValueError naming the setting."""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        raise ValueError(f'{name} must be a valid number, received: {value}')
+
+
 # Validate ADMIN_USER_ID is an integer
 try:
     int(ADMIN_USER_ID)
@@ -59,6 +193,165 @@ except (ValueError, TypeError):
         f' received: {ADMIN_USER_ID}'
     )
 
+# Validate update ingestion settings
+valid_bot_modes = ['polling', 'webhook']
+if BOT_MODE not in valid_bot_modes:
+    raise ValueError(
+        f'Invalid BOT_MODE: {BOT_MODE}. Must be one of {", ".join(valid_bot_modes)}'
+    )
+POLL_INTERVAL_SECONDS = _float_setting('POLL_INTERVAL_SECONDS', POLL_INTERVAL_SECONDS)
+WEBHOOK_PORT = _int_setting('WEBHOOK_PORT', WEBHOOK_PORT)
+WEBHOOK_MAX_CONNECTIONS = _int_setting('WEBHOOK_MAX_CONNECTIONS', WEBHOOK_MAX_CONNECTIONS)
+MAX_CONCURRENT_UPDATES = _int_setting('MAX_CONCURRENT_UPDATES', MAX_CONCURRENT_UPDATES)
+if MAX_CONCURRENT_UPDATES < 1:
+    raise ValueError(f'MAX_CONCURRENT_UPDATES must be at least 1, received: {MAX_CONCURRENT_UPDATES}')
+
+# Validate send scheduler settings
+SEND_GLOBAL_RATE = _float_setting('SEND_GLOBAL_RATE', SEND_GLOBAL_RATE)
+SEND_PER_CHAT_RATE = _float_setting('SEND_PER_CHAT_RATE', SEND_PER_CHAT_RATE)
+SEND_PER_CHAT_BURST = _int_setting('SEND_PER_CHAT_BURST', SEND_PER_CHAT_BURST)
+SEND_GROUP_RATE_PER_MINUTE = _float_setting('SEND_GROUP_RATE_PER_MINUTE', SEND_GROUP_RATE_PER_MINUTE)
+SEND_MAX_RETRIES = _int_setting('SEND_MAX_RETRIES', SEND_MAX_RETRIES)
+if (SEND_GLOBAL_RATE <= 0 or SEND_PER_CHAT_RATE <= 0 or SEND_PER_CHAT_BURST < 1
+        or SEND_GROUP_RATE_PER_MINUTE <= 0 or SEND_MAX_RETRIES < 0):
+    raise ValueError('SEND_* rates and burst must be positive, SEND_MAX_RETRIES non-negative.')
+if not 1 <= WEBHOOK_MAX_CONNECTIONS <= 100:
+    raise ValueError(
+        f'WEBHOOK_MAX_CONNECTIONS must be between 1 and 100, received: {WEBHOOK_MAX_CONNECTIONS}'
+    )
+if not WEBHOOK_PATH.startswith('/') or not WEBHOOK_HEALTH_PATH.startswith('/'):
+    raise ValueError('WEBHOOK_PATH and WEBHOOK_HEALTH_PATH must start with "/".')
+if BOT_MODE == 'webhook' and not re.fullmatch(r'[A-Za-z0-9_-]{1,256}', WEBHOOK_SECRET_TOKEN):
+    raise ValueError(
+        'BOT_MODE=webhook requires WEBHOOK_SECRET_TOKEN'
+        ' (1-256 characters: A-Z, a-z, 0-9, _ and -).'
+    )
+
+# Validate MongoDB pool settings
+MONGO_MAX_POOL_SIZE = _int_setting('MONGO_MAX_POOL_SIZE', MONGO_MAX_POOL_SIZE)
+MONGO_MIN_POOL_SIZE = _int_setting('MONGO_MIN_POOL_SIZE', MONGO_MIN_POOL_SIZE)
+MONGO_MAX_IDLE_TIME_MS = _int_setting('MONGO_MAX_IDLE_TIME_MS', MONGO_MAX_IDLE_TIME_MS)
+MONGO_WAIT_QUEUE_TIMEOUT_MS = _int_setting('MONGO_WAIT_QUEUE_TIMEOUT_MS', MONGO_WAIT_QUEUE_TIMEOUT_MS)
+if MONGO_MIN_POOL_SIZE < 0 or MONGO_MAX_POOL_SIZE < MONGO_MIN_POOL_SIZE:
+    raise ValueError(
+        f'Invalid pool size: MONGO_MIN_POOL_SIZE={MONGO_MIN_POOL_SIZE},'
+        f' MONGO_MAX_POOL_SIZE={MONGO_MAX_POOL_SIZE}'
+    )
+
+# Validate cache settings
+ROLE_CACHE_TTL_SECONDS = _float_setting('ROLE_CACHE_TTL_SECONDS', ROLE_CACHE_TTL_SECONDS)
+ROLE_CACHE_MAX_SIZE = _int_setting('ROLE_CACHE_MAX_SIZE', ROLE_CACHE_MAX_SIZE)
+USER_REGISTRY_FLUSH_MS = _int_setting('USER_REGISTRY_FLUSH_MS', USER_REGISTRY_FLUSH_MS)
+USER_LAST_SEEN_RESOLUTION_SECONDS = _float_setting('USER_LAST_SEEN_RESOLUTION_SECONDS', USER_LAST_SEEN_RESOLUTION_SECONDS)
+USER_REGISTRY_MAX_KNOWN = _int_setting('USER_REGISTRY_MAX_KNOWN', USER_REGISTRY_MAX_KNOWN)
+ACTIVATION_INDEX_POLL_SECONDS = _float_setting('ACTIVATION_INDEX_POLL_SECONDS', ACTIVATION_INDEX_POLL_SECONDS)
+ACTIVATION_INDEX_FULL_RELOAD_SECONDS = _float_setting('ACTIVATION_INDEX_FULL_RELOAD_SECONDS', ACTIVATION_INDEX_FULL_RELOAD_SECONDS)
+TEST_BANK_CACHE_SIZE = _int_setting('TEST_BANK_CACHE_SIZE', TEST_BANK_CACHE_SIZE)
+TEST_BANK_CACHE_REVALIDATE_SECONDS = _float_setting('TEST_BANK_CACHE_REVALIDATE_SECONDS', TEST_BANK_CACHE_REVALIDATE_SECONDS)
+QUESTION_COLLECTION_THRESHOLD = _int_setting('QUESTION_COLLECTION_THRESHOLD', QUESTION_COLLECTION_THRESHOLD)
+QUESTION_CACHE_SIZE = _int_setting('QUESTION_CACHE_SIZE', QUESTION_CACHE_SIZE)
+RENDER_PLAN_CACHE_SIZE = _int_setting('RENDER_PLAN_CACHE_SIZE', RENDER_PLAN_CACHE_SIZE)
+PERSISTENCE_FLUSH_SECONDS = _float_setting('PERSISTENCE_FLUSH_SECONDS', PERSISTENCE_FLUSH_SECONDS)
+PERSISTENCE_BATCH_SIZE = _int_setting('PERSISTENCE_BATCH_SIZE', PERSISTENCE_BATCH_SIZE)
+RESULT_WRITER_BATCH_SIZE = _int_setting('RESULT_WRITER_BATCH_SIZE', RESULT_WRITER_BATCH_SIZE)
+RESULT_WRITER_FLUSH_MS = _int_setting('RESULT_WRITER_FLUSH_MS', RESULT_WRITER_FLUSH_MS)
+RESULT_WRITER_CHECKPOINT_SECONDS = _float_setting('RESULT_WRITER_CHECKPOINT_SECONDS', RESULT_WRITER_CHECKPOINT_SECONDS)
+RESULT_WRITER_CHECKPOINT_ANSWERS = _int_setting('RESULT_WRITER_CHECKPOINT_ANSWERS', RESULT_WRITER_CHECKPOINT_ANSWERS)
+REPORT_SPOOL_MAX_BYTES = _int_setting('REPORT_SPOOL_MAX_BYTES', REPORT_SPOOL_MAX_BYTES)
+RESULTS_PAGE_SIZE = _int_setting('RESULTS_PAGE_SIZE', RESULTS_PAGE_SIZE)
+ACTIVATION_STATS_FLUSH_MS = _int_setting('ACTIVATION_STATS_FLUSH_MS', ACTIVATION_STATS_FLUSH_MS)
+REPORT_CACHE_MAX_SIZE = _int_setting('REPORT_CACHE_MAX_SIZE', REPORT_CACHE_MAX_SIZE)
+REPORT_CACHE_TTL_SECONDS = _float_setting('REPORT_CACHE_TTL_SECONDS', REPORT_CACHE_TTL_SECONDS)
+
+ATTEMPT_TIME_LIMIT_MINUTES = _float_setting('ATTEMPT_TIME_LIMIT_MINUTES', ATTEMPT_TIME_LIMIT_MINUTES)
+if ATTEMPT_TIME_LIMIT_MINUTES < 0:
+    raise ValueError(
+        f'ATTEMPT_TIME_LIMIT_MINUTES must not be negative, received: {ATTEMPT_TIME_LIMIT_MINUTES}'
+    )
+
+valid_storage_modes = ['embedded', 'collection', 'auto']
+if QUESTION_STORAGE_MODE not in valid_storage_modes:
+    raise ValueError(
+        f'Invalid QUESTION_STORAGE_MODE: {QUESTION_STORAGE_MODE}.'
+        f' Must be one of {", ".join(valid_storage_modes)}'
+    )
+if USER_REGISTRY_FLUSH_MS <= 0:
+    raise ValueError(f'USER_REGISTRY_FLUSH_MS must be positive, received: {USER_REGISTRY_FLUSH_MS}')
+if RESULT_WRITER_BATCH_SIZE <= 0 or RESULT_WRITER_FLUSH_MS <= 0:
+    raise ValueError(
+        f'RESULT_WRITER_BATCH_SIZE and RESULT_WRITER_FLUSH_MS must be positive,'
+        f' received: {RESULT_WRITER_BATCH_SIZE}, {RESULT_WRITER_FLUSH_MS}'
+    )
+if RESULT_WRITER_CHECKPOINT_SECONDS <= 0 or RESULT_WRITER_CHECKPOINT_ANSWERS <= 0:
+    raise ValueError(
+        f'RESULT_WRITER_CHECKPOINT_SECONDS and RESULT_WRITER_CHECKPOINT_ANSWERS must be positive,'
+        f' received: {RESULT_WRITER_CHECKPOINT_SECONDS}, {RESULT_WRITER_CHECKPOINT_ANSWERS}'
+    )
+if ACTIVATION_STATS_FLUSH_MS <= 0:
+    raise ValueError(f'ACTIVATION_STATS_FLUSH_MS must be positive, received: {ACTIVATION_STATS_FLUSH_MS}')
+if RESULTS_PAGE_SIZE <= 0:
+    raise ValueError(f'RESULTS_PAGE_SIZE must be positive, received: {RESULTS_PAGE_SIZE}')
+if REPORT_SPOOL_MAX_BYTES < 0:
+    raise ValueError(
+        f'REPORT_SPOOL_MAX_BYTES must not be negative, received: {REPORT_SPOOL_MAX_BYTES}'
+    )
+if REPORT_CACHE_MAX_SIZE < 0 or REPORT_CACHE_TTL_SECONDS < 0:
+    raise ValueError(
+        f'REPORT_CACHE_MAX_SIZE and REPORT_CACHE_TTL_SECONDS must not be negative,'
+        f' received: {REPORT_CACHE_MAX_SIZE}, {REPORT_CACHE_TTL_SECONDS}'
+    )
+if PERSISTENCE_FLUSH_SECONDS <= 0 or PERSISTENCE_BATCH_SIZE <= 0:
+    raise ValueError(
+        f'PERSISTENCE_FLUSH_SECONDS and PERSISTENCE_BATCH_SIZE must be positive,'
+        f' received: {PERSISTENCE_FLUSH_SECONDS}, {PERSISTENCE_BATCH_SIZE}'
+    )
+
+valid_compressors = ['zstd', 'snappy', 'zlib']
+unknown_compressors = [c for c in MONGO_COMPRESSORS if c not in valid_compressors]
+if unknown_compressors:
+    raise ValueError(
+        f'Invalid MONGO_COMPRESSORS: {", ".join(unknown_compressors)}.'
+        f' Must be any of {", ".join(valid_compressors)}'
+    )
+
+# Parse "collection=readPreference/w" entries into
+# {collection: (read_preference or None, w or None)}
+valid_read_preferences = [
+    'primary', 'primaryPreferred', 'secondary', 'secondaryPreferred', 'nearest'
+]
+# Read right after being written; a lagging secondary would return stale data
+primary_read_collections = ['results']
+_profiles = {}
+for entry in MONGO_COLLECTION_PROFILES.split(','):
+    if not entry.strip():
+        continue
+    collection_name, _, profile = entry.strip().partition('=')
+    read_pref, _, write_w = profile.partition('/')
+    read_pref = read_pref.strip() or None
+    write_w = write_w.strip() or None
+    if not collection_name.strip() or (read_pref is None and write_w is None):
+        raise ValueError(f'Invalid MONGO_COLLECTION_PROFILES entry: "{entry}"')
+    if read_pref and read_pref not in valid_read_preferences:
+        raise ValueError(
+            f'Invalid read preference "{read_pref}" in MONGO_COLLECTION_PROFILES.'
+            f' Must be one of {", ".join(valid_read_preferences)}'
+        )
+    if read_pref not in (None, 'primary') and collection_name.strip() in primary_read_collections:
+        raise ValueError(
+            f'Invalid read preference "{read_pref}" for "{collection_name.strip()}" in'
+            f' MONGO_COLLECTION_PROFILES. Its reads must stay on the primary'
+        )
+    if write_w and write_w != 'majority':
+        try:
+            write_w = int(write_w)
+        except ValueError:
+            raise ValueError(
+                f'Invalid write concern "{write_w}" in MONGO_COLLECTION_PROFILES.'
+                f' Must be an integer or "majority"'
+            )
+    _profiles[collection_name.strip()] = (read_pref, write_w)
+MONGO_COLLECTION_PROFILES = _profiles
+
 # Validate Log Level
 valid_log_levels = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
 if LOG_LEVEL not in valid_log_levels:
@@ -0,0 +1,162 @@
+# utils/activation_index.py
+
+import asyncio
+import bisect
+import datetime
+import time
+from typing import Optional
+
+from db import get_collection
+from logging_config import logger
+from settings import (
+    ACTIVATION_INDEX_POLL_SECONDS, ACTIVATION_INDEX_FULL_RELOAD_SECONDS
+)
+
+# test_id -> current and upcoming activations, ordered by start_time.
+# Refreshed lazily: a cheap poll on the activation_timestamp watermark picks
+# up activations created elsewhere, a periodic full reload picks up
+# deactivations made by other processes. Changes made through /act_test in
+# this process are applied synchronously.
+_by_test: dict = {}
+_watermark: Optional[datetime.datetime] = None
+_last_poll = 0.0
+_last_full_load = 0.0
+_loaded = False
+_refresh_lock: Optional[asyncio.Lock] = None
+
+
+def _as_utc(value: datetime.datetime) -> datetime.datetime:
+    """Motor returns naive UTC datetimes; the index compares aware ones."""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def _normalize(activation: dict) -> dict:
+    activation = dict(activation)
+    for field in ('start_time', 'end_time', 'activation_timestamp'):
+        if activation.get(field) is not None:
+            activation[field] = _as_utc(activation[field])
+    return activation
+
+
+def _insert(activation: dict) -> None:
+    """Adds or replaces an activation (matched by _id) in its test's list."""
+    entries = _by_test.setdefault(activation['test_id'], [])
+    for i, existing in enumerate(entries):
+        if existing['_id'] == activation['_id']:
+            del entries[i]
+            break
+    start_times = [entry['start_time'] for entry in entries]
+    entries.insert(bisect.bisect_right(start_times, activation['start_time']), activation)
+
+
+def _advance_watermark(activation: dict) -> None:
+    global _watermark
+    stamp = activation.get('activation_timestamp')
+    if stamp is not None and (_watermark is None or stamp > _watermark):
+        _watermark = stamp
+
+
+def _prune(now: datetime.datetime) -> None:
+    """Drops activations that have already ended."""
+    for test_id in list(_by_test):
+        remaining = [a for a in _by_test[test_id] if a['end_time'] >= now]
+        if remaining:
+            _by_test[test_id] = remaining
+        else:
+            del _by_test[test_id]
+
+
+async def _full_load() -> None:
+    global _loaded, _last_full_load, _last_poll, _watermark
+    now = datetime.datetime.now(datetime.timezone.utc)
+    active_tests_coll = await get_collection('active_tests')
+    cursor = active_tests_coll.find({'end_time': {'$gte': now}})
+
+    _by_test.clear()
+    _watermark = None
+    count = 0
+    async for activation in cursor:
+        activation = _normalize(activation)
+        _insert(activation)
+        _advance_watermark(activation)
+        count += 1
+
+    _loaded = True
+    _last_full_load = _last_poll = time.monotonic()
+    logger.debug(f'Activation index loaded {count} current/upcoming activation(s).')
+
+
+async def _poll() -> None:
+    global _last_poll
+    now = datetime.datetime.now(datetime.timezone.utc)
+    query = {'end_time': {'$gte': now}}
+    if _watermark is not None:
+        query['activation_timestamp'] = {'$gt': _watermark}
+
+    active_tests_coll = await get_collection('active_tests')
+    async for activation in active_tests_coll.find(query):
+        activation = _normalize(activation)
+        _insert(activation)
+        _advance_watermark(activation)
+
+    _prune(now)
+    _last_poll = time.monotonic()
+
+
+async def _ensure_fresh() -> None:
+    global _refresh_lock
+    now = time.monotonic()
+    if (_loaded and now - _last_poll < ACTIVATION_INDEX_POLL_SECONDS
+            and now - _last_full_load < ACTIVATION_INDEX_FULL_RELOAD_SECONDS):
+        return
+
+    if _refresh_lock is None:
+        _refresh_lock = asyncio.Lock()
+    async with _refresh_lock:
+        # Another waiter may have refreshed while we queued for the lock
+        now = time.monotonic()
+        if not _loaded or now - _last_full_load >= ACTIVATION_INDEX_FULL_RELOAD_SECONDS:
+            await _full_load()
+        elif now - _last_poll >= ACTIVATION_INDEX_POLL_SECONDS:
+            await _poll()
+
+
+async def get_current_activations(test_id: str) -> list:
+    """Returns activations of test_id running right now, newest first."""
+    await _ensure_fresh()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return [
+        activation for activation in reversed(_by_test.get(test_id, []))
+        if activation['start_time'] <= now <= activation['end_time']
+    ]
+
+
+async def get_current_activation(test_id: str) -> Optional[dict]:
+    """Returns the most recently started running activation, or None."""
+    current = await get_current_activations(test_id)
+    return current[0] if current else None
+
+
+def add_activation(activation: dict) -> None:
+    """Registers an activation just inserted by this process."""
+    activation = _normalize(activation)
+    _insert(activation)
+    _advance_watermark(activation)
+
+
+async def reload_test(test_id: str) -> None:
+    """Re-reads all current/upcoming activations of one test from the DB."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    active_tests_coll = await get_collection('active_tests')
+    cursor = active_tests_coll.find({'test_id': test_id, 'end_time': {'$gte': now}})
+    # Lookups keep seeing the old list until the cursor is drained
+    activations = [_normalize(activation) async for activation in cursor]
+    activations.sort(key=lambda activation: activation['start_time'])
+    for activation in activations:
+        _advance_watermark(activation)
+    if activations:
+        _by_test[test_id] = activations
+    else:
+        _by_test.pop(test_id, None)
@@ -0,0 +1,254 @@
+# utils/activation_stats.py
+
+import asyncio
+import datetime
+import math
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from db import get_collection
+from logging_config import logger
+from settings import ACTIVATION_STATS_FLUSH_MS
+from utils.result_writer import IN_PROGRESS
+
+# One document per activation, maintained incrementally as attempts finish:
+#   {_id: active_test_id, test_id, count, score_sum, score_sq_sum,
+#    min_score, max_score, histogram: {'0': n, '10': n, ..., '90': n},
+#    recent: [_ids of the last results added], updated_at}
+# Scores are percentages; bucket '90' also holds 100. Reading it costs
+# one document per activation however many results there are.
+BUCKET_WIDTH = 10
+BUCKETS = [str(start) for start in range(0, 100, BUCKET_WIDTH)]
+
+# A result is finalized with STATS_PENDING set (in the same write as its
+# score), so its increment survives restarts. The apply loop adds pending
+# results to their activation, guarded on the result _id not being in
+# 'recent', then clears the flag: replaying a batch after a crash or a
+# failed write that did apply changes nothing.
+STATS_PENDING = 'stats_pending'
+APPLY_BATCH_SIZE = 500
+# Must cover at least one batch: a replayed result is still in the list
+RECENT_RESULTS = 2 * APPLY_BATCH_SIZE
+
+_apply_task: Optional[asyncio.Task] = None
+# Created on first use so it binds to the running event loop; also held
+# by rebuilds, so they never interleave with an apply
+_apply_lock: Optional[asyncio.Lock] = None
+
+
+def _bucket(score: float) -> str:
+    return str(min(int(score // BUCKET_WIDTH) * BUCKET_WIDTH, 100 - BUCKET_WIDTH))
+
+
+def _lock() -> asyncio.Lock:
+    global _apply_lock
+    if _apply_lock is None:
+        _apply_lock = asyncio.Lock()
+    return _apply_lock
+
+
+def _increment(result: dict, now: datetime.datetime) -> UpdateOne:
+    """Adds one result to its activation, unless it was already added."""
+    score = result['score']
+    return UpdateOne(
+        {'_id': result['active_test_id'], 'recent': {'$ne': result['_id']}},
+        {
+            '$inc': {
+                'count': 1, 'score_sum': score, 'score_sq_sum': score * score,
+                f'histogram.{_bucket(score)}': 1,
+            },
+            '$min': {'min_score': score},
+            '$max': {'max_score': score},
+            '$set': {'updated_at': now},
+            '$push': {'recent': {'$each': [result['_id']], '$slice': -RECENT_RESULTS}},
+        },
+    )
+
+
+async def apply_pending_stats() -> int:
+    """
+    Adds finished results still marked STATS_PENDING to their activations
+    (one ordered bulk_write per batch) and clears the mark. Returns the
+    number of results applied.
+    """
+    applied = 0
+    async with _lock():
+        results_coll = await get_collection('results')
+        stats_coll = await get_collection('activation_stats')
+        while True:
+            results = await results_coll.find(
+                {STATS_PENDING: True}, {'active_test_id': 1, 'test_id': 1, 'score': 1}
+            ).limit(APPLY_BATCH_SIZE).to_list(length=None)
+            if not results:
+                return applied
+            now = datetime.datetime.now(datetime.timezone.utc)
+            # Create missing documents first: the guarded increments do not upsert
+            activations = {result['active_test_id']: result['test_id'] for result in results}
+            operations = [
+                UpdateOne({'_id': active_test_id}, {'$setOnInsert': {'test_id': test_id}}, upsert=True)
+                for active_test_id, test_id in activations.items()
+            ]
+            operations += [_increment(result, now) for result in results if isinstance(result.get('score'), (int, float))]
+            await stats_coll.bulk_write(operations, ordered=True)
+            ids = [result['_id'] for result in results]
+            await results_coll.update_many({'_id': {'$in': ids}}, {'$unset': {STATS_PENDING: ''}})
+            applied += len(ids)
+            logger.debug(f'Activation stats: {len(ids)} result(s) added to {len(activations)} activation(s).')
+            if len(results) < APPLY_BATCH_SIZE:
+                return applied
+
+
+async def _apply_loop() -> None:
+    try:
+        await ensure_activation_stats()
+    except Exception as e:
+        logger.exception(f'Activation stats backfill failed: {e}')
+    interval = ACTIVATION_STATS_FLUSH_MS / 1000
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await apply_pending_stats()
+        except Exception as e:
+            # Nothing is lost: the results stay pending and are retried
+            logger.error(f'Activation stats update failed, will retry: {e}')
+
+
+def start_activation_stats() -> None:
+    """Starts applying pending results periodically (after a one-time backfill if needed)."""
+    global _apply_task
+    if _apply_task is None:
+        _apply_task = asyncio.create_task(_apply_loop())
+        logger.info(f'Activation stats started (pending results applied every {ACTIVATION_STATS_FLUSH_MS} ms).')
+
+
+async def stop_activation_stats() -> None:
+    """Stops the background loop after applying what is pending now."""
+    global _apply_task
+    if _apply_task is not None:
+        _apply_task.cancel()
+        try:
+            await _apply_task
+        except asyncio.CancelledError:
+            pass
+        _apply_task = None
+    try:
+        applied = await apply_pending_stats()
+        logger.info(f'Activation stats stopped ({applied} pending result(s) applied).')
+    except Exception as e:
+        logger.error(f'Activation stats stopped; pending results are applied at the next start: {e}')
+
+
+def summarize(doc: dict) -> dict:
+    """
+    Count, mean, standard deviation, min/max, median and histogram of an
+    activation_stats document. The median is interpolated within its
+    histogram bucket, so it is approximate (within BUCKET_WIDTH points).
+    """
+    count = doc.get('count', 0)
+    histogram = [doc.get('histogram', {}).get(bucket, 0) for bucket in BUCKETS]
+    if not count:
+        return {'count': 0, 'histogram': histogram}
+    mean = doc['score_sum'] / count
+    variance = max(doc['score_sq_sum'] / count - mean * mean, 0.0)
+
+    median = doc['max_score']
+    seen = 0
+    for i, bucket_count in enumerate(histogram):
+        if bucket_count and seen + bucket_count >= count / 2:
+            median = i * BUCKET_WIDTH + (count / 2 - seen) / bucket_count * BUCKET_WIDTH
+            break
+        seen += bucket_count
+    median = min(max(median, doc['min_score']), doc['max_score'])
+
+    return {
+        'count': count, 'mean': mean, 'stddev': math.sqrt(variance),
+        'min': doc['min_score'], 'max': doc['max_score'], 'median': median,
+        'histogram': histogram,
+    }
+
+
+def combine(docs: list) -> dict:
+    """Adds activation_stats documents into one (e.g. all activations of a test)."""
+    total = {'count': 0, 'score_sum': 0.0, 'score_sq_sum': 0.0, 'histogram': {}}
+    for doc in docs:
+        if not doc.get('count'):
+            continue
+        for field in ('count', 'score_sum', 'score_sq_sum'):
+            total[field] += doc[field]
+        total['min_score'] = min(total.get('min_score', doc['min_score']), doc['min_score'])
+        total['max_score'] = max(total.get('max_score', doc['max_score']), doc['max_score'])
+        for bucket, count in doc.get('histogram', {}).items():
+            total['histogram'][bucket] = total['histogram'].get(bucket, 0) + count
+    return total
+
+
+async def get_activation_stats(activation_ids: list) -> dict:
+    """Returns {active_test_id: activation_stats document} for the given activations."""
+    stats_coll = await get_collection('activation_stats')
+    cursor = stats_coll.find({'_id': {'$in': activation_ids}}, {'recent': 0})
+    return {doc['_id']: doc async for doc in cursor}
+
+
+async def rebuild_activation_stats(test_id: Optional[str] = None) -> int:
+    """
+    Recomputes activation_stats from 'results' in one aggregation (all
+    tests, or one) and replaces the documents with $merge. Results still
+    pending are left out; the apply loop adds them afterwards (the lock
+    keeps it from running in between). Returns the number of activations
+    rebuilt.
+    """
+    async with _lock():
+        return await _rebuild(test_id)
+
+
+async def _rebuild(test_id: Optional[str]) -> int:
+    match = {'status': {'$ne': IN_PROGRESS}, 'score': {'$type': 'number'}, STATS_PENDING: {'$ne': True}}
+    if test_id is not None:
+        match['test_id'] = test_id
+    bucket = {'$toString': {'$min': [
+        {'$multiply': [{'$floor': {'$divide': ['$score', BUCKET_WIDTH]}}, BUCKET_WIDTH]},
+        100 - BUCKET_WIDTH,
+    ]}}
+    pipeline = [
+        {'$match': match},
+        {'$group': {
+            '_id': {'activation': '$active_test_id', 'bucket': bucket},
+            'test_id': {'$first': '$test_id'},
+            'count': {'$sum': 1},
+            'score_sum': {'$sum': '$score'},
+            'score_sq_sum': {'$sum': {'$multiply': ['$score', '$score']}},
+            'min_score': {'$min': '$score'},
+            'max_score': {'$max': '$score'},
+        }},
+        {'$group': {
+            '_id': '$_id.activation',
+            'test_id': {'$first': '$test_id'},
+            'count': {'$sum': '$count'},
+            'score_sum': {'$sum': '$score_sum'},
+            'score_sq_sum': {'$sum': '$score_sq_sum'},
+            'min_score': {'$min': '$min_score'},
+            'max_score': {'$max': '$max_score'},
+            'histogram': {'$push': {'k': '$_id.bucket', 'v': '$count'}},
+        }},
+        {'$set': {'histogram': {'$arrayToObject': '$histogram'}, 'recent': [], 'updated_at': '$$NOW'}},
+        {'$merge': {'into': 'activation_stats', 'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+    ]
+    results_coll = await get_collection('results')
+    await results_coll.aggregate(pipeline).to_list(length=None)
+
+    stats_coll = await get_collection('activation_stats')
+    rebuilt = await stats_coll.count_documents({'test_id': test_id} if test_id is not None else {})
+    logger.info(f"Activation stats rebuilt from results ({rebuilt} activation(s), test {test_id or 'all'}).")
+    return rebuilt
+
+
+async def ensure_activation_stats() -> None:
+    """Startup backfill: builds the stats once if results exist but stats do not."""
+    stats_coll = await get_collection('activation_stats')
+    if await stats_coll.find_one({}, {'_id': 1}):
+        return
+    results_coll = await get_collection('results')
+    if await results_coll.find_one({'status': {'$ne': IN_PROGRESS}}, {'_id': 1}):
+        logger.info('activation_stats is empty but results exist: rebuilding.')
+        await rebuild_activation_stats()
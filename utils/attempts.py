@@ -0,0 +1,98 @@
+# utils/attempts.py
+
+import datetime
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from db import get_collection
+from logging_config import logger
+
+# One ledger document per (user_id, active_test_id):
+# {user_id, active_test_id, reserved, updated_at}
+# 'reserved' counts attempts started and not released. A unique index on
+# (user_id, active_test_id) turns the conditional upsert below into an
+# atomic "reserve if below max_tries".
+ATTEMPTS_COLLECTION = 'attempts'
+
+
+async def _backfill_legacy_ledger(user_id: int, active_test_id) -> None:
+    """
+    Activations created before the ledger existed may already have results.
+    Seeds the ledger from them once, so earlier attempts still count.
+    """
+    attempts_coll = await get_collection(ATTEMPTS_COLLECTION)
+    if await attempts_coll.find_one(
+        {'user_id': user_id, 'active_test_id': active_test_id}, {'_id': 1}
+    ):
+        return
+
+    results_coll = await get_collection('results')
+    previous = await results_coll.count_documents({
+        'user_id': user_id,
+        'active_test_id': active_test_id
+    })
+    try:
+        await attempts_coll.insert_one({
+            'user_id': user_id,
+            'active_test_id': active_test_id,
+            'reserved': previous,
+            'updated_at': datetime.datetime.now(datetime.timezone.utc),
+        })
+    except DuplicateKeyError:
+        pass # A concurrent request created it first
+
+
+async def reserve_attempt(user_id: int, activation: dict) -> Optional[int]:
+    """
+    Atomically reserves the next attempt of a user for an activation.
+    Returns the attempt number, or None if max_tries is already used up.
+    """
+    active_test_id = activation['_id']
+    max_tries = activation.get('max_tries', 1)
+
+    if not activation.get('attempts_ledger'):
+        await _backfill_legacy_ledger(user_id, active_test_id)
+
+    attempts_coll = await get_collection(ATTEMPTS_COLLECTION)
+    try:
+        ledger = await attempts_coll.find_one_and_update(
+            {
+                'user_id': user_id,
+                'active_test_id': active_test_id,
+                'reserved': {'$lt': max_tries},
+            },
+            {
+                '$inc': {'reserved': 1},
+                '$set': {'updated_at': datetime.datetime.now(datetime.timezone.utc)},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # The ledger exists but did not match: all tries are reserved
+        return None
+    return ledger['reserved']
+
+
+async def release_attempt(user_id: int, active_test_id) -> None:
+    """Gives back a reserved attempt (cancelled or never recorded)."""
+    try:
+        attempts_coll = await get_collection(ATTEMPTS_COLLECTION)
+        await attempts_coll.update_one(
+            {
+                'user_id': user_id,
+                'active_test_id': active_test_id,
+                'reserved': {'$gt': 0},
+            },
+            {
+                '$inc': {'reserved': -1},
+                '$set': {'updated_at': datetime.datetime.now(datetime.timezone.utc)},
+            }
+        )
+        logger.info(f"Released attempt of user {user_id} for activation {active_test_id}.")
+    except Exception as e:
+        logger.exception(
+            f"Failed to release attempt of user {user_id} for activation {active_test_id}: {e}"
+        )
@@ -13,4 +13,37 @@ def normalize_test_id(raw_id) -> str:
     # Remove underscores
     normalized = normalized.replace('_', '')
     # Convert to lowercase and strip whitespace
-    return normalized.lower().strip()
\ No newline at end of file
+    return normalized.lower().strip()
+
+
+# Test bank CSV row: Question;CorrectText;Opt1;Opt2;Opt3;Opt4
+TEST_CSV_COLUMNS = 6
+
+
+def parse_question_row(row: list) -> tuple:
+    """
+    Validates one row of a test bank CSV. Returns (question, None) with
+    question as stored in the bank, or (None, problem) where problem is
+    'columns', 'question', 'correct', 'options' or 'not_in_options'.
+    Callers skip rows with an empty first column before calling.
+    """
+    if len(row) != TEST_CSV_COLUMNS:
+        return None, 'columns'
+    question_text = row[0].strip()
+    correct_answer_text = row[1].strip()
+    options_texts = [s.strip() for s in row[2:6]]
+    if not question_text:
+        return None, 'question'
+    if not correct_answer_text:
+        return None, 'correct'
+    if any(not opt for opt in options_texts):
+        return None, 'options'
+    try:
+        correct_option_idx = options_texts.index(correct_answer_text)
+    except ValueError:
+        return None, 'not_in_options'
+    return {
+        'question_text': question_text,
+        'options': options_texts,
+        'correct_option_index': correct_option_idx,
+    }, None
@@ -1,14 +1,79 @@
-import datetime
+import time
+from collections import OrderedDict
+
 from db import get_collection
 from logging_config import logger
+from settings import ROLE_CACHE_TTL_SECONDS, ROLE_CACHE_MAX_SIZE
+from utils.user_registry import touch_user
 # We might need Update/ContextTypes if helpers interact directly with them,
 # but get_user_role only needs basic types for now.
 
+# user_id -> (role, expires_at). Ordered by last use for LRU eviction.
+_role_cache: OrderedDict = OrderedDict()
+_role_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+# user_id -> invalidation count; a read started before an invalidation
+# must not put its (possibly stale) role into the cache
+_role_generations: dict = {}
+
+
+def _cache_role(user_id: int, role: str) -> None:
+    """Stores a role in the cache, evicting the least recently used entry."""
+    if ROLE_CACHE_TTL_SECONDS <= 0 or ROLE_CACHE_MAX_SIZE <= 0:
+        return
+    _role_cache[user_id] = (role, time.monotonic() + ROLE_CACHE_TTL_SECONDS)
+    _role_cache.move_to_end(user_id)
+    while len(_role_cache) > ROLE_CACHE_MAX_SIZE:
+        _role_cache.popitem(last=False)
+        _role_cache_stats['evictions'] += 1
+
+
+def invalidate_user_role(user_id: int) -> None:
+    """Drops a cached role. Must be called after any role change."""
+    _role_generations[user_id] = _role_generations.get(user_id, 0) + 1
+    if _role_cache.pop(user_id, None) is not None:
+        _role_cache_stats['invalidations'] += 1
+        logger.debug(f'Role cache entry for user {user_id} invalidated.')
+
+
+def get_role_cache_stats() -> dict:
+    """Returns role cache counters and current size."""
+    stats = dict(_role_cache_stats)
+    stats['size'] = len(_role_cache)
+    return stats
+
+
+def format_role_cache_stats() -> str:
+    """get_role_cache_stats() as a /db_stats section."""
+    stats = get_role_cache_stats()
+    return (
+        "👤 Кэш ролей:\n"
+        f"Записей: {stats['size']}\n"
+        f"Попаданий / промахов: {stats['hits']} / {stats['misses']}\n"
+        f"Вытеснено: {stats['evictions']}, сброшено: {stats['invalidations']}"
+    )
+
+
 async def get_user_role(user_id: int, username) -> str:
     """
     Retrieves the user's role from the database.
-    Defaults to 'student' and adds the user if they are not found.
+    Defaults to 'student' and queues the user for registration if they
+    are not found. Roles are served from an in-process TTL cache when
+    possible; user upserts and last_seen refreshes go through the
+    write-behind user registry.
     """
+    touch_user(user_id, username)
+
+    cached = _role_cache.get(user_id)
+    if cached is not None:
+        role, expires_at = cached
+        if expires_at > time.monotonic():
+            _role_cache.move_to_end(user_id)
+            _role_cache_stats['hits'] += 1
+            return role
+        del _role_cache[user_id]
+    _role_cache_stats['misses'] += 1
+
+    generation = _role_generations.get(user_id, 0)
     users_collection = await get_collection('users')
     # Use projection to only fetch the 'role' field if user is found
     user_data = await users_collection.find_one(
@@ -16,27 +81,20 @@ async def get_user_role(user_id: int, username) -> str:
         {'_id': 0, 'role': 1} # Fetch only role, exclude _id
     )
 
+    # A role change that landed during the read may not be in user_data
+    current = _role_generations.get(user_id, 0) == generation
+
     if user_data and 'role' in user_data:
+        if current:
+            _cache_role(user_id, user_data['role'])
         return user_data['role']
     elif user_data: # Found but no role field? Default to student
          logger.warning(f"User {user_id} found but missing 'role' field.")
          return 'student'
     else:
-        # User not found, treat as student and add them to DB
-        logger.info(f'User {user_id} (@{username}) not found. Adding as student.')
-        try:
-            # Ensure timezone information is included for consistency
-            utc_now = datetime.datetime.now(datetime.timezone.utc)
-            await users_collection.insert_one({
-                'user_id': user_id,
-                'username': username,
-                'role': 'student',
-                'date_added': utc_now
-                # TODO: Add first_name/last_name if available from Update object
-                # This would require passing the `update` object or names here.
-            })
-            logger.info(f'Successfully added user {user_id} as student.')
-        except Exception as e:
-            # Log error but proceed treating them as student for this request
-            logger.error(f'Failed to add user {user_id} to DB: {e}')
+        # User not found: the registry upsert queued above inserts them
+        # as a student on the next flush ($setOnInsert never downgrades).
+        logger.info(f'User {user_id} (@{username}) not found. Queued as student.')
+        if current:
+            _cache_role(user_id, 'student')
         return 'student'
@@ -0,0 +1,166 @@
+# utils/db_indexes.py
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from logging_config import logger
+
+# Declared indexes per collection: (name, keys, options).
+# Each entry backs a query shape used by the handlers; the name is what
+# drift detection keys on, so renaming an entry means a new index.
+INDEXES = {
+    'users': [
+        # get_user_role, role changes in admin/add handlers
+        ('user_id_unique', [('user_id', ASCENDING)], {'unique': True}),
+        # _find_user_by_username, teacher seeding
+        ('username', [('username', ASCENDING)], {}),
+        # /list_admins, /list_teachers, admin count checks
+        ('role', [('role', ASCENDING)], {}),
+    ],
+    'active_tests': [
+        # /test activation lookup, /act_test status and deact
+        ('test_window', [
+            ('test_id', ASCENDING),
+            ('start_time', ASCENDING),
+            ('end_time', ASCENDING),
+        ], {}),
+        # Activation index: initial load and watermark poll
+        ('end_time', [('end_time', ASCENDING)], {}),
+        ('activation_timestamp', [('activation_timestamp', ASCENDING)], {}),
+    ],
+    'results': [
+        # Ledger backfill for activations created before the attempts ledger
+        ('user_activation', [
+            ('user_id', ASCENDING),
+            ('active_test_id', ASCENDING),
+        ], {}),
+        # /txt <id> (utils.result_reports): match and
+        # sort by username then finish time in index order. Its test_id
+        # prefix also serves the /delete_test result check
+        ('test_report', [
+            ('test_id', ASCENDING),
+            ('username', ASCENDING),
+            ('end_timestamp', ASCENDING),
+            ('_id', ASCENDING),
+        ], {}),
+        # /results pages (keyset on end_timestamp, _id), newest first:
+        # a user's own results, and one test's results
+        ('user_recent', [
+            ('user_id', ASCENDING),
+            ('end_timestamp', DESCENDING),
+            ('_id', DESCENDING),
+        ], {}),
+        ('test_recent', [
+            ('test_id', ASCENDING),
+            ('end_timestamp', DESCENDING),
+            ('_id', DESCENDING),
+        ], {}),
+        # Running attempts, restored at startup
+        ('in_progress', [('status', ASCENDING)], {
+            'partialFilterExpression': {'status': 'in_progress'}
+        }),
+        # Finished results not yet added to activation_stats
+        ('stats_pending', [('stats_pending', ASCENDING)], {
+            'partialFilterExpression': {'stats_pending': True}
+        }),
+    ],
+    'attempts': [
+        # Attempt ledger: makes the conditional upsert in reserve_attempt atomic
+        ('user_activation_unique', [
+            ('user_id', ASCENDING),
+            ('active_test_id', ASCENDING),
+        ], {'unique': True}),
+    ],
+    'tests': [
+        ('test_id_unique', [('test_id', ASCENDING)], {'unique': True}),
+    ],
+    'test_questions': [
+        # Question-level storage: sampling and lookups per bank version
+        ('test_version_index', [
+            ('test_id', ASCENDING),
+            ('version', ASCENDING),
+            ('index', ASCENDING),
+        ], {'unique': True}),
+    ],
+    'materials': [
+        # Several files can belong to one test, so this one is not unique.
+        ('test_id', [('test_id', ASCENDING)], {}),
+    ],
+}
+
+
+def _same_definition(existing: dict, keys: list, options: dict) -> bool:
+    """Compares an index_information() entry with a declared index."""
+    existing_keys = [(field, direction) for field, direction in existing.get('key', [])]
+    if existing_keys != list(keys):
+        return False
+    return bool(existing.get('unique', False)) == bool(options.get('unique', False))
+
+
+async def ensure_indexes(db) -> None:
+    """
+    Creates missing declared indexes and warns about drift.
+    Existing indexes are never dropped or rebuilt automatically; a
+    mismatch is only reported so it can be fixed deliberately.
+    """
+    logger.info('Verifying MongoDB indexes...')
+    created = []
+
+    for collection_name, declared in INDEXES.items():
+        collection = db[collection_name]
+        try:
+            existing = await collection.index_information()
+        except Exception as e:
+            logger.error(f"Could not read indexes of '{collection_name}': {e}")
+            continue
+
+        declared_names = set()
+        for name, keys, options in declared:
+            declared_names.add(name)
+
+            if name in existing:
+                if not _same_definition(existing[name], keys, options):
+                    logger.warning(
+                        f"Index drift in '{collection_name}': '{name}' exists as "
+                        f"{existing[name].get('key')} (unique="
+                        f"{existing[name].get('unique', False)}), declared as "
+                        f"{keys} (unique={options.get('unique', False)})."
+                    )
+                continue
+
+            # Same keys under another name would make create_index fail
+            same_keys = [
+                other for other, info in existing.items()
+                if other != '_id_' and _same_definition(info, keys, options)
+            ]
+            if same_keys:
+                logger.warning(
+                    f"Index drift in '{collection_name}': declared index '{name}' "
+                    f"already exists under the name '{same_keys[0]}'."
+                )
+                continue
+
+            try:
+                await collection.create_index(keys, name=name, **options)
+                created.append(f'{collection_name}.{name}')
+                logger.info(f"Created index '{name}' on '{collection_name}': {keys}")
+            except OperationFailure as e:
+                # Typically duplicate values blocking a unique index
+                logger.error(
+                    f"Failed to create index '{name}' on '{collection_name}': {e}"
+                )
+
+        undeclared = [
+            name for name in existing
+            if name != '_id_' and name not in declared_names
+        ]
+        if undeclared:
+            logger.warning(
+                f"Index drift in '{collection_name}': undeclared indexes "
+                f"{', '.join(sorted(undeclared))}."
+            )
+
+    if created:
+        logger.info(f"Index bootstrap created {len(created)} index(es): {', '.join(created)}")
+    else:
+        logger.info('All declared indexes already present.')
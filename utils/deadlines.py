@@ -0,0 +1,141 @@
+# utils/deadlines.py
+
+import asyncio
+import datetime
+import heapq
+import itertools
+from typing import NamedTuple, Optional
+
+from telegram.ext import Application
+
+from logging_config import logger
+
+# One background task serves every pending attempt deadline: a min-heap
+# ordered by due time, and a dict with the live deadline per user.
+# Rescheduling or cancelling only updates the dict; stale heap entries are
+# skipped when they come up (and compacted if they pile up), so the cost
+# per deadline stays O(log n) with a single sleeping task however many
+# attempts are running.
+_heap: list = []
+# user_id -> session key of the deadline that is still wanted
+_scheduled: dict = {}
+_sequence = itertools.count()
+_app: Optional[Application] = None
+_runner: Optional[asyncio.Task] = None
+# Set when a deadline earlier than the one being waited for is added
+_wakeup: Optional[asyncio.Event] = None
+_stats = {'scheduled': 0, 'fired': 0, 'cancelled': 0}
+
+
+class AttemptDeadline(NamedTuple):
+    """
+    Internal update put on the application's update queue when an attempt
+    runs out of time. Going through the queue means it is processed like a
+    user update: serialized with that user's own callbacks.
+    """
+    user_id: int
+    chat_id: int
+    session_key: tuple
+
+
+def _timestamp(value: datetime.datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+def schedule_deadline(user_id: int, chat_id: int, session_key: tuple,
+                      deadline: datetime.datetime) -> None:
+    """Schedules (or replaces) the deadline of a user's running attempt."""
+    due = _timestamp(deadline)
+    _scheduled[user_id] = session_key
+    heapq.heappush(_heap, (due, next(_sequence), user_id, chat_id, session_key))
+    _stats['scheduled'] += 1
+    if _wakeup is not None and _heap[0][0] == due:
+        _wakeup.set()
+    if len(_heap) > 2 * len(_scheduled) + 1000:
+        _compact()
+
+
+def cancel_deadline(user_id: int) -> None:
+    """Forgets the deadline of a user's attempt (finished or cancelled)."""
+    if _scheduled.pop(user_id, None) is not None:
+        _stats['cancelled'] += 1
+
+
+def _compact() -> None:
+    global _heap
+    _heap = [entry for entry in _heap if _scheduled.get(entry[2]) == entry[4]]
+    heapq.heapify(_heap)
+
+
+async def _run() -> None:
+    while True:
+        _wakeup.clear()
+        if not _heap:
+            await _wakeup.wait()
+            continue
+
+        due, _, user_id, chat_id, session_key = _heap[0]
+        delay = due - datetime.datetime.now(datetime.timezone.utc).timestamp()
+        if delay > 0:
+            try:
+                # Wake early if an earlier deadline arrives meanwhile
+                await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        heapq.heappop(_heap)
+        if _scheduled.get(user_id) != session_key:
+            continue # Cancelled or replaced by a newer attempt
+        del _scheduled[user_id]
+        _stats['fired'] += 1
+        try:
+            await _app.update_queue.put(AttemptDeadline(user_id, chat_id, session_key))
+        except Exception as e:
+            logger.exception(f'Could not queue attempt deadline of user {user_id}: {e}')
+
+
+def start_deadlines(app: Application) -> None:
+    """
+    Starts the deadline task. Call after app.initialize(), so deadlines of
+    sessions restored by the persistence can be scheduled by the caller.
+    """
+    global _app, _runner, _wakeup
+    _app = app
+    if _runner is None:
+        _wakeup = asyncio.Event()
+        _runner = asyncio.create_task(_run())
+        logger.info(f'Attempt deadline scheduler started ({len(_scheduled)} pending).')
+
+
+async def stop_deadlines() -> None:
+    """Stops the task. Pending deadlines are rebuilt from sessions on start."""
+    global _runner
+    if _runner is not None:
+        _runner.cancel()
+        try:
+            await _runner
+        except asyncio.CancelledError:
+            pass
+        _runner = None
+        logger.info('Attempt deadline scheduler stopped.')
+
+
+def get_deadline_stats() -> dict:
+    """Returns deadline counters and the number of pending deadlines."""
+    stats = dict(_stats)
+    stats['pending'] = len(_scheduled)
+    stats['heap_entries'] = len(_heap)
+    return stats
+
+
+def format_deadline_stats() -> str:
+    """get_deadline_stats() as a /db_stats section."""
+    stats = get_deadline_stats()
+    return (
+        "⏰ Сроки попыток:\n"
+        f"Ожидают: {stats['pending']} (записей в куче: {stats['heap_entries']})\n"
+        f"Завершено по времени: {stats['fired']}, снято: {stats['cancelled']}"
+    )
@@ -0,0 +1,218 @@
+# utils/item_analysis.py
+
+import datetime
+import math
+from typing import Optional
+
+from db import get_collection
+from logging_config import logger
+from utils.question_store import get_questions
+from utils.result_writer import IN_PROGRESS
+from utils.test_bank_cache import get_test_bank
+
+# Per-question statistics of a test bank version, from the answers stored
+# in results.selected_answers (option indices are bank indices):
+#   difficulty      share of answers that were correct (p)
+#   discrimination  point-biserial correlation between answering the
+#                   question correctly and the attempt's score (%), over the
+#                   attempts that answered it; None if undefined
+#   options         how many answers chose each option
+# Cached in 'item_analysis', one document per (test_id, owner) scope:
+#   {_id: {test_id, owner}, version, attempts, computed_at, method, items}
+# A cached analysis is used while the bank version and the number of
+# finished attempts in scope (from activation_stats) are unchanged.
+ANALYSIS_COLLECTION = 'item_analysis'
+
+
+async def _scope_activations(test_id: str, owner: Optional[int]) -> list:
+    """_ids of the test's activations (those `owner` enabled, for a teacher)."""
+    query = {'test_id': test_id}
+    if owner is not None:
+        query['enabled_by_user_id'] = owner
+    active_tests_coll = await get_collection('active_tests')
+    return [doc['_id'] async for doc in active_tests_coll.find(query, {'_id': 1})]
+
+
+async def _attempt_count(activation_ids: list) -> int:
+    """Finished attempts of the activations, read from activation_stats."""
+    stats_coll = await get_collection('activation_stats')
+    return sum([
+        doc.get('count', 0)
+        async for doc in stats_coll.find({'_id': {'$in': activation_ids}}, {'count': 1})
+    ])
+
+
+def _results_match(bank, activation_ids: list, owner: Optional[int]) -> dict:
+    """
+    Finished results answered on this bank version. Results written before
+    attempts recorded 'bank_version' count if they finished after the
+    upload: sessions on an older version end when a new one is uploaded.
+    """
+    legacy = {'bank_version': {'$exists': False}}
+    if bank.upload_timestamp is not None:
+        legacy['end_timestamp'] = {'$gte': bank.upload_timestamp}
+    match = {
+        'test_id': bank.test_id,
+        'status': {'$ne': IN_PROGRESS},
+        '$or': [{'bank_version': bank.version}, legacy],
+    }
+    if owner is not None:
+        match['active_test_id'] = {'$in': activation_ids}
+    return match
+
+
+def _item_pipeline(match: dict) -> list:
+    """
+    One row per question: answers, correct answers, sums of the attempt
+    scores (all, squared, and of the attempts that answered correctly) and
+    the answer count per option. The first $group is per (question, option);
+    all answers choosing one option are either correct or not.
+    """
+    answer = '$selected_answers'
+    return [
+        {'$match': match},
+        {'$project': {'_id': 0, 'score': 1, 'selected_answers': 1}},
+        {'$unwind': answer},
+        {'$group': {
+            '_id': {'question': f'{answer}.question_index_in_bank', 'option': f'{answer}.selected_option_index'},
+            'answers': {'$sum': 1},
+            'correct': {'$sum': {'$cond': [f'{answer}.is_correct', 1, 0]}},
+            'score_sum': {'$sum': '$score'},
+            'score_sq_sum': {'$sum': {'$multiply': ['$score', '$score']}},
+        }},
+        {'$group': {
+            '_id': '$_id.question',
+            'answers': {'$sum': '$answers'},
+            'correct': {'$sum': '$correct'},
+            'score_sum': {'$sum': '$score_sum'},
+            'score_sq_sum': {'$sum': '$score_sq_sum'},
+            'correct_score_sum': {'$sum': {'$cond': [{'$gt': ['$correct', 0]}, '$score_sum', 0]}},
+            'options': {'$push': {'k': {'$toString': '$_id.option'}, 'v': '$answers'}},
+        }},
+        {'$set': {'options': {'$arrayToObject': '$options'}}},
+        {'$sort': {'_id': 1}},
+    ]
+
+
+def _item(row: dict) -> dict:
+    """Difficulty, discrimination and option counts of one question row."""
+    answers, correct = row['answers'], row['correct']
+    p = correct / answers
+    mean = row['score_sum'] / answers
+    stddev = math.sqrt(max(row['score_sq_sum'] / answers - mean * mean, 0.0))
+    discrimination = None
+    if stddev > 0 and 0 < correct < answers:
+        mean_correct = row['correct_score_sum'] / correct
+        mean_wrong = (row['score_sum'] - row['correct_score_sum']) / (answers - correct)
+        discrimination = (mean_correct - mean_wrong) / stddev * math.sqrt(p * (1 - p))
+    return {
+        'index': row['_id'],
+        'answered': answers,
+        'difficulty': p,
+        'discrimination': discrimination,
+        'options': {str(option): count for option, count in row['options'].items()},
+    }
+
+
+async def _aggregate_rows(match: dict) -> list:
+    results_coll = await get_collection('results')
+    return await results_coll.aggregate(_item_pipeline(match)).to_list(length=None)
+
+
+async def _numpy_rows(match: dict) -> list:
+    """
+    The rows of _item_pipeline computed with NumPy from the raw answers, for
+    offline recomputation (the answers are read once, then everything is
+    vectorized). Requires NumPy, which the bot itself does not need.
+    """
+    import numpy as np
+
+    questions, options, correct, scores = [], [], [], []
+    results_coll = await get_collection('results')
+    cursor = results_coll.find(match, {'_id': 0, 'score': 1, 'selected_answers': 1})
+    async for result in cursor:
+        for answer in result.get('selected_answers', ()):
+            questions.append(answer['question_index_in_bank'])
+            options.append(answer['selected_option_index'])
+            correct.append(answer['is_correct'])
+            scores.append(result['score'])
+    if not questions:
+        return []
+
+    question = np.asarray(questions, dtype=np.int64)
+    option = np.asarray(options, dtype=np.int64)
+    is_correct = np.asarray(correct, dtype=bool)
+    score = np.asarray(scores, dtype=np.float64)
+    size = int(question.max()) + 1
+    width = int(option.max()) + 1
+
+    answers = np.bincount(question, minlength=size)
+    correct_count = np.bincount(question, weights=is_correct, minlength=size)
+    score_sum = np.bincount(question, weights=score, minlength=size)
+    score_sq_sum = np.bincount(question, weights=score * score, minlength=size)
+    correct_score_sum = np.bincount(question, weights=np.where(is_correct, score, 0.0), minlength=size)
+    option_counts = np.bincount(question * width + option, minlength=size * width).reshape(size, width)
+
+    return [
+        {
+            '_id': int(index),
+            'answers': int(answers[index]),
+            'correct': int(correct_count[index]),
+            'score_sum': float(score_sum[index]),
+            'score_sq_sum': float(score_sq_sum[index]),
+            'correct_score_sum': float(correct_score_sum[index]),
+            'options': {str(k): int(option_counts[index, k]) for k in np.flatnonzero(option_counts[index])},
+        }
+        for index in np.flatnonzero(answers)
+    ]
+
+
+async def analyze_test(test_id: str, owner: Optional[int] = None,
+                       refresh: bool = False, use_numpy: bool = False) -> Optional[dict]:
+    """
+    Item analysis of the current bank version of `test_id` over all its
+    activations (or those `owner` enabled). Served from the cache unless the
+    version or the number of finished attempts changed, or `refresh`.
+    Returns the analysis document plus 'questions' ({index: question} of
+    the analysed questions) and 'cached', or None if the test does not exist.
+    """
+    bank = await get_test_bank(test_id)
+    if bank is None:
+        return None
+    activation_ids = await _scope_activations(test_id, owner)
+    attempts = await _attempt_count(activation_ids)
+
+    analysis_coll = await get_collection(ANALYSIS_COLLECTION)
+    key = {'test_id': test_id, 'owner': owner}
+    analysis = await analysis_coll.find_one({'_id': key})
+    cached = (
+        not refresh and analysis is not None
+        and analysis.get('version') == bank.version and analysis.get('attempts') == attempts
+    )
+    if not cached:
+        match = _results_match(bank, activation_ids, owner)
+        rows = await (_numpy_rows(match) if use_numpy else _aggregate_rows(match))
+        analysis = {
+            '_id': key,
+            'version': bank.version,
+            'attempts': attempts,
+            'computed_at': datetime.datetime.now(datetime.timezone.utc),
+            'method': 'numpy' if use_numpy else 'aggregation',
+            'items': [_item(row) for row in rows if row['_id'] is not None],
+        }
+        await analysis_coll.replace_one({'_id': key}, analysis, upsert=True)
+        logger.info(
+            f"Item analysis of test '{test_id}' v{bank.version} (owner {owner}) computed "
+            f"({analysis['method']}): {len(analysis['items'])} question(s)."
+        )
+
+    analysis['questions'] = await get_questions(bank, [item['index'] for item in analysis['items']])
+    analysis['cached'] = cached
+    return analysis
+
+
+async def delete_item_analysis(test_id: str) -> int:
+    """Drops the cached analyses of a test (all scopes). Call when the test is deleted."""
+    analysis_coll = await get_collection(ANALYSIS_COLLECTION)
+    result = await analysis_coll.delete_many({'_id.test_id': test_id})
+    return result.deleted_count
@@ -0,0 +1,170 @@
+# utils/mongo_persistence.py
+
+import asyncio
+import copy
+from typing import Optional
+
+from pymongo import DeleteOne, ReplaceOne
+from telegram.ext import BasePersistence, PersistenceInput
+
+from db import get_collection
+from logging_config import logger
+from settings import PERSISTENCE_FLUSH_SECONDS, PERSISTENCE_BATCH_SIZE
+
+# {_id: user_id, data: {...}}
+USER_DATA_COLLECTION = 'ptb_user_data'
+# {_id: '<name>|<key parts>', name, key: [...], state}
+CONVERSATIONS_COLLECTION = 'ptb_conversations'
+
+
+def _conversation_id(name: str, key: tuple) -> str:
+    return '|'.join([name, *(str(part) for part in key)])
+
+
+class MongoPersistence(BasePersistence):
+    """
+    Stores user_data and conversation states in MongoDB.
+    PTB hands over changed entries every PERSISTENCE_FLUSH_SECONDS (and
+    once more on shutdown). They are staged per key, so repeated changes
+    collapse into one write, and written with unordered bulk_writes of at
+    most PERSISTENCE_BATCH_SIZE operations. No write happens per answer.
+    chat_data, bot_data and callback_data are not used by the bot and
+    are not stored.
+    """
+
+    def __init__(self):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=PERSISTENCE_FLUSH_SECONDS,
+        )
+        # (collection name, _id) -> pending write; only the latest one is kept
+        self._pending: dict = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        # Created on first use so it binds to the running event loop
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    # --- Loading (once, at application start) ---
+
+    async def get_user_data(self) -> dict:
+        collection = await get_collection(USER_DATA_COLLECTION)
+        user_data = {}
+        async for doc in collection.find({}):
+            user_data[doc['_id']] = doc.get('data') or {}
+        logger.info(f'Persistence restored user_data of {len(user_data)} user(s).')
+        return user_data
+
+    async def get_conversations(self, name: str) -> dict:
+        collection = await get_collection(CONVERSATIONS_COLLECTION)
+        conversations = {}
+        async for doc in collection.find({'name': name}):
+            conversations[tuple(doc['key'])] = doc['state']
+        logger.info(f"Persistence restored {len(conversations)} '{name}' conversation(s).")
+        return conversations
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    # --- Staging (called by PTB in one burst per update interval) ---
+
+    def _stage(self, collection_name: str, doc_id, operation) -> None:
+        self._pending[(collection_name, doc_id)] = operation
+        # The rest of PTB's burst is already queued on the loop, so a task
+        # created now runs after it and writes the whole burst together
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_pending())
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        # Staged as a copy: handlers keep changing the live dict until the
+        # flush serializes it, which could store (or fail on) a half-made change
+        self._stage(
+            USER_DATA_COLLECTION, user_id,
+            ReplaceOne({'_id': user_id}, {'_id': user_id, 'data': copy.deepcopy(data)}, upsert=True)
+        )
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stage(USER_DATA_COLLECTION, user_id, DeleteOne({'_id': user_id}))
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        doc_id = _conversation_id(name, key)
+        if new_state is None:
+            operation = DeleteOne({'_id': doc_id})
+        else:
+            operation = ReplaceOne(
+                {'_id': doc_id},
+                {'_id': doc_id, 'name': name, 'key': list(key), 'state': copy.deepcopy(new_state)},
+                upsert=True
+            )
+        self._stage(CONVERSATIONS_COLLECTION, doc_id, operation)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass # This process is the only writer; in-memory data is current
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    # --- Writing ---
+
+    async def _flush_pending(self) -> int:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+
+            by_collection: dict = {}
+            for (collection_name, doc_id), operation in batch.items():
+                by_collection.setdefault(collection_name, []).append(((collection_name, doc_id), operation))
+
+            written = 0
+            for collection_name, entries in by_collection.items():
+                collection = await get_collection(collection_name)
+                for start in range(0, len(entries), PERSISTENCE_BATCH_SIZE):
+                    chunk = entries[start:start + PERSISTENCE_BATCH_SIZE]
+                    try:
+                        await collection.bulk_write([op for _, op in chunk], ordered=False)
+                        written += len(chunk)
+                    except Exception as e:
+                        # Replaces and deletes are idempotent, so the chunk is
+                        # retried with the next flush unless newer state arrived
+                        logger.error(
+                            f"Persistence flush of {len(chunk)} write(s) to "
+                            f"'{collection_name}' failed: {e}"
+                        )
+                        for key, operation in chunk:
+                            self._pending.setdefault(key, operation)
+
+            logger.debug(f'Persistence flushed {written} write(s).')
+            return written
+
+    async def flush(self) -> None:
+        """Called by PTB on shutdown, after the final update run."""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        written = await self._flush_pending()
+        if self._pending:
+            logger.error(f'Persistence could not save {len(self._pending)} session write(s) on shutdown.')
+        logger.info(f'Persistence flushed on shutdown ({written} pending write(s)).')
@@ -0,0 +1,85 @@
+# utils/pool_monitor.py
+
+import threading
+
+from pymongo import monitoring
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Collects live connection pool counters from pymongo pool events.
+    Events arrive from driver threads, so all updates take a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            'pools': 0,
+            'open_connections': 0,
+            'checked_out': 0,
+            'waiting': 0,
+            'total_checkouts': 0,
+            'checkout_failures': 0,
+            'pool_clears': 0,
+            'max_checkout_wait_ms': 0.0,
+            'total_checkout_wait_ms': 0.0,
+        }
+
+    def _add(self, key: str, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def snapshot(self) -> dict:
+        """Returns a copy of the counters plus the average checkout wait."""
+        with self._lock:
+            stats = dict(self._stats)
+        checkouts = stats['total_checkouts']
+        stats['avg_checkout_wait_ms'] = (
+            stats['total_checkout_wait_ms'] / checkouts if checkouts else 0.0
+        )
+        return stats
+
+    # --- Pool events ---
+    def pool_created(self, event):
+        self._add('pools')
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add('pool_clears')
+
+    def pool_closed(self, event):
+        self._add('pools', -1)
+
+    # --- Connection events ---
+    def connection_created(self, event):
+        self._add('open_connections')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add('open_connections', -1)
+
+    def connection_check_out_started(self, event):
+        self._add('waiting')
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._stats['waiting'] -= 1
+            self._stats['checkout_failures'] += 1
+
+    def connection_checked_out(self, event):
+        # duration is reported in seconds by pymongo 4.7+
+        wait_ms = (getattr(event, 'duration', None) or 0.0) * 1000
+        with self._lock:
+            self._stats['waiting'] -= 1
+            self._stats['checked_out'] += 1
+            self._stats['total_checkouts'] += 1
+            self._stats['total_checkout_wait_ms'] += wait_ms
+            if wait_ms > self._stats['max_checkout_wait_ms']:
+                self._stats['max_checkout_wait_ms'] = wait_ms
+
+    def connection_checked_in(self, event):
+        self._add('checked_out', -1)
@@ -0,0 +1,202 @@
+# utils/question_store.py
+
+import datetime
+import random
+from collections import OrderedDict
+
+from pymongo import ReturnDocument
+
+from db import get_collection
+from logging_config import logger
+from settings import (
+    QUESTION_STORAGE_MODE, QUESTION_COLLECTION_THRESHOLD, QUESTION_CACHE_SIZE
+)
+from utils.test_bank_cache import TestBank, invalidate_test_bank, freeze_question
+
+# Questions of 'collection' banks live in their own documents:
+# {test_id, version, index, question_text, options, correct_option_index}.
+# 'embedded' banks keep the questions array in the tests document.
+QUESTIONS_COLLECTION = 'test_questions'
+# {_id: test_id, version}: the last bank version handed out per test. Kept
+# apart from 'tests', whose version must only change once the questions
+# of that version are stored; kept on delete, so versions never repeat.
+VERSIONS_COLLECTION = 'test_versions'
+
+# (test_id, version, index) -> read-only question, for 'collection' banks
+_question_cache: OrderedDict = OrderedDict()
+
+
+def choose_storage(num_questions: int) -> str:
+    """Picks the storage mode for a bank of the given size."""
+    if QUESTION_STORAGE_MODE == 'auto':
+        return 'collection' if num_questions >= QUESTION_COLLECTION_THRESHOLD else 'embedded'
+    return QUESTION_STORAGE_MODE
+
+
+def _cache_question(test_id: str, version: int, index: int, question) -> None:
+    if QUESTION_CACHE_SIZE <= 0:
+        return
+    key = (test_id, version, index)
+    _question_cache[key] = question
+    _question_cache.move_to_end(key)
+    while len(_question_cache) > QUESTION_CACHE_SIZE:
+        _question_cache.popitem(last=False)
+
+
+def _strip(doc: dict) -> dict:
+    """Removes the bookkeeping fields of a question document."""
+    return {
+        key: value for key, value in doc.items()
+        if key not in ('_id', 'test_id', 'version', 'index')
+    }
+
+
+async def _next_version(test_id: str) -> int:
+    """
+    Allocates the next bank version of a test with one atomic $inc, so
+    concurrent uploads never get the same version. The counter is first
+    raised to the stored version (tests uploaded before it existed).
+    """
+    tests_collection = await get_collection('tests')
+    versions_collection = await get_collection(VERSIONS_COLLECTION)
+    current = await tests_collection.find_one({'test_id': test_id}, {'_id': 0, 'version': 1})
+    if current and current.get('version'):
+        await versions_collection.update_one(
+            {'_id': test_id}, {'$max': {'version': current['version']}}, upsert=True
+        )
+    counter = await versions_collection.find_one_and_update(
+        {'_id': test_id},
+        {'$inc': {'version': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter['version']
+
+
+async def store_test_bank(test_id: str, questions: list, fields: dict):
+    """
+    Upserts a test bank and its questions in the configured storage mode,
+    migrating the test between modes if needed. `fields` holds extra
+    tests-document fields (title, uploaded_by_user_id, ...).
+    Returns the UpdateResult of the tests document upsert.
+    """
+    tests_collection = await get_collection('tests')
+    questions_collection = await get_collection(QUESTIONS_COLLECTION)
+
+    version = await _next_version(test_id)
+    storage = choose_storage(len(questions))
+
+    set_data = dict(fields)
+    set_data.update({
+        'total_questions': len(questions),
+        'upload_timestamp': datetime.datetime.now(datetime.timezone.utc),
+        'version': version,
+        'storage': storage,
+    })
+    update = {'$set': set_data, '$setOnInsert': {'test_id': test_id}}
+
+    if storage == 'collection':
+        # New version first, so the tests document never points at
+        # questions that are not there yet
+        await questions_collection.insert_many(
+            [
+                dict(q, test_id=test_id, version=version, index=i)
+                for i, q in enumerate(questions)
+            ],
+            ordered=False
+        )
+        update['$unset'] = {'questions': ''}
+    else:
+        set_data['questions'] = questions
+
+    result = await tests_collection.update_one({'test_id': test_id}, update, upsert=True)
+    invalidate_test_bank(test_id)
+
+    # Older versions (or everything, for embedded banks) are stale now;
+    # a newer version stored by a concurrent upload is left alone
+    stale_filter = {'test_id': test_id}
+    if storage == 'collection':
+        stale_filter['version'] = {'$lt': version}
+    deleted = await questions_collection.delete_many(stale_filter)
+    if deleted.deleted_count:
+        logger.info(
+            f"Removed {deleted.deleted_count} stale question document(s) of test '{test_id}'."
+        )
+
+    logger.info(f"Stored test '{test_id}' v{version}: {len(questions)} questions ({storage}).")
+    return result
+
+
+async def delete_questions(test_id: str) -> int:
+    """Deletes the question documents of a test (no-op for embedded banks)."""
+    questions_collection = await get_collection(QUESTIONS_COLLECTION)
+    result = await questions_collection.delete_many({'test_id': test_id})
+    return result.deleted_count
+
+
+async def sample_questions(bank: TestBank, count: int) -> list:
+    """
+    Picks `count` random questions of a bank as (index, question) pairs.
+    For 'collection' banks the database does the sampling, so only the
+    chosen questions are transferred.
+    """
+    count = min(count, bank.total_questions)
+    if bank.storage != 'collection':
+        return [(i, bank.questions[i]) for i in random.sample(range(len(bank.questions)), count)]
+
+    questions_collection = await get_collection(QUESTIONS_COLLECTION)
+    cursor = questions_collection.aggregate([
+        {'$match': {'test_id': bank.test_id, 'version': bank.version}},
+        {'$sample': {'size': count}},
+        {'$project': {'_id': 0}},
+    ])
+    selected = []
+    async for doc in cursor:
+        question = freeze_question(_strip(doc))
+        _cache_question(bank.test_id, bank.version, doc['index'], question)
+        selected.append((doc['index'], question))
+    return selected
+
+
+async def get_questions(bank: TestBank, indices) -> dict:
+    """Returns {index: question} for the given indices of a bank."""
+    if bank.storage != 'collection':
+        return {i: bank.questions[i] for i in indices if 0 <= i < len(bank.questions)}
+
+    version = bank.version
+    found = {}
+    missing = []
+    for i in indices:
+        question = _question_cache.get((bank.test_id, version, i))
+        if question is None:
+            missing.append(i)
+        else:
+            _question_cache.move_to_end((bank.test_id, version, i))
+            found[i] = question
+
+    if missing:
+        questions_collection = await get_collection(QUESTIONS_COLLECTION)
+        cursor = questions_collection.find(
+            {'test_id': bank.test_id, 'version': version, 'index': {'$in': missing}},
+            {'_id': 0}
+        )
+        async for doc in cursor:
+            question = freeze_question(_strip(doc))
+            _cache_question(bank.test_id, version, doc['index'], question)
+            found[doc['index']] = question
+    return found
+
+
+async def iter_questions(bank: TestBank):
+    """Yields (index, question) for every question of a bank, in order."""
+    if bank.storage != 'collection':
+        for i, question in enumerate(bank.questions):
+            yield i, question
+        return
+
+    questions_collection = await get_collection(QUESTIONS_COLLECTION)
+    cursor = questions_collection.find(
+        {'test_id': bank.test_id, 'version': bank.version}, {'_id': 0}
+    ).sort('index', 1)
+    async for doc in cursor:
+        yield doc['index'], _strip(doc)
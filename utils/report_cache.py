@@ -0,0 +1,72 @@
+# utils/report_cache.py
+
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from logging_config import logger
+from settings import REPORT_CACHE_MAX_SIZE, REPORT_CACHE_TTL_SECONDS
+
+# Rendered report outputs (/results pages, Telegram file_ids of /txt
+# documents). A view identifies what was asked and by whom, e.g.
+#   ('txt', test_id, owner)  owner: teacher's user_id, None for admins
+# and is stored with the high-water mark of its results (_id of the newest
+# finished result, utils.result_reports.latest_result_id):
+#   view -> (watermark, value, expires_at), ordered by last use (LRU)
+# A new result changes the mark, so the entry is simply not used again.
+# The TTL bounds staleness from a result whose write lands after a newer
+# one (write-behind retries), which the mark does not see.
+_cache: OrderedDict = OrderedDict()
+_stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0, 'invalidations': 0}
+
+
+def get_cached_report(view: tuple, watermark) -> Optional[Any]:
+    """The cached output of `view` if it was rendered at `watermark`, else None."""
+    entry = _cache.get(view)
+    if entry is not None:
+        cached_watermark, value, expires_at = entry
+        if cached_watermark == watermark and expires_at > time.monotonic():
+            _cache.move_to_end(view)
+            _stats['hits'] += 1
+            return value
+        del _cache[view]
+        _stats['stale'] += 1
+    _stats['misses'] += 1
+    return None
+
+
+def cache_report(view: tuple, watermark, value: Any) -> None:
+    """Stores the output of `view` rendered at `watermark`, evicting the least recently used."""
+    if watermark is None or REPORT_CACHE_TTL_SECONDS <= 0 or REPORT_CACHE_MAX_SIZE <= 0:
+        return
+    _cache[view] = (watermark, value, time.monotonic() + REPORT_CACHE_TTL_SECONDS)
+    _cache.move_to_end(view)
+    while len(_cache) > REPORT_CACHE_MAX_SIZE:
+        _cache.popitem(last=False)
+        _stats['evictions'] += 1
+
+
+def invalidate_report(view: tuple) -> None:
+    """Drops a cached output, e.g. a file_id Telegram no longer accepts."""
+    if _cache.pop(view, None) is not None:
+        _stats['invalidations'] += 1
+        logger.debug(f'Report cache entry {view} invalidated.')
+
+
+def get_report_cache_stats() -> dict:
+    """Returns report cache counters and current size."""
+    stats = dict(_stats)
+    stats['size'] = len(_cache)
+    return stats
+
+
+def format_report_cache_stats() -> str:
+    """get_report_cache_stats() as a /db_stats section."""
+    stats = get_report_cache_stats()
+    return (
+        "📄 Кэш отчетов (/results, /txt):\n"
+        f"Записей: {stats['size']}\n"
+        f"Попаданий / промахов: {stats['hits']} / {stats['misses']}\n"
+        f"Устарело: {stats['stale']}, вытеснено: {stats['evictions']}, "
+        f"сброшено: {stats['invalidations']}"
+    )
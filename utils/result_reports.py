@@ -0,0 +1,153 @@
+# utils/result_reports.py
+
+import tempfile
+from typing import AsyncIterator, Callable, Optional
+
+from db import get_collection
+from settings import REPORT_SPOOL_MAX_BYTES, RESULTS_PAGE_SIZE, TEMP_FOLDER
+from utils.result_writer import IN_PROGRESS
+
+# Fields a report line shows; nothing else leaves the server
+REPORT_FIELDS = {'username': 1, 'score': 1, 'attempt_number': 1, 'end_timestamp': 1}
+# Formatted lines are encoded and written this many at a time
+SPOOL_WRITE_LINES = 500
+# /results pages show the report fields plus the test of each row
+PAGE_FIELDS = dict(REPORT_FIELDS, test_id=1)
+
+
+def _owner_stages(owner: int) -> list:
+    """Keeps rows of activations enabled by `owner` (teacher permission)."""
+    return [
+        {'$lookup': {
+            'from': 'active_tests',
+            'localField': 'active_test_id',
+            'foreignField': '_id',
+            'as': 'activation',
+        }},
+        {'$match': {'activation.enabled_by_user_id': owner}},
+    ]
+
+
+def _report_pipeline(test_id: str, user_id: int, role: str) -> list:
+    """
+    Finished results of a test, sorted by username then finish time.
+    $match + $sort come first so they run on the results.test_report index
+    and rows stream in order, with no in-memory sort. Teachers only see
+    results of activations they enabled: each row is joined with its
+    activation by _id. Admins see everything; results cannot outlive their
+    activation (/delete_test refuses tests with results).
+    """
+    pipeline = [
+        {'$match': {'test_id': test_id, 'status': {'$ne': IN_PROGRESS}}},
+        {'$sort': {'username': 1, 'end_timestamp': 1, '_id': 1}},
+    ]
+    if role != 'admin':
+        pipeline += _owner_stages(user_id)
+    pipeline.append({'$project': REPORT_FIELDS})
+    return pipeline
+
+
+async def iter_test_results(test_id: str, user_id: int, role: str) -> AsyncIterator[dict]:
+    """
+    Yields the results of `test_id` that `user_id` (admin or teacher) may
+    see, in report order, one projected document at a time.
+    """
+    results_coll = await get_collection('results')
+    async for result in results_coll.aggregate(_report_pipeline(test_id, user_id, role)):
+        yield result
+
+
+def _page_pipeline(scope: dict, owner: Optional[int], key: Optional[tuple], older: bool) -> list:
+    """
+    Keyset page query, newest first: rows strictly older (or newer) than
+    `key` = (end_timestamp, _id), read in that direction on the
+    results.user_recent / results.test_recent index. One row beyond the
+    page tells whether there are more.
+    """
+    match = dict(scope, status={'$ne': IN_PROGRESS})
+    if key is not None:
+        end_timestamp, result_id = key
+        op = '$lt' if older else '$gt'
+        match['$or'] = [
+            {'end_timestamp': {op: end_timestamp}},
+            {'end_timestamp': end_timestamp, '_id': {op: result_id}},
+        ]
+    direction = -1 if older else 1
+    pipeline = [{'$match': match}, {'$sort': {'end_timestamp': direction, '_id': direction}}]
+    if owner is not None:
+        pipeline += _owner_stages(owner)
+    pipeline += [{'$limit': RESULTS_PAGE_SIZE + 1}, {'$project': PAGE_FIELDS}]
+    return pipeline
+
+
+async def fetch_results_page(scope: dict, owner: Optional[int] = None,
+                             key: Optional[tuple] = None, older: bool = True) -> tuple:
+    """
+    One page (RESULTS_PAGE_SIZE rows) of finished results matching `scope`
+    ({'user_id': ...} or {'test_id': ...}), newest first. `owner` limits
+    rows to activations that teacher enabled. Without `key` this is the
+    first page; with it, the page right after (`older`) or right before
+    the row `key` identifies. Returns (rows, more), `more` telling whether
+    rows exist beyond the page in the direction it was read.
+    """
+    results_coll = await get_collection('results')
+    rows = await results_coll.aggregate(_page_pipeline(scope, owner, key, older)).to_list(length=None)
+    more = len(rows) > RESULTS_PAGE_SIZE
+    rows = rows[:RESULTS_PAGE_SIZE]
+    if not older:
+        rows.reverse()
+    return rows, more
+
+
+async def latest_result_id(scope: dict):
+    """
+    _id of the newest finished result matching `scope` ({'user_id': ...} or
+    {'test_id': ...}), None if there is none: the high-water mark that keys
+    cached reports (utils.report_cache). One row read on the
+    results.user_recent / results.test_recent index.
+    """
+    results_coll = await get_collection('results')
+    result = await results_coll.find_one(
+        dict(scope, status={'$ne': IN_PROGRESS}), {'_id': 1},
+        sort=[('end_timestamp', -1), ('_id', -1)],
+    )
+    return result['_id'] if result else None
+
+
+def format_result_line(result: dict) -> str:
+    """One report line, shared by /results <test_id> and /txt."""
+    res_username = result.get('username', 'N/A')
+    score = result.get('score', 0.0)
+    attempt = result.get('attempt_number', 1)
+    timestamp = result.get('end_timestamp')
+    time_str = timestamp.strftime('%Y-%m-%d %H:%M') if timestamp else 'N/A'
+    return f"@{res_username}: Попытка {attempt}, Оценка: {score:.1f}%, Завершен: {time_str}"
+
+
+async def spool_report(header: str, rows: AsyncIterator[dict],
+                       format_line: Callable[[dict], str] = format_result_line) -> tuple:
+    """
+    Writes `header` and one line per row (newline-separated, UTF-8) to a
+    SpooledTemporaryFile as the rows arrive: in memory up to
+    REPORT_SPOOL_MAX_BYTES, in TEMP_FOLDER beyond. Memory stays bounded by
+    SPOOL_WRITE_LINES lines whatever the number of rows.
+    Returns (file positioned at the start, row count); the caller closes it.
+    """
+    report = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_BYTES, mode='w+b', dir=TEMP_FOLDER)
+    try:
+        report.write(header.encode())
+        count = 0
+        lines = []
+        async for row in rows:
+            # Separator before every line but the first, as in '\n'.join
+            lines.append(('\n' if count else '') + format_line(row))
+            count += 1
+            if len(lines) >= SPOOL_WRITE_LINES:
+                report.write(''.join(lines).encode())
+                lines = []
+        report.write(''.join(lines).encode())
+        report.seek(0)
+        return report, count
+    except BaseException:
+        report.close()
+        raise
@@ -0,0 +1,380 @@
+# utils/result_writer.py
+
+import asyncio
+import time
+from typing import Optional
+
+from bson import ObjectId
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from db import get_collection
+from logging_config import logger
+from settings import (
+    RESULT_WRITER_BATCH_SIZE, RESULT_WRITER_FLUSH_MS,
+    RESULT_WRITER_CHECKPOINT_SECONDS, RESULT_WRITER_CHECKPOINT_ANSWERS,
+)
+
+# Every attempt is one document in 'results', created when it starts with
+# status 'in_progress' and finalized in place when it ends:
+#   {_id, user_id, username, test_id, active_test_id, attempt_number,
+#    bank_version, status, answered, selected_answers: [...], start_timestamp,
+#    session: {...}  (what a restarted bot needs to resume; removed when final)
+#    score, correct_count, total_questions, end_timestamp  (when final)}
+IN_PROGRESS = 'in_progress'
+FINISHED = 'finished'
+
+# attempt _id -> staged changes not yet written. Changes of one attempt are
+# merged into a single operation: answers accumulate and go out as one
+# $push every RESULT_WRITER_CHECKPOINT_SECONDS or after
+# RESULT_WRITER_CHECKPOINT_ANSWERS answers; creating and finalizing an
+# attempt go out with the next flush (RESULT_WRITER_FLUSH_MS).
+#   {'insert': new document or None, 'base': answers already written,
+#    'answers': [...], 'set': {...}, 'unset': bool, 'delete': bool,
+#    'urgent': bool, 'since': monotonic time of the first staged answer,
+#    'verify': bool (a previous write failed and may have been applied)}
+_pending: dict = {}
+_flush_task: Optional[asyncio.Task] = None
+_batch_task: Optional[asyncio.Task] = None
+# Created on first use so it binds to the running event loop
+_flush_lock: Optional[asyncio.Lock] = None
+# Attempts finalized since the last flush started
+_finalized_since_flush = 0
+_stats = {
+    'opened': 0, 'finalized': 0, 'discarded': 0, 'answers': 0,
+    'operations': 0, 'answer_operations': 0, 'requests': 0, 'retried': 0,
+    'unmatched': 0,
+}
+
+
+def _entry(attempt_id: ObjectId, answered: int) -> dict:
+    entry = _pending.get(attempt_id)
+    if entry is None:
+        entry = _pending[attempt_id] = {
+            'insert': None, 'base': answered, 'answers': [], 'set': {},
+            'unset': False, 'delete': False, 'urgent': False, 'since': None,
+            'verify': False,
+        }
+    return entry
+
+
+def _request_flush() -> None:
+    global _batch_task
+    if _batch_task is None or _batch_task.done():
+        _batch_task = asyncio.create_task(flush_results())
+
+
+def open_attempt(attempt_doc: dict) -> ObjectId:
+    """
+    Queues the document of a starting attempt (status 'in_progress'). It may
+    already carry answers, e.g. when a restored session is re-created.
+    Returns its _id, which identifies the attempt in the calls below.
+    """
+    attempt_id = attempt_doc.setdefault('_id', ObjectId())
+    attempt_doc['status'] = IN_PROGRESS
+    answers = attempt_doc.pop('selected_answers', [])
+    entry = _entry(attempt_id, 0)
+    entry['insert'] = attempt_doc
+    entry['answers'][:0] = answers
+    entry['urgent'] = True
+    _stats['opened'] += 1
+    _stats['answers'] += len(answers)
+    return attempt_id
+
+
+def record_answer(attempt_id: ObjectId, position: int, answer: dict) -> None:
+    """Stages the answer to question `position` (0-based) of an attempt."""
+    entry = _entry(attempt_id, position)
+    entry['answers'].append(answer)
+    if entry['since'] is None:
+        entry['since'] = time.monotonic()
+    _stats['answers'] += 1
+    if len(entry['answers']) >= RESULT_WRITER_CHECKPOINT_ANSWERS:
+        entry['urgent'] = True
+        _request_flush()
+
+
+def finalize_attempt(attempt_id: ObjectId, answered: int, fields: dict) -> None:
+    """
+    Marks an attempt finished with its final fields (score, end_timestamp,
+    ...). Staged answers are written in the same operation. Returns at once;
+    written within RESULT_WRITER_FLUSH_MS.
+    """
+    global _finalized_since_flush
+    entry = _entry(attempt_id, answered)
+    entry['set'].update(fields)
+    entry['set']['status'] = FINISHED
+    entry['unset'] = True
+    entry['urgent'] = True
+    _stats['finalized'] += 1
+    _finalized_since_flush += 1
+    if _finalized_since_flush >= RESULT_WRITER_BATCH_SIZE:
+        _request_flush()
+
+
+def discard_attempt(attempt_id: ObjectId) -> None:
+    """Removes an attempt that does not count (cancelled, test changed)."""
+    entry = _entry(attempt_id, 0)
+    entry.update(insert=None, answers=[], set={}, unset=False, delete=True, urgent=True)
+    _stats['discarded'] += 1
+
+
+def _due(entry: dict, now: float, everything: bool) -> bool:
+    if everything or entry['urgent']:
+        return True
+    return entry['since'] is not None and now - entry['since'] >= RESULT_WRITER_CHECKPOINT_SECONDS
+
+
+def _operation(attempt_id: ObjectId, entry: dict):
+    if entry['delete']:
+        return DeleteOne({'_id': attempt_id})
+    update = {'$set': dict(entry['set'], answered=entry['base'] + len(entry['answers']))}
+    if entry['answers']:
+        update['$push'] = {'selected_answers': {'$each': list(entry['answers'])}}
+    if entry['unset']:
+        update['$unset'] = {'session': ''}
+    if entry['insert'] is not None:
+        update['$setOnInsert'] = {
+            field: value for field, value in entry['insert'].items()
+            if field not in update['$set'] and field != '_id'
+            and not (field == 'session' and entry['unset'])
+        }
+        if not entry['answers']:
+            update['$setOnInsert']['selected_answers'] = []
+    # Matching the written answer count keeps a stale operation from
+    # pushing answers twice; retries are trimmed first (see _verify)
+    return UpdateOne(
+        {'_id': attempt_id, 'answered': entry['base']}, update,
+        upsert=entry['insert'] is not None
+    )
+
+
+def _requeue(attempt_id: ObjectId, failed: dict) -> None:
+    """Puts a failed entry back in front of changes staged meanwhile."""
+    newer = _pending.pop(attempt_id, None)
+    if newer is not None and not newer['delete']:
+        failed['answers'].extend(newer['answers'])
+        failed['set'].update(newer['set'])
+        failed['unset'] = failed['unset'] or newer['unset']
+        failed['urgent'] = failed['urgent'] or newer['urgent']
+    elif newer is not None:
+        failed = newer
+    failed['verify'] = True
+    _pending[attempt_id] = failed
+
+
+async def flush_results(everything: bool = False) -> int:
+    """
+    Writes due staged changes with unordered bulk_write batches; with
+    `everything`, also answers still waiting for their checkpoint.
+    Returns the number of attempts written.
+    """
+    global _flush_lock, _finalized_since_flush
+    if _flush_lock is None:
+        _flush_lock = asyncio.Lock()
+    async with _flush_lock:
+        _finalized_since_flush = 0
+        now = time.monotonic()
+        due = [attempt_id for attempt_id, entry in _pending.items() if _due(entry, now, everything)]
+        written = 0
+        for start in range(0, len(due), RESULT_WRITER_BATCH_SIZE):
+            batch = [
+                (attempt_id, _pending.pop(attempt_id))
+                for attempt_id in due[start:start + RESULT_WRITER_BATCH_SIZE]
+            ]
+            failed = await _write_batch(batch)
+            written += len(batch) - len(failed)
+            if failed:
+                _stats['retried'] += len(failed)
+                for attempt_id, entry in failed:
+                    _requeue(attempt_id, entry)
+                break # The rest stays staged for the next flush
+        return written
+
+
+async def _verify(results_coll, batch: list) -> set:
+    """
+    Before retrying, re-aligns entries with their stored document: drops
+    answers a failed write did apply after all and the insert of a document
+    that exists, and moves 'base' to the stored answer count. Returns the
+    attempts whose document is gone (nothing can be written for them).
+    """
+    entries = {attempt_id: entry for attempt_id, entry in batch if entry['verify'] and not entry['delete']}
+    if not entries:
+        return set()
+    found = set()
+    async for doc in results_coll.find({'_id': {'$in': list(entries)}}, {'answered': 1}):
+        found.add(doc['_id'])
+        entry = entries[doc['_id']]
+        answered = doc.get('answered', 0)
+        if answered < entry['base']:
+            logger.error(
+                f"Result writer: attempt {doc['_id']} has {answered} answer(s) stored, "
+                f"{entry['base']} expected; answers {answered + 1}-{entry['base']} are missing."
+            )
+        applied = min(max(answered - entry['base'], 0), len(entry['answers']))
+        del entry['answers'][:applied]
+        # The stored count is what the next write must match
+        entry['base'] = answered
+        entry['insert'] = None
+    gone = set()
+    for attempt_id, entry in entries.items():
+        entry['verify'] = False
+        if attempt_id not in found and entry['insert'] is None:
+            gone.add(attempt_id)
+    if gone:
+        logger.critical(
+            f'Result writer: {len(gone)} attempt document(s) no longer exist, dropping their '
+            f'changes: {[str(attempt_id) for attempt_id in gone]}'
+        )
+    return gone
+
+
+async def _unmatched(results_coll, batch: list, details: dict, failed_indexes: set) -> list:
+    """
+    Update operations of the batch that matched no document (the stored
+    answer count was not 'base', e.g. after a restore or a partly applied
+    retry) and so changed nothing. Only checked when the matched and
+    upserted counts fall short of the updates sent.
+    """
+    expected = [
+        i for i, (_, entry) in enumerate(batch)
+        if not entry['delete'] and i not in failed_indexes
+    ]
+    if details.get('nMatched', 0) + details.get('nUpserted', 0) >= len(expected):
+        return []
+    upserted = {item['index'] for item in details.get('upserted', [])}
+    check = {batch[i][0]: batch[i][1] for i in expected if i not in upserted}
+    stored = {
+        doc['_id']: doc.get('answered')
+        async for doc in results_coll.find({'_id': {'$in': list(check)}}, {'answered': 1})
+    }
+    return [
+        (attempt_id, entry) for attempt_id, entry in check.items()
+        if stored.get(attempt_id) != entry['base'] + len(entry['answers'])
+    ]
+
+
+async def _write_batch(batch: list) -> list:
+    """Writes one batch. Returns the (attempt_id, entry) pairs to retry."""
+    _stats['requests'] += 1
+    failed_indexes = set()
+    try:
+        results_coll = await get_collection('results')
+        gone = await _verify(results_coll, batch)
+        if gone:
+            batch = [pair for pair in batch if pair[0] not in gone]
+            if not batch:
+                return []
+        operations = [_operation(attempt_id, entry) for attempt_id, entry in batch]
+        try:
+            details = (await results_coll.bulk_write(operations, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            # Without write errors the failure was the write concern; every
+            # operation may or may not be applied, and is verified on retry
+            details = e.details
+            failed_indexes = {error['index'] for error in details.get('writeErrors', [])}
+            if not failed_indexes:
+                failed_indexes = set(range(len(batch)))
+            logger.error(
+                f'Result writer: {len(failed_indexes)} of {len(batch)} attempt write(s) failed, will retry: '
+                f"{details.get('writeErrors', [])[:1] or e}"
+            )
+        unmatched = await _unmatched(results_coll, batch, details, failed_indexes)
+    except Exception as e:
+        logger.error(f'Result writer: batch of {len(batch)} attempt write(s) failed, will retry: {e}')
+        return batch
+
+    if unmatched:
+        # Nothing was written for these: retried after _verify re-aligns them
+        _stats['unmatched'] += len(unmatched)
+        logger.error(
+            f'Result writer: {len(unmatched)} of {len(batch)} attempt write(s) matched no document '
+            f'(stored answer count differs), will re-align and retry: '
+            f'{[str(attempt_id) for attempt_id, _ in unmatched[:5]]}'
+        )
+    unmatched_ids = {attempt_id for attempt_id, _ in unmatched}
+    failed = [pair for i, pair in enumerate(batch) if i in failed_indexes or pair[0] in unmatched_ids]
+    _count_written([pair for i, pair in enumerate(batch) if i not in failed_indexes and pair[0] not in unmatched_ids])
+    if not failed:
+        logger.debug(f'Result writer stored changes of {len(batch)} attempt(s).')
+    return failed
+
+
+def _count_written(batch: list) -> None:
+    _stats['operations'] += len(batch)
+    _stats['answer_operations'] += sum(1 for _, entry in batch if entry['answers'])
+
+
+async def _flush_loop() -> None:
+    interval = RESULT_WRITER_FLUSH_MS / 1000
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_results()
+        except Exception as e:
+            logger.exception(f'Unexpected error in result writer flush loop: {e}')
+
+
+def start_result_writer() -> None:
+    """Starts the periodic background flush."""
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_loop())
+        logger.info(
+            f'Result writer started (batch {RESULT_WRITER_BATCH_SIZE}, '
+            f'flush every {RESULT_WRITER_FLUSH_MS} ms, answers checkpointed every '
+            f'{RESULT_WRITER_CHECKPOINT_SECONDS:g} s or {RESULT_WRITER_CHECKPOINT_ANSWERS} answers).'
+        )
+
+
+async def stop_result_writer() -> None:
+    """Stops the background flush and writes whatever is still pending."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    flushed = await flush_results(everything=True)
+    if _pending:
+        # Last resort: one more attempt after a short pause
+        await asyncio.sleep(1)
+        flushed += await flush_results(everything=True)
+    if _pending:
+        logger.critical(
+            f'Result writer stopped with unsaved changes of {len(_pending)} attempt(s): '
+            f'{[str(attempt_id) for attempt_id in _pending]}'
+        )
+    logger.info(f'Result writer stopped ({flushed} pending attempt(s) flushed).')
+
+
+def get_result_writer_stats() -> dict:
+    """
+    Returns writer counters and the current backlog. 'writes_per_answer'
+    is the number of answer-carrying operations per recorded answer (1.0
+    would be one write per answer).
+    """
+    stats = dict(_stats)
+    stats['pending'] = len(_pending)
+    stats['pending_answers'] = sum(len(entry['answers']) for entry in _pending.values())
+    stats['writes_per_answer'] = (
+        stats['answer_operations'] / stats['answers'] if stats['answers'] else 0.0
+    )
+    return stats
+
+
+def format_result_writer_stats() -> str:
+    """get_result_writer_stats() as a /db_stats section."""
+    stats = get_result_writer_stats()
+    return (
+        "📝 Запись попыток:\n"
+        f"Начато / завершено / отменено: {stats['opened']} / "
+        f"{stats['finalized']} / {stats['discarded']}\n"
+        f"Ответов: {stats['answers']}, записей на ответ: {stats['writes_per_answer']:.2f}\n"
+        f"Операций / запросов: {stats['operations']} / {stats['requests']}\n"
+        f"В очереди: {stats['pending']} (ответов: {stats['pending_answers']}), "
+        f"повторов: {stats['retried']}, без совпадения: {stats['unmatched']}"
+    )
@@ -12,7 +12,8 @@ from settings import (
     ADMIN_USER_ID, ADMIN_USERNAME,
     INITIAL_SEED_ENABLED, TESTS_SEED_FOLDER, TEACHERS_SEED_FILE
 )
-from utils.common_helpers import normalize_test_id
+from utils.common_helpers import normalize_test_id, parse_question_row
+from utils.question_store import store_test_bank
 
 async def _seed_initial_admin():
     """
@@ -110,51 +111,38 @@ async def _seed_tests():
                         line_num += 1
                         if not row or not row[0].strip(): continue
 
-                        if len(row) != 6:
+                        question, problem = parse_question_row(row)
+                        if problem == 'columns':
                             logger.warning(
                                 f"Seed file '{filename}', line {line_num}: Expected 6 columns, found {len(row)}. Skipping row."
                             )
                             continue
-
-                        question_text = row[0].strip()
-                        correct_answer_text = row[1].strip()
-                        options_texts = [s.strip() for s in row[2:6]]
-
-                        if not question_text or not correct_answer_text or any(not opt for opt in options_texts):
+                        if problem == 'not_in_options':
                             logger.warning(
-                                f"Seed file '{filename}', line {line_num}: Missing question, correct answer, or one of 4 options. Skipping row."
+                                f"Seed file '{filename}', line {line_num}: Correct answer text '{row[1].strip()}' "
+                                f"not found in options {[s.strip() for s in row[2:6]]}. Skipping row."
                             )
                             continue
-                        
-                        try:
-                            correct_option_idx = options_texts.index(correct_answer_text)
-                        except ValueError:
+                        if problem is not None:
                             logger.warning(
-                                f"Seed file '{filename}', line {line_num}: Correct answer text '{correct_answer_text}' "
-                                f"not found in options {options_texts}. Skipping row."
+                                f"Seed file '{filename}', line {line_num}: Missing question, correct answer, or one of 4 options. Skipping row."
                             )
                             continue
-                        
-                        questions_data.append({
-                             'question_text': question_text,
-                             'options': options_texts,
-                             'correct_option_index': correct_option_idx
-                        })
+                        questions_data.append(question)
 
                 if not questions_data:
                      logger.warning(f"No valid questions found in '{filename}' for test '{test_id}'. Skipping test seed.")
                      continue
 
-                test_doc = {
-                    'test_id': test_id,
-                    'title': f"Тест {test_id}", # Or extract from filename/metadata if available
-                    'questions': questions_data,
-                    'total_questions': len(questions_data),
-                    'uploaded_by_user_id': 0, # 0 indicates seeded by system
-                    'upload_timestamp': datetime.datetime.now(datetime.timezone.utc),
-                }
-                insert_result = await tests_collection.insert_one(test_doc)
-                if insert_result.inserted_id:
+                update_result = await store_test_bank(
+                    test_id,
+                    questions_data,
+                    {
+                        'title': f"Тест {test_id}", # Or extract from filename/metadata if available
+                        'uploaded_by_user_id': 0, # 0 indicates seeded by system
+                    }
+                )
+                if update_result.upserted_id or update_result.modified_count:
                     logger.info(f"Successfully seeded test '{test_id}' with {len(questions_data)} questions from '{filename}'.")
                     seeded_count += 1
                 else:
@@ -0,0 +1,248 @@
+# utils/send_scheduler.py
+
+import asyncio
+import contextvars
+import datetime
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from logging_config import logger
+
+# Priorities, lower is served first
+INTERACTIVE = 0 # Answer edits and callback answers of running tests
+NORMAL = 1      # Regular replies
+BULK = 2        # Material fan-out, report chunks, file exports
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', NORMAL: 'normal', BULK: 'bulk'}
+
+_ENDPOINT_PRIORITIES = {
+    'answerCallbackQuery': INTERACTIVE,
+    'editMessageText': INTERACTIVE,
+    'editMessageReplyMarkup': INTERACTIVE,
+    'sendDocument': BULK,
+    'sendPhoto': BULK,
+    'sendVideo': BULK,
+    'sendAudio': BULK,
+    'sendMediaGroup': BULK,
+}
+
+# Set by handlers around fan-out loops; applies to every Bot API call made
+# in that task (see send_priority)
+_priority_override: contextvars.ContextVar = contextvars.ContextVar('send_priority', default=None)
+
+# Per-chat buckets idle (full) for this long are dropped
+_CHAT_BUCKET_IDLE_SECONDS = 60
+
+
+@contextmanager
+def send_priority(priority: int):
+    """Sends made inside the block use `priority`, e.g. `with send_priority(BULK):`."""
+    token = _priority_override.set(priority)
+    try:
+        yield
+    finally:
+        _priority_override.reset(token)
+
+
+def _retry_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class PrioritySendScheduler(BaseRateLimiter):
+    """
+    Rate limiter for every outgoing Bot API request (getUpdates excluded).
+
+    * Global token bucket of `global_rate` requests/second. When tokens run
+      out, waiting requests are granted strictly by priority, then FIFO.
+    * Per-chat token bucket: `per_chat_rate`/second with `per_chat_burst`
+      for private chats, `group_rate_per_minute` for groups and channels.
+      Requests without a chat (callback answers) skip it.
+    * RetryAfter pauses all sending for the requested time, then the
+      request is retried (up to `max_retries` times) at its priority.
+    """
+
+    def __init__(self, global_rate: float, per_chat_rate: float, per_chat_burst: int,
+                 group_rate_per_minute: float, max_retries: int):
+        self._global_rate = global_rate
+        self._global_tokens = global_rate
+        self._global_updated = time.monotonic()
+        self._per_chat_rate = per_chat_rate
+        self._per_chat_burst = per_chat_burst
+        self._group_rate = group_rate_per_minute / 60
+        self._max_retries = max_retries
+
+        # chat_id -> [tokens, monotonic time of last update]
+        self._chat_buckets: dict = {}
+        # (priority, sequence, future) waiting for a global token
+        self._waiters: list = []
+        self._sequence = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+
+        self._stats = {
+            'sent': {name: 0 for name in PRIORITY_NAMES.values()},
+            'retry_after': 0,
+            'gave_up': 0,
+            'max_wait_ms': {name: 0.0 for name in PRIORITY_NAMES.values()},
+        }
+        self._waiting_for_chat = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            self._pump_task = None
+        for _, _, future in self._waiters:
+            if not future.done():
+                future.cancel()
+        self._waiters.clear()
+
+    # --- Global bucket with priority queue ---
+
+    def _refill_global(self, now: float) -> None:
+        self._global_tokens = min(
+            self._global_rate,
+            self._global_tokens + (now - self._global_updated) * self._global_rate
+        )
+        self._global_updated = now
+
+    async def _acquire_global(self, priority: int) -> None:
+        now = time.monotonic()
+        self._refill_global(now)
+        if not self._waiters and now >= self._paused_until and self._global_tokens >= 1:
+            self._global_tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self) -> None:
+        """Hands out global tokens to waiters, highest priority first."""
+        while self._waiters:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill_global(now)
+            if self._global_tokens < 1:
+                await asyncio.sleep((1 - self._global_tokens) / self._global_rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done(): # Caller was cancelled
+                continue
+            self._global_tokens -= 1
+            future.set_result(None)
+
+    # --- Per-chat buckets ---
+
+    async def _acquire_chat(self, chat_id) -> None:
+        if isinstance(chat_id, str) or chat_id < 0:
+            rate, burst = self._group_rate, 1 # Groups, channels (@username or negative id)
+        else:
+            rate, burst = self._per_chat_rate, self._per_chat_burst
+
+        now = time.monotonic()
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = [float(burst), now]
+            if len(self._chat_buckets) > 10000:
+                self._drop_idle_chat_buckets(now)
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        # Reserve a token now (may go negative), so later requests queue behind
+        bucket[0], bucket[1] = tokens - 1, now
+        if tokens < 1:
+            self._waiting_for_chat += 1
+            try:
+                await asyncio.sleep((1 - tokens) / rate)
+            finally:
+                self._waiting_for_chat -= 1
+
+    def _drop_idle_chat_buckets(self, now: float) -> None:
+        for chat_id in [
+            chat_id for chat_id, (_, updated) in self._chat_buckets.items()
+            if now - updated > _CHAT_BUCKET_IDLE_SECONDS
+        ]:
+            del self._chat_buckets[chat_id]
+
+    # --- BaseRateLimiter ---
+
+    async def process_request(self, callback, args: Any, kwargs: dict, endpoint: str,
+                              data: dict, rate_limit_args: Optional[int]):
+        priority = rate_limit_args
+        if priority is None:
+            priority = _priority_override.get()
+        if priority is None:
+            priority = _ENDPOINT_PRIORITIES.get(endpoint, NORMAL)
+        name = PRIORITY_NAMES.get(priority, 'normal')
+        chat_id = data.get('chat_id')
+
+        for attempt in range(self._max_retries + 1):
+            started = time.monotonic()
+            if chat_id is not None:
+                await self._acquire_chat(chat_id)
+            await self._acquire_global(priority)
+            waited_ms = (time.monotonic() - started) * 1000
+            if waited_ms > self._stats['max_wait_ms'][name]:
+                self._stats['max_wait_ms'][name] = waited_ms
+
+            try:
+                result = await callback(*args, **kwargs)
+                self._stats['sent'][name] += 1
+                return result
+            except RetryAfter as e:
+                self._stats['retry_after'] += 1
+                pause = _retry_seconds(e)
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                if attempt >= self._max_retries:
+                    self._stats['gave_up'] += 1
+                    logger.error(f'{endpoint} ({name}) still flood-limited after {attempt} retries, giving up.')
+                    raise
+                logger.warning(
+                    f'Flood control on {endpoint} ({name}, chat {chat_id}): '
+                    f'pausing sends for {pause:.1f}s (retry {attempt + 1}/{self._max_retries}).'
+                )
+
+    def stats(self) -> dict:
+        """Queue depths per priority and send counters."""
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depth[PRIORITY_NAMES.get(priority, 'normal')] += 1
+        return {
+            'queued': depth,
+            'waiting_for_chat': self._waiting_for_chat,
+            'paused_for_s': max(0.0, self._paused_until - time.monotonic()),
+            'sent': dict(self._stats['sent']),
+            'max_wait_ms': dict(self._stats['max_wait_ms']),
+            'retry_after': self._stats['retry_after'],
+            'gave_up': self._stats['gave_up'],
+        }
+
+    def format_stats(self) -> str:
+        """stats() as a /db_stats section."""
+        stats = self.stats()
+        return (
+            "📤 Очередь отправки:\n"
+            f"В очереди (интерактив/обычные/массовые): {stats['queued']['interactive']} / "
+            f"{stats['queued']['normal']} / {stats['queued']['bulk']}\n"
+            f"Ждут лимита чата: {stats['waiting_for_chat']}\n"
+            f"Отправлено: {stats['sent']['interactive']} / {stats['sent']['normal']} / "
+            f"{stats['sent']['bulk']}\n"
+            f"Макс. ожидание: {stats['max_wait_ms']['interactive']:.0f} / "
+            f"{stats['max_wait_ms']['normal']:.0f} / {stats['max_wait_ms']['bulk']:.0f} мс\n"
+            f"RetryAfter: {stats['retry_after']} (не отправлено: {stats['gave_up']}), "
+            f"пауза: {stats['paused_for_s']:.0f} с"
+        )
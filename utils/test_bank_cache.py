@@ -0,0 +1,168 @@
+# utils/test_bank_cache.py
+
+import asyncio
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+
+from db import get_collection
+from logging_config import logger
+from settings import TEST_BANK_CACHE_SIZE, TEST_BANK_CACHE_REVALIDATE_SECONDS
+
+
+class TestBank(NamedTuple):
+    """Parsed, read-only question bank shared by all readers."""
+    test_id: str
+    title: str
+    version: int
+    upload_timestamp: object
+    total_questions: int
+    # 'embedded' (questions array in the tests document) or 'collection'
+    # (one document per question, see utils.question_store)
+    storage: str
+    # Tuple of read-only question mappings with tuple options.
+    # Empty for 'collection' banks; use utils.question_store to read those.
+    questions: tuple
+
+
+# test_id -> (TestBank, monotonic time of last validation), LRU order
+_cache: OrderedDict = OrderedDict()
+# test_id -> in-flight load, so concurrent misses share one query
+_loading: dict = {}
+# test_id -> invalidation count; a load started before an invalidation
+# must not put its (possibly stale) result into the cache
+_generations: dict = {}
+_stats = {'hits': 0, 'misses': 0, 'revalidations': 0, 'invalidations': 0}
+
+
+def _version_of(doc: dict) -> tuple:
+    return (doc.get('version', 0), doc.get('upload_timestamp'))
+
+
+def freeze_question(question: dict) -> MappingProxyType:
+    return MappingProxyType({
+        key: tuple(value) if isinstance(value, list) else value
+        for key, value in question.items()
+    })
+
+
+def _store(bank: TestBank) -> None:
+    _cache[bank.test_id] = (bank, time.monotonic())
+    _cache.move_to_end(bank.test_id)
+    while len(_cache) > TEST_BANK_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+async def _load(test_id: str) -> Optional[TestBank]:
+    generation = _generations.get(test_id, 0)
+    tests_collection = await get_collection('tests')
+    doc = await tests_collection.find_one(
+        {'test_id': test_id},
+        {
+            '_id': 0, 'title': 1, 'questions': 1, 'version': 1,
+            'upload_timestamp': 1, 'total_questions': 1, 'storage': 1,
+        }
+    )
+    if not doc:
+        return None
+
+    storage = doc.get('storage', 'embedded')
+    questions = ()
+    if storage == 'embedded':
+        raw_questions = doc.get('questions')
+        if not isinstance(raw_questions, list):
+            logger.warning(f"Test '{test_id}' has no questions or invalid format.")
+            raw_questions = []
+        questions = tuple(freeze_question(q) for q in raw_questions if isinstance(q, dict))
+
+    bank = TestBank(
+        test_id=test_id,
+        title=doc.get('title', f"Тест {test_id}"),
+        version=doc.get('version', 0),
+        upload_timestamp=doc.get('upload_timestamp'),
+        total_questions=len(questions) if storage == 'embedded' else doc.get('total_questions', 0),
+        storage=storage,
+        questions=questions,
+    )
+    if TEST_BANK_CACHE_SIZE > 0 and _generations.get(test_id, 0) == generation:
+        _store(bank)
+    logger.debug(f"Loaded test bank '{test_id}' ({bank.total_questions} questions, {storage}) into cache.")
+    return bank
+
+
+async def _still_current(test_id: str, bank: TestBank) -> Optional[bool]:
+    """Checks the cached version against the DB. None if the test is gone."""
+    tests_collection = await get_collection('tests')
+    doc = await tests_collection.find_one(
+        {'test_id': test_id},
+        {'_id': 0, 'version': 1, 'upload_timestamp': 1}
+    )
+    if not doc:
+        return None
+    return _version_of(doc) == (bank.version, bank.upload_timestamp)
+
+
+async def get_test_bank(test_id: str) -> Optional[TestBank]:
+    """
+    Returns the question bank of a test, or None if the test does not exist.
+    Cached banks are re-validated against the stored version at most every
+    TEST_BANK_CACHE_REVALIDATE_SECONDS; uploads, deletions and seeding in
+    this process invalidate them immediately.
+    """
+    entry = _cache.get(test_id)
+    if entry is not None:
+        bank, checked_at = entry
+        if time.monotonic() - checked_at < TEST_BANK_CACHE_REVALIDATE_SECONDS:
+            _cache.move_to_end(test_id)
+            _stats['hits'] += 1
+            return bank
+
+        _stats['revalidations'] += 1
+        current = await _still_current(test_id, bank)
+        if current is None:
+            invalidate_test_bank(test_id)
+            return None
+        if current:
+            _cache[test_id] = (bank, time.monotonic())
+            _cache.move_to_end(test_id)
+            _stats['hits'] += 1
+            return bank
+        _cache.pop(test_id, None)
+
+    _stats['misses'] += 1
+    task = _loading.get(test_id)
+    if task is None:
+        task = asyncio.ensure_future(_load(test_id))
+        _loading[test_id] = task
+        task.add_done_callback(
+            lambda done: _loading.pop(test_id, None) if _loading.get(test_id) is done else None
+        )
+    return await asyncio.shield(task)
+
+
+def invalidate_test_bank(test_id: str) -> None:
+    """Drops a cached bank. Call after the test was uploaded, seeded or deleted."""
+    _generations[test_id] = _generations.get(test_id, 0) + 1
+    _loading.pop(test_id, None)
+    if _cache.pop(test_id, None) is not None:
+        _stats['invalidations'] += 1
+        logger.debug(f"Test bank cache entry for '{test_id}' invalidated.")
+
+
+def get_test_bank_cache_stats() -> dict:
+    """Returns test bank cache counters and current size."""
+    stats = dict(_stats)
+    stats['size'] = len(_cache)
+    return stats
+
+
+def format_test_bank_cache_stats() -> str:
+    """get_test_bank_cache_stats() as a /db_stats section."""
+    stats = get_test_bank_cache_stats()
+    return (
+        "📚 Кэш банков вопросов:\n"
+        f"Записей: {stats['size']}\n"
+        f"Попаданий / промахов: {stats['hits']} / {stats['misses']}\n"
+        f"Проверок версии: {stats['revalidations']}, сброшено: {stats['invalidations']}"
+    )
@@ -0,0 +1,93 @@
+# utils/update_processor.py
+
+import asyncio
+from typing import Any, Awaitable
+
+from telegram.ext import BaseUpdateProcessor
+
+# Updates admitted by PTB per running slot. Admitted updates wait for their
+# user's turn and a free slot here, instead of holding a slot while a
+# previous update of the same user is still running.
+ADMISSION_FACTOR = 32
+
+
+def _ordering_key(update: object):
+    """Updates with the same key run strictly one after another."""
+    # Internal updates (e.g. utils.deadlines.AttemptDeadline) carry user_id
+    user_id = getattr(update, 'user_id', None)
+    if user_id is not None:
+        return ('user', user_id)
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return ('user', user.id)
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return ('chat', chat.id)
+    return None # Nothing to keep consistent, e.g. poll updates
+
+
+class UserSerializingUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates of different users concurrently, at most
+    `max_running` at a time, while updates of one user (or of one chat, for
+    updates without a user) run in arrival order. ConversationHandler state
+    and user_data therefore never see two updates of the same user at once,
+    and one slow handler (/txt, /materials) no longer delays everyone else.
+    """
+
+    def __init__(self, max_running: int):
+        super().__init__(max_running * ADMISSION_FACTOR)
+        self._max_running = max_running
+        self._slots = asyncio.BoundedSemaphore(max_running)
+        # key -> [asyncio.Lock, number of updates holding or waiting for it]
+        self._locks: dict = {}
+
+    @property
+    def max_running(self) -> int:
+        return self._max_running
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = _ordering_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock wakes waiters in FIFO order, and PTB starts the
+            # processing tasks in arrival order, so per-key order is kept
+            async with entry[0]:
+                async with self._slots:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        """Keys with running or queued updates, and updates queued per key."""
+        return {
+            'max_running': self._max_running,
+            'busy_keys': len(self._locks),
+            'queued_updates': sum(count - 1 for _, count in self._locks.values() if count > 1),
+        }
+
+    def format_stats(self) -> str:
+        """stats() as a /db_stats section."""
+        stats = self.stats()
+        return (
+            "⚙️ Обработка обновлений:\n"
+            f"Параллельно: до {stats['max_running']}\n"
+            f"Пользователей в обработке: {stats['busy_keys']}\n"
+            f"В очереди: {stats['queued_updates']}"
+        )
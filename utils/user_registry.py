@@ -0,0 +1,129 @@
+# utils/user_registry.py
+
+import asyncio
+import datetime
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from db import get_collection
+from logging_config import logger
+from settings import (
+    USER_REGISTRY_FLUSH_MS, USER_LAST_SEEN_RESOLUTION_SECONDS,
+    USER_REGISTRY_MAX_KNOWN,
+)
+
+# user_id -> {'username', 'last_seen'} waiting for the next bulk upsert.
+# A user touched several times between flushes keeps only the latest values.
+_pending: dict = {}
+# user_id -> (username, monotonic time of last queued touch), LRU-bounded.
+# Lets touch_user() skip users whose record is already fresh.
+_known: OrderedDict = OrderedDict()
+_flush_task: Optional[asyncio.Task] = None
+# Created on first use so it binds to the running event loop
+_flush_lock: Optional[asyncio.Lock] = None
+
+
+def touch_user(user_id: int, username) -> None:
+    """
+    Records that a user was seen. Never touches the database directly:
+    new users, username changes and last_seen refreshes are queued and
+    written by the next flush as a single upsert per user.
+    """
+    now = time.monotonic()
+    known = _known.get(user_id)
+    if (known and known[0] == username
+            and now - known[1] < USER_LAST_SEEN_RESOLUTION_SECONDS):
+        _known.move_to_end(user_id)
+        return
+
+    _pending[user_id] = {
+        'username': username,
+        'last_seen': datetime.datetime.now(datetime.timezone.utc),
+    }
+    _known[user_id] = (username, now)
+    _known.move_to_end(user_id)
+    while len(_known) > USER_REGISTRY_MAX_KNOWN:
+        _known.popitem(last=False)
+
+
+def is_known_user(user_id: int) -> bool:
+    """True if the user was seen recently by this process."""
+    return user_id in _known
+
+
+async def flush_users() -> int:
+    """Writes all pending user touches with one unordered bulk_write."""
+    global _pending, _flush_lock
+    if _flush_lock is None:
+        _flush_lock = asyncio.Lock()
+    async with _flush_lock:
+        if not _pending:
+            return 0
+        batch, _pending = _pending, {}
+
+        operations = [
+            UpdateOne(
+                {'user_id': user_id},
+                {
+                    '$set': {
+                        'username': data['username'],
+                        'last_seen': data['last_seen'],
+                    },
+                    '$setOnInsert': {
+                        'role': 'student',
+                        'date_added': data['last_seen'],
+                    },
+                },
+                upsert=True,
+            )
+            for user_id, data in batch.items()
+        ]
+        try:
+            users_collection = await get_collection('users')
+            result = await users_collection.bulk_write(operations, ordered=False)
+            if result.upserted_count:
+                logger.info(f'User registry added {result.upserted_count} new user(s) as students.')
+            logger.debug(f'User registry flushed {len(operations)} user update(s).')
+            return len(operations)
+        except Exception as e:
+            # Upserts are idempotent, so the whole batch can be retried.
+            # Newer touches queued meanwhile take precedence.
+            logger.error(f'User registry flush of {len(operations)} update(s) failed: {e}')
+            for user_id, data in batch.items():
+                _pending.setdefault(user_id, data)
+            return 0
+
+
+async def _flush_loop() -> None:
+    interval = USER_REGISTRY_FLUSH_MS / 1000
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_users()
+        except Exception as e:
+            logger.exception(f'Unexpected error in user registry flush loop: {e}')
+
+
+def start_user_registry() -> None:
+    """Starts the periodic background flush."""
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_loop())
+        logger.info(f'User registry started (flush every {USER_REGISTRY_FLUSH_MS} ms).')
+
+
+async def stop_user_registry() -> None:
+    """Stops the background flush and writes whatever is still pending."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    flushed = await flush_users()
+    logger.info(f'User registry stopped ({flushed} pending update(s) flushed).')
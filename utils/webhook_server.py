@@ -0,0 +1,178 @@
+# utils/webhook_server.py
+
+import asyncio
+import hmac
+import json
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from logging_config import logger
+from settings import (
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_HEALTH_PATH,
+    WEBHOOK_URL, WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_CONNECTIONS,
+)
+
+# Minimal HTTP/1.1 listener on asyncio streams, so webhook mode needs no
+# extra web framework. Routes:
+#   POST WEBHOOK_PATH         Telegram update JSON -> app.update_queue
+#   GET  WEBHOOK_HEALTH_PATH  liveness and update queue depth
+# Updates are acknowledged as soon as they are queued; handlers run in the
+# Application as with polling.
+MAX_BODY_BYTES = 1024 * 1024
+IDLE_TIMEOUT_SECONDS = 75
+
+_server: Optional[asyncio.AbstractServer] = None
+_app: Optional[Application] = None
+# Connection handler tasks, closed on stop (keep-alive connections idle otherwise)
+_connections: set = set()
+_stats = {'received': 0, 'rejected': 0}
+
+_REASONS = {
+    200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large',
+}
+
+
+def _response(status: int, payload: dict, keep_alive: bool) -> bytes:
+    body = json.dumps(payload).encode()
+    head = (
+        f'HTTP/1.1 {status} {_REASONS[status]}\r\n'
+        f'Content-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode() + body
+
+
+async def _route(method: str, path: str, headers: dict, body: bytes) -> tuple:
+    """Returns (status, payload) for one request."""
+    path = path.split('?', 1)[0]
+
+    if path == WEBHOOK_HEALTH_PATH:
+        if method != 'GET':
+            return 405, {'error': 'method not allowed'}
+        return 200, {
+            'status': 'ok',
+            'update_queue': _app.update_queue.qsize(),
+            'received': _stats['received'],
+            'rejected': _stats['rejected'],
+        }
+
+    if path != WEBHOOK_PATH:
+        return 404, {'error': 'not found'}
+    if method != 'POST':
+        return 405, {'error': 'method not allowed'}
+
+    secret = headers.get('x-telegram-bot-api-secret-token', '')
+    if not hmac.compare_digest(secret.encode(), WEBHOOK_SECRET_TOKEN.encode()):
+        _stats['rejected'] += 1
+        logger.warning('Webhook request rejected: missing or invalid secret token.')
+        return 403, {'error': 'forbidden'}
+
+    try:
+        update = Update.de_json(json.loads(body), _app.bot)
+    except Exception as e:
+        _stats['rejected'] += 1
+        logger.warning(f'Webhook request rejected: invalid update JSON ({e}).')
+        return 400, {'error': 'invalid update'}
+
+    await _app.update_queue.put(update)
+    _stats['received'] += 1
+    return 200, {'ok': True}
+
+
+async def _handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    task = asyncio.current_task()
+    _connections.add(task)
+    try:
+        while True:
+            request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT_SECONDS)
+            if not request_line:
+                break
+            try:
+                method, path, version = request_line.decode('latin-1').split()
+            except ValueError:
+                writer.write(_response(400, {'error': 'bad request line'}, False))
+                break
+
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT_SECONDS)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            keep_alive = (
+                version == 'HTTP/1.1'
+                and headers.get('connection', '').lower() != 'close'
+            )
+            try:
+                length = int(headers.get('content-length', '0'))
+            except ValueError:
+                writer.write(_response(400, {'error': 'bad content-length'}, False))
+                break
+            if length > MAX_BODY_BYTES:
+                writer.write(_response(413, {'error': 'payload too large'}, False))
+                break
+            body = await reader.readexactly(length) if length else b''
+
+            status, payload = await _route(method.upper(), path, headers, body)
+            writer.write(_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    except Exception as e:
+        logger.exception(f'Unexpected error in webhook connection: {e}')
+    finally:
+        _connections.discard(task)
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+
+async def start_webhook(app: Application) -> None:
+    """
+    Starts the listener and, if WEBHOOK_URL is set, registers it with
+    Telegram. The Application must already be initialized and started.
+    """
+    global _server, _app
+    _app = app
+    _server = await asyncio.start_server(_handle_connection, WEBHOOK_LISTEN, WEBHOOK_PORT)
+    logger.info(
+        f'Webhook listener on {WEBHOOK_LISTEN}:{WEBHOOK_PORT} '
+        f'(updates: {WEBHOOK_PATH}, health: {WEBHOOK_HEALTH_PATH}).'
+    )
+
+    if not WEBHOOK_URL:
+        logger.warning('WEBHOOK_URL is empty: listener runs without setWebhook (local mode).')
+        return
+    await app.bot.set_webhook(
+        url=f'{WEBHOOK_URL}{WEBHOOK_PATH}',
+        secret_token=WEBHOOK_SECRET_TOKEN,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=Update.ALL_TYPES,
+    )
+    logger.info(f'Webhook registered: {WEBHOOK_URL}{WEBHOOK_PATH} (max_connections={WEBHOOK_MAX_CONNECTIONS}).')
+
+
+async def stop_webhook() -> None:
+    """
+    Stops accepting connections. The webhook stays registered, so Telegram
+    keeps queueing updates until the bot is back.
+    """
+    global _server
+    if _server is not None:
+        _server.close()
+        for task in list(_connections):
+            task.cancel()
+        await asyncio.gather(*_connections, return_exceptions=True)
+        await _server.wait_closed()
+        _server = None
+        logger.info('Webhook listener stopped.')